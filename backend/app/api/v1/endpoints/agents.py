@@ -2,14 +2,24 @@
 Agent管理API端点
 """
 
+import json
 import logging
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from datetime import datetime
 
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Request
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 
 from app.services.vector_db import vector_db_service
 from app.services.agent_coordinator import agent_coordinator
+from app.services.llm_service import llm_service
+from app.services.response_cache import response_cache
+from app.services.prompt_context import prompt_context_builder
+from app.services.model_cascade import model_cascade
+from app.services.conversation_memory import conversation_memory
+from app.services.knowledge_ingest import knowledge_ingestor, spool_body, iter_file, iter_lines, parse_ndjson, parse_csv
+from app.services.document_ingest import document_ingestor, resolve_upload
 from app.database.database import get_db
 
 logger = logging.getLogger(__name__)
@@ -30,6 +40,22 @@ async def get_agent_status():
             "data": {
                 "agents": agent_info,
                 "vector_db": db_info,
+                "embedding_cache": vector_db_service.get_embedding_cache_stats(),
+                "embedding_batcher": vector_db_service.get_embedding_batcher_stats(),
+                "vector_db_pool": vector_db_service.get_pool_stats(),
+                "vector_store": vector_db_service.get_store_stats(),
+                "document_matrix": vector_db_service.document_matrix.get_stats(),
+                "lexical_index": vector_db_service.lexical_index.get_stats(),
+                "retrieval": vector_db_service.get_retrieval_stats(),
+                "search_cache": vector_db_service.search_cache.get_stats(),
+                "knowledge_ingest": knowledge_ingestor.get_stats(),
+                "document_ingest": document_ingestor.get_stats(),
+                "llm_http": llm_service.get_http_stats(),
+                "llm_routing": llm_service.get_routing_stats(),
+                "response_cache": response_cache.get_stats(),
+                "prompt_context": prompt_context_builder.get_stats(),
+                "model_cascade": model_cascade.get_stats(),
+                "conversation_memory": conversation_memory.get_stats(),
                 "timestamp": datetime.now().isoformat()
             }
         }
@@ -60,6 +86,66 @@ async def add_knowledge(
         logger.error(f"❌ 添加知识失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/knowledge/bulk")
+async def bulk_add_knowledge(
+    request: Request,
+    format: Optional[str] = None
+):
+    """批量导入知识（请求体为 NDJSON 或带表头的 CSV）
+
+    请求体先暂存到临时文件，再逐行解析导入。
+    每行/每条记录包含 content、category、keywords（CSV中以分号分隔）与可选的 id。
+    响应为 NDJSON 流：每批完成后返回一条进度（含吞吐量），最后一条为汇总。
+    """
+    fmt = (format or ("csv" if "csv" in request.headers.get("content-type", "") else "ndjson")).lower()
+    if fmt not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="仅支持 ndjson 或 csv 格式")
+    if not vector_db_service.collection or not vector_db_service.embedding_function:
+        raise HTTPException(status_code=503, detail="向量集合或嵌入函数未初始化")
+    
+    parser = parse_csv if fmt == "csv" else parse_ndjson
+    # 响应开始后 Starlette 监听断开时会消费请求体消息，必须在此之前读完请求体
+    body = await spool_body(request.stream())
+    
+    async def progress():
+        try:
+            async for event in knowledge_ingestor.ingest(parser(iter_lines(iter_file(body)))):
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+        except Exception as e:
+            logger.error(f"❌ 知识批量导入失败: {e}")
+            yield json.dumps({"type": "error", "success": False, "error": str(e)}, ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(progress(), media_type="application/x-ndjson", background=BackgroundTask(body.close))
+
+@router.post("/knowledge/documents")
+async def ingest_document(
+    filename: str,
+    category: str = "政策文件"
+):
+    """导入上传目录（UPLOAD_DIR）中的 PDF/DOCX 文档
+
+    文档流式抽取文本并按章节切分为带重叠的Token分块，分批写入知识库；
+    响应为 NDJSON 进度流，格式与批量导入一致。
+    """
+    try:
+        resolve_upload(filename)
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not vector_db_service.collection or not vector_db_service.embedding_function:
+        raise HTTPException(status_code=503, detail="向量集合或嵌入函数未初始化")
+    
+    async def progress():
+        try:
+            async for event in document_ingestor.ingest(filename, category):
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+        except Exception as e:
+            logger.error(f"❌ 文档导入失败: {filename}: {e}")
+            yield json.dumps({"type": "error", "success": False, "error": str(e)}, ensure_ascii=False) + "\n"
+    
+    return StreamingResponse(progress(), media_type="application/x-ndjson")
+
 @router.get("/knowledge/search")
 async def search_knowledge(
     query: str,
@@ -2,14 +2,18 @@
 聊天API端点
 """
 
+import asyncio
+import json
 import logging
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Awaitable
 from datetime import datetime
 
-from fastapi import APIRouter, HTTPException, Depends, WebSocket, WebSocketDisconnect
+from fastapi import APIRouter, HTTPException, Depends, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel
 
+from app.core.config import settings
+from app.core.deadline import Deadline
 from app.services.agent_coordinator import agent_coordinator
 from app.database.database import get_db
 
@@ -31,9 +35,39 @@ class ChatResponse(BaseModel):
     conversation_id: str
     timestamp: datetime
 
+class ClientDisconnected(Exception):
+    """客户端在处理完成前断开连接"""
+
+def dump_frame(payload: Dict[str, Any]) -> str:
+    """序列化发给客户端的消息帧（流式与非流式回复统一保留中文原文）"""
+    return json.dumps(payload, ensure_ascii=False)
+
+async def _wait_disconnected(request: Request):
+    """等待客户端断开（请求体已由端点读取完毕，之后 receive 只会收到断开消息）"""
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+async def run_until_disconnected(request: Request, awaitable: Awaitable[Any]) -> Any:
+    """执行 awaitable，客户端断开时取消它（连同在途的检索与LLM调用）"""
+    task = asyncio.ensure_future(awaitable)
+    watcher = asyncio.ensure_future(_wait_disconnected(request))
+    try:
+        await asyncio.wait({task, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        if task.done():
+            return task.result()
+        raise ClientDisconnected()
+    finally:
+        watcher.cancel()
+        if not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
 @router.post("/message", response_model=ChatResponse)
 async def send_message(
     message: ChatMessage,
+    request: Request,
     db = Depends(get_db),
     credentials: HTTPAuthorizationCredentials = Depends(security)
 ):
@@ -46,7 +80,7 @@ async def send_message(
         enriched_context = message.context or {}
         try:
             if credentials and credentials.credentials:
-                import base64, json
+                import base64
                 payload = base64.b64decode(credentials.credentials).decode()
                 token_data = json.loads(payload)
                 username = token_data.get("sub")
@@ -60,12 +94,16 @@ async def send_message(
             # 令牌解析失败不影响聊天功能
             pass
 
-        # 处理消息
-        result = await agent_coordinator.process_message(
-            message=message.message,
-            conversation_id=conversation_id,
-            context=enriched_context,
-            db=db
+        # 处理消息（整体时间预算沿检索与LLM调用传递，客户端断开时取消）
+        result = await run_until_disconnected(
+            request,
+            agent_coordinator.process_message(
+                message=message.message,
+                conversation_id=conversation_id,
+                context=enriched_context,
+                db=db,
+                deadline=Deadline(settings.REQUEST_DEADLINE_SECONDS)
+            )
         )
         
         # 构建响应
@@ -81,6 +119,10 @@ async def send_message(
         
         return response
         
+    except ClientDisconnected:
+        logger.info(f"🔌 客户端已断开，取消处理: {conversation_id}")
+        # 499: 客户端关闭请求（响应不会被读取）
+        return Response(status_code=499)
     except Exception as e:
         logger.error(f"❌ 聊天消息处理失败: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -133,51 +175,107 @@ class ConnectionManager:
 
 manager = ConnectionManager()
 
+async def _receive_loop(websocket: WebSocket, inbox: asyncio.Queue):
+    """持续读取客户端消息；连接断开时放入 None"""
+    try:
+        while True:
+            inbox.put_nowait(await websocket.receive_text())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        inbox.put_nowait(None)
+
+async def _handle_ws_message(data: str, client_id: str):
+    """处理单条WebSocket消息"""
+    deadline = Deadline(settings.REQUEST_DEADLINE_SECONDS)
+    
+    # 解析消息
+    try:
+        message_data = json.loads(data)
+        user_message = message_data.get("message", "")
+        
+        # 默认流式回复；客户端可通过 "stream": false 使用单帧 chat_response
+        if message_data.get("stream", True):
+            async for event in agent_coordinator.process_message_stream(
+                message=user_message,
+                conversation_id=client_id,
+                deadline=deadline
+            ):
+                if event.get("type") == "delta":
+                    frame = {
+                        "type": "chat_delta",
+                        "data": {"delta": event.get("content", "")}
+                    }
+                else:
+                    result = event.get("result", {})
+                    frame = {
+                        "type": "chat_done",
+                        "data": {
+                            "response": result.get("response", "抱歉，我现在无法处理您的请求。"),
+                            "agent_type": result.get("agent_type", "general"),
+                            "confidence": result.get("confidence", 0.0),
+                            "timestamp": datetime.now().isoformat()
+                        }
+                    }
+                await manager.send_personal_message(dump_frame(frame), client_id)
+            return
+        
+        # 处理消息
+        result = await agent_coordinator.process_message(
+            message=user_message,
+            conversation_id=client_id,
+            deadline=deadline
+        )
+        
+        # 构建回复
+        response = {
+            "type": "chat_response",
+            "data": {
+                "response": result.get("response", "抱歉，我现在无法处理您的请求。"),
+                "agent_type": result.get("agent_type", "general"),
+                "confidence": result.get("confidence", 0.0),
+                "timestamp": datetime.now().isoformat()
+            }
+        }
+        
+        # 发送回复
+        await manager.send_personal_message(dump_frame(response), client_id)
+        
+    except json.JSONDecodeError:
+        error_response = {
+            "type": "error",
+            "data": {"message": "无效的消息格式"}
+        }
+        await manager.send_personal_message(dump_frame(error_response), client_id)
+
 @router.websocket("/ws/{client_id}")
 async def websocket_endpoint(websocket: WebSocket, client_id: str):
-    """WebSocket端点"""
+    """WebSocket端点
+
+    接收与处理分离：处理消息期间仍在监听连接状态，客户端断开时立即取消
+    正在进行的检索与LLM调用。
+    """
     await manager.connect(websocket, client_id)
+    inbox: asyncio.Queue = asyncio.Queue()
+    receiver = asyncio.create_task(_receive_loop(websocket, inbox))
     try:
         while True:
-            # 接收客户端消息
-            data = await websocket.receive_text()
+            data = await inbox.get()
+            if data is None:
+                break
             
-            # 解析消息
-            try:
-                import json
-                message_data = json.loads(data)
-                user_message = message_data.get("message", "")
-                
-                # 处理消息
-                result = await agent_coordinator.process_message(
-                    message=user_message,
-                    conversation_id=client_id
-                )
-                
-                # 构建回复
-                response = {
-                    "type": "chat_response",
-                    "data": {
-                        "response": result.get("response", "抱歉，我现在无法处理您的请求。"),
-                        "agent_type": result.get("agent_type", "general"),
-                        "confidence": result.get("confidence", 0.0),
-                        "timestamp": datetime.now().isoformat()
-                    }
-                }
-                
-                # 发送回复
-                await manager.send_personal_message(
-                    json.dumps(response), client_id
-                )
-                
-            except json.JSONDecodeError:
-                error_response = {
-                    "type": "error",
-                    "data": {"message": "无效的消息格式"}
-                }
-                await manager.send_personal_message(
-                    json.dumps(error_response), client_id
-                )
-                
+            handler = asyncio.create_task(_handle_ws_message(data, client_id))
+            # 连接断开时 receiver 结束
+            await asyncio.wait({handler, receiver}, return_when=asyncio.FIRST_COMPLETED)
+            if not handler.done():
+                handler.cancel()
+                await asyncio.gather(handler, return_exceptions=True)
+                logger.info(f"🔌 客户端已断开，取消处理中的消息: {client_id}")
+                break
+            if handler.exception() is not None and not isinstance(handler.exception(), WebSocketDisconnect):
+                raise handler.exception()
     except WebSocketDisconnect:
-        manager.disconnect(client_id)
\ No newline at end of file
+        pass
+    finally:
+        receiver.cancel()
+        manager.disconnect(client_id)
@@ -62,9 +62,130 @@ class Settings(BaseSettings):
     MAX_TOKENS: int = 2000
     TEMPERATURE: float = 0.7
     TOP_P: float = 0.9
+    PROMPT_CONTEXT_MAX_TOKENS: Optional[int] = None  # 上下文Token预算，未设置时按 MAX_TOKENS 比例计算
+    PROMPT_CONTEXT_BUDGET_RATIO: float = 0.5  # 上下文预算占 MAX_TOKENS 的比例
+    PROMPT_CONTEXT_KNOWLEDGE_SHARE: float = 0.7  # 预算中分配给知识片段的比例，其余给对话历史
+    PROMPT_CONTEXT_MIN_SNIPPET_TOKENS: int = 40  # 截断知识片段时至少保留的Token数
+    REQUEST_DEADLINE_SECONDS: float = 60.0  # 单个聊天请求的整体时间预算（检索 + LLM），各阶段超时收缩到剩余时间
+    LLM_REQUEST_TIMEOUT: float = 60.0  # 单次LLM调用总超时（秒）
+    LLM_CONNECT_TIMEOUT: float = 10.0  # 建立连接超时（秒）
+    LLM_MAX_RETRIES: int = 2  # SDK内置重试次数
+    LLM_HTTP_POOL_LIMIT: int = 100  # 共享HTTP会话总连接数上限
+    LLM_HTTP_POOL_LIMIT_PER_HOST: int = 20  # 每个主机的keep-alive连接数上限
+    LLM_HTTP_KEEPALIVE_TIMEOUT: float = 30.0  # 空闲连接保活时间（秒）
+    LLM_HTTP_DNS_CACHE_TTL: int = 300  # DNS缓存时间（秒）
+    LLM_HTTP_WARMUP: bool = False  # 启动时预热提供商连接
+    LLM_LATENCY_WINDOW: int = 200  # 每个提供商保留的延迟样本数
+    
+    # LLM对冲请求配置
+    LLM_HEDGING_ENABLED: bool = False
+    LLM_HEDGE_PERCENTILE: float = 0.9  # 主提供商超过该滚动分位延迟时发出对冲
+    LLM_HEDGE_MIN_SAMPLES: int = 20  # 计算分位数所需的最少样本
+    LLM_HEDGE_DEFAULT_DELAY: float = 3.0  # 样本不足时的对冲阈值（秒）
+    LLM_HEDGE_MIN_DELAY: float = 0.5  # 对冲阈值下限（秒）
+    
+    # LLM提供商路由与熔断配置
+    LLM_ROUTER_OUTCOME_WINDOW: int = 50  # 计算滚动错误率的调用窗口
+    LLM_ROUTER_LATENCY_SCALE: float = 10.0  # 延迟惩罚归一化尺度（秒）
+    LLM_ROUTER_PREFERENCE_BONUS: float = 0.2  # 首选提供商（DEFAULT_LLM_PROVIDER）健康度加分
+    LLM_BREAKER_FAILURE_THRESHOLD: int = 5  # 连续失败次数达到后熔断
+    LLM_BREAKER_ERROR_RATE: float = 0.5  # 滚动错误率达到后熔断
+    LLM_BREAKER_MIN_REQUESTS: int = 10  # 按错误率熔断所需的最少样本
+    LLM_BREAKER_OPEN_SECONDS: float = 30.0  # 熔断后进入半开探测前的冷却时间
+    
+    # 相同在途请求合并配置
+    LLM_SINGLEFLIGHT_ENABLED: bool = True
+    LLM_SINGLEFLIGHT_TIMEOUT: float = 90.0  # 每个调用方等待共享结果的上限（秒）
+    
+    # LLM准入控制配置（AIMD自适应并发 + 限流退避）
+    LLM_ADMISSION_ENABLED: bool = True
+    LLM_ADMISSION_INITIAL_LIMIT: int = 8  # 初始并发上限
+    LLM_ADMISSION_MIN_LIMIT: int = 1
+    LLM_ADMISSION_MAX_LIMIT: int = 64
+    LLM_ADMISSION_BACKOFF_RATIO: float = 0.5  # 遇到限流时并发上限的乘性下降系数
+    LLM_ADMISSION_DECREASE_INTERVAL: float = 1.0  # 两次下调之间的最小间隔（秒）
+    LLM_ADMISSION_MAX_QUEUE: int = 200  # 每个提供商的最大排队请求数
+    LLM_ADMISSION_QUEUE_TIMEOUT: float = 15.0  # 排队等待期限（秒）
+    LLM_RATE_LIMIT_MAX_RETRIES: int = 3  # 限流后的最大重试次数
+    LLM_RATE_LIMIT_BASE_BACKOFF: float = 0.5  # 无 Retry-After 时的退避基数（秒）
+    LLM_RATE_LIMIT_MAX_BACKOFF: float = 20.0  # 单次退避上限（秒）
+    
+    # 本地模拟LLM提供商配置（DEFAULT_LLM_PROVIDER=mock 或 local 时启用，用于离线压测）
+    MOCK_LLM_LATENCY_MODE: str = "fixed"  # fixed / lognormal / histogram
+    MOCK_LLM_LATENCY_MS: float = 300.0  # 固定延迟，或对数正态分布的中位数（毫秒）
+    MOCK_LLM_LATENCY_SIGMA: float = 0.5  # 对数正态分布的 sigma
+    MOCK_LLM_LATENCY_HISTOGRAM_FILE: Optional[str] = None  # 录制的延迟直方图（JSON）
+    MOCK_LLM_TOKENS_PER_SECOND: float = 50.0  # 输出速率，<=0 表示不限速
+    MOCK_LLM_FAILURE_RATE: float = 0.0  # 注入失败的概率
+    MOCK_LLM_RATE_LIMIT_RATE: float = 0.0  # 注入限流的概率
+    MOCK_LLM_RETRY_AFTER: Optional[float] = None  # 注入限流时携带的 Retry-After 秒数
+    MOCK_LLM_RESPONSE_MODE: str = "echo"  # echo（回显用户消息）/ canned（固定回复）
+    MOCK_LLM_CANNED_RESPONSE: str = "您好，这是模拟回复。如需办理具体业务，请携带有效身份证件前往就近网点。"
+    MOCK_LLM_SEED: Optional[int] = None  # 随机种子，设置后延迟与故障注入可复现
+    
+    # 模型级联配置
+    CASCADE_ENABLED: bool = True
+    CASCADE_SIMPLE_MAX_CHARS: int = 60  # 超过该长度的消息直接使用强模型
+    CASCADE_MIN_RETRIEVAL_CONFIDENCE: float = 0.5  # 通用/账户/转账问题使用快速模型所需的检索置信度
+    CASCADE_SPECIALIST_MIN_RETRIEVAL_CONFIDENCE: float = 0.7  # 理财/贷款问题使用快速模型所需的检索置信度
+    CASCADE_MIN_ANSWER_CHARS: int = 10  # 快速模型回答短于该长度视为低置信度
+    
+    # 知识检索配置
+    RETRIEVAL_RRF_K: int = 60  # 倒数排名融合常数 k，越大越弱化头部名次的优势
+    RETRIEVAL_MODE: str = "hybrid"  # hybrid（向量 + BM25 并发检索后融合）| dense（仅向量检索，BM25兜底）
+    RETRIEVAL_CANDIDATE_MULTIPLIER: int = 2  # 混合检索每一路取 limit × N 条候选参与融合
+    RETRIEVAL_DENSE_WEIGHT: float = 1.0  # 向量检索在RRF中的权重
+    RETRIEVAL_LEXICAL_WEIGHT: float = 1.0  # BM25词法检索在RRF中的权重
+    RETRIEVAL_DENSE_MAX_DISTANCE: float = 0.0  # 向量距离上限，超过的候选不参与融合；0 表示不限制（量纲取决于存储后端的距离度量）
+    RETRIEVAL_MIN_RELATIVE_SCORE: float = 0.6  # 结果在各路中的得分（向量相似度 / BM25得分）均低于该路第一名该比例时被丢弃；0 表示不过滤
+    
+    # 知识批量导入配置
+    BULK_INGEST_BATCH_SIZE: int = 64  # 每批嵌入与写入的文档数
+    BULK_INGEST_EMBED_CONCURRENCY: int = 4  # 同时嵌入/写入的批次数（受向量数据库线程池大小限制）
+    BULK_INGEST_SPOOL_MEMORY_BYTES: int = 8 * 1024 * 1024  # 请求体暂存在内存中的上限，超过后写入临时文件
+    
+    # 文档导入分块配置（PDF/DOCX）
+    DOCUMENT_CHUNK_MAX_TOKENS: int = 400  # 每个分块的Token上限
+    DOCUMENT_CHUNK_OVERLAP_TOKENS: int = 60  # 同一章节内相邻分块的重叠Token数
+    
+    # 知识检索结果缓存（按知识库版本失效）
+    SEARCH_CACHE_ENABLED: bool = True
+    SEARCH_CACHE_MAX_ENTRIES: int = 2000  # LRU条目上限
+    SEARCH_CACHE_TTL: int = 300  # 缓存有效期（秒）
+    
+    # 向量存储后端配置：chroma（远程 Chroma 服务）| local（进程内向量索引，持久化到磁盘）
+    VECTOR_STORE_BACKEND: str = "chroma"
+    LOCAL_VECTOR_STORE_DIR: str = "data/vector_store"
+    LOCAL_VECTOR_STORE_IVF_MIN_DOCS: int = 2000  # 文档数达到该值后使用IVF索引，否则精确扫描
+    LOCAL_VECTOR_STORE_IVF_NPROBE: int = 8  # IVF查询扫描的簇数，越大召回越高、越慢
+    LOCAL_VECTOR_STORE_FLUSH_EVERY: int = 1000  # 累计写入N条（且不少于已落盘文档数）后写回磁盘，关闭时也会写回
+    
+    # 向量数据库线程池配置（Chroma与嵌入函数均为同步调用）
+    VECTOR_DB_THREAD_POOL_SIZE: int = 8
+    
+    # 嵌入微批处理配置
+    EMBEDDING_BATCH_ENABLED: bool = True
+    EMBEDDING_BATCH_WINDOW_MS: float = 5.0  # 合并并发请求的等待窗口（毫秒）
+    EMBEDDING_MAX_BATCH_SIZE: int = 64  # 单次上游调用的最大文本数
+    
+    # 嵌入缓存配置（按模型名与文本SHA-256持久化到磁盘）
+    EMBEDDING_CACHE_ENABLED: bool = True
+    EMBEDDING_CACHE_DIR: str = "data/embedding_cache"
+    EMBEDDING_CACHE_MAX_ENTRIES: int = 50000  # 每个模型的最大缓存条数，超出后按LRU淘汰
+    EMBEDDING_CACHE_FLUSH_EVERY: int = 100  # 每写入N条将索引写回磁盘
+    
+    # 语义回复缓存配置
+    RESPONSE_CACHE_ENABLED: bool = True
+    RESPONSE_CACHE_MAX_ENTRIES: int = 1000  # 内存LRU条目上限
+    RESPONSE_CACHE_TTL: int = 3600  # 缓存有效期（秒）
+    RESPONSE_CACHE_SIMILARITY_THRESHOLD: float = 0.95  # 问题向量余弦相似度命中阈值
+    RESPONSE_CACHE_REDIS_ENABLED: bool = False  # 启用Redis共享二级缓存
     
     # Agent配置
-    MAX_CONVERSATION_HISTORY: int = 50
+    MAX_CONVERSATION_HISTORY: int = 50  # 每个会话保留的最多原文条数
+    CONVERSATION_HISTORY_MAX_TOKENS: int = 1000  # 对话摘要 + 最近原文的Token预算，超出部分折叠进摘要
+    CONVERSATION_SUMMARY_MAX_TOKENS: int = 300  # 滚动摘要的Token上限
+    CONVERSATION_SUMMARY_ENABLED: bool = True
     SESSION_TIMEOUT: int = 3600  # 1小时
     RATE_LIMIT_PER_MINUTE: int = 100
     
@@ -0,0 +1,132 @@
+"""
+请求截止时间 - 在端点创建，沿 协调器 → 知识检索 → LLM调用 传递
+"""
+
+import asyncio
+import logging
+import time
+from contextlib import aclosing, contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Awaitable, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class DeadlineExceededError(asyncio.TimeoutError):
+    """请求的整体时间预算已用完"""
+
+
+class Deadline:
+    """单个请求的截止时间，各阶段把自身超时收缩到剩余时间"""
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self.expires_at = time.monotonic() + timeout
+
+    def remaining(self) -> float:
+        """剩余秒数（不小于0）"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.expires_at
+
+    def cap(self, timeout: Optional[float] = None) -> float:
+        """阶段超时与剩余时间取较小值"""
+        remaining = self.remaining()
+        return remaining if timeout is None else min(timeout, remaining)
+
+    def check(self, stage: str):
+        """已超时则抛出 DeadlineExceededError"""
+        if self.expired:
+            raise DeadlineExceededError(f"{stage}: 请求已超过 {self.timeout:.1f}s 时间预算")
+
+
+_current_deadline: ContextVar[Optional[Deadline]] = ContextVar("request_deadline", default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    """当前请求的截止时间（不在请求内时为None）"""
+    return _current_deadline.get()
+
+
+@contextmanager
+def deadline_scope(deadline: Optional[Deadline]) -> Iterator[Optional[Deadline]]:
+    """在作用域内将 deadline 设为当前截止时间；传入None时沿用外层的截止时间"""
+    if deadline is None:
+        yield current_deadline()
+        return
+    token = _current_deadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current_deadline.reset(token)
+
+
+def remaining_timeout(timeout: Optional[float] = None) -> Optional[float]:
+    """把阶段超时收缩到当前请求的剩余时间；没有截止时间时原样返回"""
+    deadline = current_deadline()
+    return timeout if deadline is None else deadline.cap(timeout)
+
+
+async def run_with_deadline(awaitable: Awaitable[Any], stage: str, timeout: Optional[float] = None) -> Any:
+    """在 min(timeout, 剩余时间) 内等待 awaitable（同一任务内计时，不额外创建任务）"""
+    deadline = current_deadline()
+    if deadline is not None and deadline.expired:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        deadline.check(stage)
+    try:
+        async with asyncio.timeout(remaining_timeout(timeout)):
+            return await awaitable
+    except TimeoutError:
+        if deadline is not None and deadline.expired:
+            raise DeadlineExceededError(f"{stage}: 请求已超过 {deadline.timeout:.1f}s 时间预算") from None
+        raise
+
+
+class _StreamError:
+    """生产者任务抛出的异常，转交给消费方重新抛出"""
+
+    def __init__(self, error: Exception):
+        self.error = error
+
+
+_STREAM_END = object()
+
+
+async def stream_with_deadline(
+    stream: AsyncIterator[Any],
+    deadline: Optional[Deadline],
+    buffer: int = 16
+) -> AsyncIterator[Any]:
+    """在独立任务中以 deadline 为截止时间消费异步迭代器，并按顺序转发其产出
+
+    截止时间只在生产者任务的上下文中生效，不会随 yield 泄漏到消费方；
+    生产者最多领先 buffer 条，消费方提前关闭时取消生产者。
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=buffer)
+
+    async def produce():
+        try:
+            with deadline_scope(deadline):
+                async with aclosing(stream):
+                    async for item in stream:
+                        await queue.put(item)
+        except Exception as e:
+            await queue.put(_StreamError(e))
+        else:
+            await queue.put(_STREAM_END)
+
+    producer = asyncio.create_task(produce())
+    try:
+        while True:
+            item = await queue.get()
+            if item is _STREAM_END:
+                return
+            if isinstance(item, _StreamError):
+                raise item.error
+            yield item
+    finally:
+        if not producer.done():
+            producer.cancel()
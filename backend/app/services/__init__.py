@@ -5,5 +5,6 @@
 from .vector_db import VectorDBService
 from .agent_coordinator import AgentCoordinator
 from .llm_service import LLMService
+from .response_cache import SemanticResponseCache
 
-__all__ = ["VectorDBService", "AgentCoordinator", "LLMService"]
\ No newline at end of file
+__all__ = ["VectorDBService", "AgentCoordinator", "LLMService", "SemanticResponseCache"]
\ No newline at end of file
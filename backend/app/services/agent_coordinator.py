@@ -4,14 +4,17 @@ Agent协调器 - 多Agent调度和管理
 
 import logging
 import json
-from typing import Dict, Any, List, Optional, Tuple
+from typing import Dict, Any, List, Optional, Tuple, AsyncIterator
 from sqlalchemy.orm import Session
 import re
+from contextlib import aclosing
 from datetime import datetime
 from enum import Enum
 
+from app.core.deadline import Deadline, deadline_scope, stream_with_deadline
 from .llm_service import llm_service
 from .vector_db import vector_db_service
+from .conversation_memory import conversation_memory
 
 logger = logging.getLogger(__name__)
 
@@ -34,6 +37,19 @@ class AgentCapability(Enum):
     ESCALATION = "escalation"         # 升级处理
     SECURITY = "security"             # 安全检查
 
+# 模型开始续写下一轮用户发言时立即停止
+DIALOGUE_STOP_SEQUENCES = ["\n用户:", "\n用户：", "\n客户:", "\n客户："]
+
+# 各Agent的生成策略：余额、营业时间等简短答复限制在几百Token内，理财建议允许更长的回答
+AGENT_GENERATION_POLICIES: Dict[AgentType, Dict[str, Any]] = {
+    AgentType.GENERAL: {"max_tokens": 400, "temperature": 0.5, "stop": DIALOGUE_STOP_SEQUENCES},
+    AgentType.ACCOUNT: {"max_tokens": 300, "temperature": 0.3, "stop": DIALOGUE_STOP_SEQUENCES},
+    AgentType.TRANSFER: {"max_tokens": 500, "temperature": 0.3, "stop": DIALOGUE_STOP_SEQUENCES},
+    AgentType.INVESTMENT: {"max_tokens": 1500, "temperature": 0.7, "stop": DIALOGUE_STOP_SEQUENCES},
+    AgentType.LOAN: {"max_tokens": 1000, "temperature": 0.5, "stop": DIALOGUE_STOP_SEQUENCES},
+    AgentType.SECURITY: {"max_tokens": 600, "temperature": 0.3, "stop": DIALOGUE_STOP_SEQUENCES},
+}
+
 class BankAgent:
     """银行Agent基类"""
     
@@ -42,6 +58,12 @@ class BankAgent:
         self.name = name
         self.capabilities = self._init_capabilities()
         self.conversation_history = []
+        # 流式回复使用的默认结果属性
+        self.default_confidence = 0.9
+        self.default_actions: List[str] = []
+        self.fallback_response = "抱歉，我现在无法处理您的请求，请稍后再试。"
+        # 回复的Token上限、温度与停止序列
+        self.generation_policy = AGENT_GENERATION_POLICIES.get(agent_type, {})
     
     def _init_capabilities(self) -> List[AgentCapability]:
         """初始化Agent能力"""
@@ -56,6 +78,54 @@ class BankAgent:
         """处理消息"""
         raise NotImplementedError
     
+    async def process_message_stream(
+        self, 
+        message: str, 
+        context: Dict[str, Any] = None,
+        db: Session = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """流式处理消息：先产出 delta 事件，最后产出包含完整结果的 done 事件"""
+        chunks: List[str] = []
+        try:
+            knowledge_results = await vector_db_service.search_knowledge(
+                message, limit=5
+            )
+            
+            context_data = {
+                "knowledge_results": knowledge_results,
+                "conversation_history": context.get("conversation_history", []) if context else [],
+                "conversation_summary": context.get("conversation_summary") if context else None
+            }
+            
+            async for delta in llm_service.stream_banking_response(
+                message, context_data, agent_type=self.agent_type.value,
+                **self.generation_policy
+            ):
+                chunks.append(delta)
+                yield {"type": "delta", "content": delta}
+            
+            yield {
+                "type": "done",
+                "result": {
+                    "agent_type": self.agent_type.value,
+                    "response": "".join(chunks) or self.fallback_response,
+                    "confidence": self.default_confidence,
+                    "actions": list(self.default_actions)
+                }
+            }
+            
+        except Exception as e:
+            logger.error(f"❌ {self.name}流式处理失败: {e}")
+            yield {
+                "type": "done",
+                "result": {
+                    "agent_type": self.agent_type.value,
+                    "response": "".join(chunks) or self.fallback_response,
+                    "confidence": 0.0,
+                    "error": str(e)
+                }
+            }
+    
     def can_handle(self, message: str) -> float:
         """判断是否可以处理消息，返回置信度（0-1）"""
         return 0.0
@@ -70,6 +140,7 @@ class GeneralAgent(BankAgent):
             AgentCapability.BUSINESS_GUIDANCE,
             AgentCapability.ESCALATION
         ]
+        self.default_confidence = 0.8
     
     async def process_message(
         self, 
@@ -85,11 +156,15 @@ class GeneralAgent(BankAgent):
             # 构建上下文
             context_data = {
                 "knowledge_results": knowledge_results,
-                "conversation_history": context.get("conversation_history", []) if context else []
+                "conversation_history": context.get("conversation_history", []) if context else [],
+                "conversation_summary": context.get("conversation_summary") if context else None
             }
             
             # 生成回复
-            response = await llm_service.generate_banking_response(message, context_data)
+            response = await llm_service.generate_banking_response(
+                message, context_data, agent_type=self.agent_type.value,
+                **self.generation_policy
+            )
             response_text = (
                 response.get("content", "抱歉，我现在无法处理您的请求，请稍后再试。")
                 if isinstance(response, dict) else str(response)
@@ -126,6 +201,8 @@ class AccountAgent(BankAgent):
             AgentCapability.BUSINESS_GUIDANCE,
             AgentCapability.TRANSACTION_HELP
         ]
+        self.default_actions = ["account_inquiry", "balance_check"]
+        self.fallback_response = "抱歉，我暂时无法处理账户相关问题，请联系人工客服。"
     
     async def process_message(
         self, 
@@ -203,9 +280,13 @@ class AccountAgent(BankAgent):
             )
             context_data = {
                 "knowledge_results": knowledge_results,
-                "conversation_history": context.get("conversation_history", []) if context else []
+                "conversation_history": context.get("conversation_history", []) if context else [],
+                "conversation_summary": context.get("conversation_summary") if context else None
             }
-            response = await llm_service.generate_banking_response(message, context_data)
+            response = await llm_service.generate_banking_response(
+                message, context_data, agent_type=self.agent_type.value,
+                **self.generation_policy
+            )
             response_text = (
                 response.get("content", "抱歉，我暂时无法处理账户相关问题，请联系人工客服。")
                 if isinstance(response, dict) else str(response)
@@ -226,6 +307,23 @@ class AccountAgent(BankAgent):
                 "error": str(e)
             }
 
+    async def process_message_stream(
+        self, 
+        message: str, 
+        context: Dict[str, Any] = None,
+        db: Session = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """流式处理账户消息：余额查询直接走数据库，一次性产出结果"""
+        balance_keywords = ["查询余额", "余额查询", "查余额", "余额", "账户余额", "balance", "check balance", "query balance"]
+        if any(kw in message for kw in balance_keywords) and db is not None:
+            result = await self.process_message(message, context, db)
+            yield {"type": "delta", "content": result.get("response", "")}
+            yield {"type": "done", "result": result}
+            return
+        
+        async for event in super().process_message_stream(message, context, db):
+            yield event
+
     def can_handle(self, message: str) -> float:
         """判断是否可以处理账户相关消息"""
         keywords = ["账户", "银行卡", "余额", "查询余额", "账户余额", "卡号", "balance", "check balance", "query balance"]
@@ -257,6 +355,8 @@ class TransferAgent(BankAgent):
             AgentCapability.TRANSACTION_HELP,
             AgentCapability.SECURITY
         ]
+        self.default_actions = ["transfer_guidance", "security_check"]
+        self.fallback_response = "抱歉，我暂时无法处理转账相关问题，请联系人工客服。"
     
     async def process_message(
         self, 
@@ -272,10 +372,14 @@ class TransferAgent(BankAgent):
             
             context_data = {
                 "knowledge_results": knowledge_results,
-                "conversation_history": context.get("conversation_history", []) if context else []
+                "conversation_history": context.get("conversation_history", []) if context else [],
+                "conversation_summary": context.get("conversation_summary") if context else None
             }
             
-            response = await llm_service.generate_banking_response(message, context_data)
+            response = await llm_service.generate_banking_response(
+                message, context_data, agent_type=self.agent_type.value,
+                **self.generation_policy
+            )
             response_text = (
                 response.get("content", "抱歉，我暂时无法处理转账相关问题，请联系人工客服。")
                 if isinstance(response, dict) else str(response)
@@ -319,6 +423,8 @@ class InvestmentAgent(BankAgent):
             AgentCapability.RISK_ASSESSMENT,
             AgentCapability.BUSINESS_GUIDANCE
         ]
+        self.default_actions = ["product_recommendation", "risk_assessment"]
+        self.fallback_response = "抱歉，我暂时无法处理理财相关问题，请联系人工客服。"
     
     async def process_message(
         self, 
@@ -334,10 +440,14 @@ class InvestmentAgent(BankAgent):
             
             context_data = {
                 "knowledge_results": knowledge_results,
-                "conversation_history": context.get("conversation_history", []) if context else []
+                "conversation_history": context.get("conversation_history", []) if context else [],
+                "conversation_summary": context.get("conversation_summary") if context else None
             }
             
-            response = await llm_service.generate_banking_response(message, context_data)
+            response = await llm_service.generate_banking_response(
+                message, context_data, agent_type=self.agent_type.value,
+                **self.generation_policy
+            )
             response_text = (
                 response.get("content", "抱歉，我暂时无法处理理财相关问题，请联系人工客服。")
                 if isinstance(response, dict) else str(response)
@@ -381,6 +491,8 @@ class LoanAgent(BankAgent):
             AgentCapability.DOCUMENTATION,
             AgentCapability.BUSINESS_GUIDANCE
         ]
+        self.default_actions = ["loan_application", "document_guidance"]
+        self.fallback_response = "抱歉，我暂时无法处理贷款相关问题，请联系人工客服。"
     
     async def process_message(
         self, 
@@ -396,10 +508,14 @@ class LoanAgent(BankAgent):
             
             context_data = {
                 "knowledge_results": knowledge_results,
-                "conversation_history": context.get("conversation_history", []) if context else []
+                "conversation_history": context.get("conversation_history", []) if context else [],
+                "conversation_summary": context.get("conversation_summary") if context else None
             }
             
-            response = await llm_service.generate_banking_response(message, context_data)
+            response = await llm_service.generate_banking_response(
+                message, context_data, agent_type=self.agent_type.value,
+                **self.generation_policy
+            )
             response_text = (
                 response.get("content", "抱歉，我暂时无法处理贷款相关问题，请联系人工客服。")
                 if isinstance(response, dict) else str(response)
@@ -456,18 +572,24 @@ class AgentCoordinator:
         conversation_id: str = None,
         context: Dict[str, Any] = None,
         db: Session = None,
+        deadline: Optional[Deadline] = None,
     ) -> Dict[str, Any]:
-        """处理消息的主入口"""
+        """处理消息的主入口（deadline 沿检索与LLM调用传递）"""
         try:
+            # 最近轮次原文 + 滚动摘要
+            context = conversation_memory.prepare_context(conversation_id, context)
+            
             # 选择最佳Agent
             best_agent = self._select_best_agent(message, context)
             
             # 处理消息
-            result = await best_agent.process_message(message, context, db)
+            with deadline_scope(deadline):
+                result = await best_agent.process_message(message, context, db)
             
             # 记录对话状态
             if conversation_id:
                 self._update_conversation_state(conversation_id, best_agent, result)
+                conversation_memory.record_turn(conversation_id, message, result)
             
             logger.info(f"🤖 Agent处理完成: {best_agent.name}, 置信度: {result.get('confidence', 0)}")
             
@@ -482,6 +604,49 @@ class AgentCoordinator:
                 "error": str(e)
             }
     
+    async def process_message_stream(
+        self, 
+        message: str, 
+        conversation_id: str = None,
+        context: Dict[str, Any] = None,
+        db: Session = None,
+        deadline: Optional[Deadline] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """流式处理消息的主入口：产出 delta 事件，最后产出 done 事件"""
+        try:
+            # 最近轮次原文 + 滚动摘要
+            context = conversation_memory.prepare_context(conversation_id, context)
+            
+            # 选择最佳Agent
+            best_agent = self._select_best_agent(message, context)
+            
+            # Agent在独立任务中运行，截止时间只作用于检索与LLM调用，不泄漏到消费方
+            events = stream_with_deadline(best_agent.process_message_stream(message, context, db), deadline)
+            async with aclosing(events):
+                async for event in events:
+                    if event.get("type") == "done":
+                        result = event.get("result", {})
+                    
+                        # 记录对话状态
+                        if conversation_id:
+                            self._update_conversation_state(conversation_id, best_agent, result)
+                            conversation_memory.record_turn(conversation_id, message, result)
+                    
+                        logger.info(f"🤖 Agent流式处理完成: {best_agent.name}, 置信度: {result.get('confidence', 0)}")
+                    yield event
+            
+        except Exception as e:
+            logger.error(f"❌ Agent协调器流式处理失败: {e}")
+            yield {
+                "type": "done",
+                "result": {
+                    "agent_type": "error",
+                    "response": "抱歉，我现在无法处理您的请求，请稍后再试。",
+                    "confidence": 0.0,
+                    "error": str(e)
+                }
+            }
+    
     def _select_best_agent(self, message: str, context: Dict[str, Any] = None) -> BankAgent:
         """选择最佳Agent"""
         agent_scores = {}
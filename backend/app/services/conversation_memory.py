@@ -0,0 +1,226 @@
+"""
+对话记忆 - 最近几轮原文保留，较早的对话折叠为滚动摘要
+"""
+
+import asyncio
+import contextvars
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+
+from app.core.config import settings
+from .llm_service import llm_service
+from .prompt_context import count_tokens
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = """你是银行客服对话的记录员。请将「已有摘要」与「新增对话」合并为一份新的对话摘要。
+
+要求：
+- 保留客户身份信息、办理中的业务、已确认的金额/账户/产品、尚未解决的问题
+- 省略寒暄与重复内容
+- 使用简洁的中文要点，不超过 {max_tokens} 个Token
+- 只输出摘要正文"""
+
+
+class ConversationSession:
+    """单个会话的记忆：滚动摘要 + 尚未折叠进摘要的原文轮次"""
+
+    def __init__(self):
+        self.summary = ""
+        self.turns: List[Dict[str, Any]] = []
+        self.refresh_task: Optional[asyncio.Task] = None
+        self.last_active = time.monotonic()
+
+
+class ConversationMemory:
+    """会话记忆管理
+
+    每个会话只把最近、在Token预算内的轮次原文放入提示词；窗口外的轮次
+    在请求路径之外异步合并进滚动摘要。CONVERSATION_HISTORY_MAX_TOKENS 限制
+    摘要与原文的总Token数，MAX_CONVERSATION_HISTORY 限制待摘要的原文条数
+    （摘要持续失败时丢弃最早的轮次）。
+    """
+
+    def __init__(self):
+        self.sessions: "OrderedDict[str, ConversationSession]" = OrderedDict()
+        self.stats = {
+            "refreshes": 0,
+            "refresh_failures": 0,
+            "summarized_turns": 0,
+            "dropped_turns": 0,
+            "expired_sessions": 0
+        }
+
+    @staticmethod
+    def _normalize(item: Any) -> Optional[Dict[str, Any]]:
+        """统一为 {"role", "content", "agent_type"} 格式"""
+        if isinstance(item, str):
+            return {"role": "user", "content": item}
+        if not isinstance(item, dict):
+            return None
+        content = item.get("content") or item.get("message") or item.get("text")
+        if not content:
+            return None
+        turn = {"role": "assistant" if item.get("role") == "assistant" else "user", "content": content}
+        if item.get("agent_type"):
+            turn["agent_type"] = item["agent_type"]
+        return turn
+
+    def _session(self, conversation_id: str) -> ConversationSession:
+        self._expire()
+        session = self.sessions.get(conversation_id)
+        if session is None:
+            session = ConversationSession()
+            self.sessions[conversation_id] = session
+        self.sessions.move_to_end(conversation_id)
+        session.last_active = time.monotonic()
+        return session
+
+    def _expire(self):
+        """淘汰超过 SESSION_TIMEOUT 未活跃的会话"""
+        deadline = time.monotonic() - settings.SESSION_TIMEOUT
+        while self.sessions:
+            conversation_id, session = next(iter(self.sessions.items()))
+            if session.last_active >= deadline:
+                break
+            if session.refresh_task and not session.refresh_task.done():
+                session.refresh_task.cancel()
+            del self.sessions[conversation_id]
+            self.stats["expired_sessions"] += 1
+
+    @staticmethod
+    def _split(turns: List[Dict[str, Any]], summary: str) -> int:
+        """返回原文窗口的起始下标：从最近一轮向前，直到超出Token预算"""
+        budget = settings.CONVERSATION_HISTORY_MAX_TOKENS - count_tokens(summary)
+        start = len(turns)
+        while start > 0 and len(turns) - start < settings.MAX_CONVERSATION_HISTORY:
+            tokens = count_tokens(turns[start - 1]["content"])
+            if tokens > budget:
+                break
+            budget -= tokens
+            start -= 1
+        return start
+
+    def prepare_context(
+        self,
+        conversation_id: Optional[str],
+        context: Dict[str, Any] = None
+    ) -> Dict[str, Any]:
+        """为本次请求生成上下文：conversation_history 为窗口内原文，conversation_summary 为滚动摘要
+
+        客户端自带的历史在会话首次出现时作为初始记忆导入。
+        """
+        context = dict(context or {})
+        client_history = [
+            turn for turn in map(self._normalize, context.get("conversation_history") or []) if turn
+        ]
+
+        if not conversation_id:
+            # 无会话ID时无法摘要，只保留预算内的最近轮次
+            context["conversation_history"] = client_history[self._split(client_history, ""):]
+            return context
+
+        session = self._session(conversation_id)
+        if client_history and not session.turns and not session.summary:
+            session.turns = client_history[-settings.MAX_CONVERSATION_HISTORY:]
+            self._schedule_refresh(conversation_id, session)
+
+        start = self._split(session.turns, session.summary)
+        context["conversation_history"] = list(session.turns[start:])
+        if session.summary:
+            context["conversation_summary"] = session.summary
+        return context
+
+    def record_turn(
+        self,
+        conversation_id: Optional[str],
+        message: str,
+        result: Dict[str, Any]
+    ):
+        """记录一轮问答，必要时在后台刷新摘要"""
+        if not conversation_id:
+            return
+        session = self._session(conversation_id)
+        session.turns.append({"role": "user", "content": message})
+        if result.get("response"):
+            session.turns.append({
+                "role": "assistant",
+                "content": result["response"],
+                "agent_type": result.get("agent_type")
+            })
+
+        overflow = len(session.turns) - settings.MAX_CONVERSATION_HISTORY
+        if overflow > 0:
+            # 摘要跟不上（如LLM持续失败）时丢弃最早的原文
+            del session.turns[:overflow]
+            self.stats["dropped_turns"] += overflow
+        self._schedule_refresh(conversation_id, session)
+
+    def _schedule_refresh(self, conversation_id: str, session: ConversationSession):
+        if not settings.CONVERSATION_SUMMARY_ENABLED:
+            return
+        if session.refresh_task and not session.refresh_task.done():
+            # 进行中的刷新结束后会重新检查窗口
+            return
+        if self._split(session.turns, session.summary) == 0:
+            return
+        # 使用空上下文，后台摘要不继承当前请求的截止时间
+        session.refresh_task = asyncio.create_task(
+            self._refresh(conversation_id, session),
+            context=contextvars.Context()
+        )
+
+    async def _refresh(self, conversation_id: str, session: ConversationSession):
+        """把窗口外的轮次合并进摘要（循环直到窗口外没有剩余轮次）"""
+        while True:
+            folded = self._split(session.turns, session.summary)
+            if folded == 0:
+                return
+            older = session.turns[:folded]
+            transcript = "\n".join(
+                f"{'助手' if turn['role'] == 'assistant' else '用户'}: {turn['content']}" for turn in older
+            )
+            messages = [
+                {"role": "system", "content": SUMMARY_PROMPT.format(max_tokens=settings.CONVERSATION_SUMMARY_MAX_TOKENS)},
+                {"role": "user", "content": f"已有摘要：\n{session.summary or '（无）'}\n\n新增对话：\n{transcript}"}
+            ]
+            self.stats["refreshes"] += 1
+            response = await llm_service.chat_completion(
+                messages,
+                model=None,
+                temperature=0.2,
+                max_tokens=settings.CONVERSATION_SUMMARY_MAX_TOKENS
+            )
+            if not response.get("success") or not response.get("content"):
+                self.stats["refresh_failures"] += 1
+                logger.warning(f"⚠️ 会话 {conversation_id} 摘要刷新失败，保留原文: {response.get('error')}")
+                return
+
+            session.summary = response["content"].strip()
+            # 刷新期间可能有新增或被丢弃的轮次，只移除已折叠的那些
+            folded_ids = {id(turn) for turn in older}
+            session.turns = [turn for turn in session.turns if id(turn) not in folded_ids]
+            self.stats["summarized_turns"] += len(older)
+            logger.debug(f"📝 会话 {conversation_id} 摘要已更新，折叠 {len(older)} 条")
+
+    async def shutdown(self):
+        """取消进行中的摘要刷新"""
+        tasks = [s.refresh_task for s in self.sessions.values() if s.refresh_task and not s.refresh_task.done()]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": settings.CONVERSATION_SUMMARY_ENABLED,
+            "sessions": len(self.sessions),
+            "summaries": sum(1 for s in self.sessions.values() if s.summary),
+            "refreshing": sum(1 for s in self.sessions.values() if s.refresh_task and not s.refresh_task.done()),
+            **self.stats
+        }
+
+# 全局实例
+conversation_memory = ConversationMemory()
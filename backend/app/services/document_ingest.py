@@ -0,0 +1,344 @@
+"""
+文档导入 - 流式抽取 PDF/DOCX 文本，按章节切分为带重叠的Token分块后批量写入知识库
+"""
+
+import asyncio
+import hashlib
+import logging
+import re
+import uuid
+import zipfile
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple, Iterator, AsyncIterator, Set
+from xml.etree import ElementTree
+
+from app.core.config import settings
+from .prompt_context import count_tokens
+from .knowledge_ingest import knowledge_ingestor, ParsedRow
+from .vector_db import vector_db_service
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_DOCUMENT_TYPES = ("pdf", "docx")
+
+WORD_NS = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+# DOCX 段落样式：Heading 1 / heading1 / 标题 1 / Title
+DOCX_HEADING_STYLE = re.compile(r"^(?:heading|标题)\s*(\d)$", re.IGNORECASE)
+
+# PDF 无样式信息，按常见的政策文件编号格式识别标题
+PDF_HEADING_PATTERNS = [
+    (1, re.compile(r"^第[一二三四五六七八九十百零\d]+[章编部分]")),
+    (2, re.compile(r"^第[一二三四五六七八九十百零\d]+节")),
+    (2, re.compile(r"^[一二三四五六七八九十]+、")),
+    (3, re.compile(r"^\d+(?:\.\d+){1,2}\s*\S")),
+]
+PDF_HEADING_MAX_CHARS = 40
+
+# 每个 PdfReader 处理的页数，之后换用新的 reader 释放已解析对象的缓存
+PDF_PAGES_PER_READER = 100
+
+SENTENCE_BOUNDARY = re.compile(r"(?<=[。！？；!?;])|(?<=[.])\s+")
+
+# (块类型, 文本, 属性)：块类型为 heading（属性含 level，0 为文档标题）或 paragraph（属性可含 page）
+Block = Tuple[str, str, Dict[str, Any]]
+
+
+def iter_docx_blocks(path: Path) -> Iterator[Block]:
+    """流式解析 DOCX 正文（word/document.xml），处理完的段落立即释放"""
+    with zipfile.ZipFile(path) as archive, archive.open("word/document.xml") as xml:
+        body = None
+        depth = 0
+        body_depth = -1
+        for event, elem in ElementTree.iterparse(xml, events=("start", "end")):
+            if event == "start":
+                depth += 1
+                if elem.tag == f"{WORD_NS}body":
+                    body, body_depth = elem, depth
+                continue
+            depth -= 1
+            if elem.tag == f"{WORD_NS}p":
+                text = "".join(node.text or "" for node in elem.iter(f"{WORD_NS}t")).strip()
+                if text:
+                    style = elem.find(f"{WORD_NS}pPr/{WORD_NS}pStyle")
+                    style_name = style.get(f"{WORD_NS}val", "") if style is not None else ""
+                    match = DOCX_HEADING_STYLE.match(style_name)
+                    if match:
+                        yield "heading", text, {"level": int(match.group(1))}
+                    elif style_name.lower() == "title":
+                        yield "heading", text, {"level": 0}
+                    else:
+                        yield "paragraph", text, {}
+                elem.clear()
+            # 正文的直接子元素处理完后从树中移除，保持内存占用平稳
+            if body is not None and depth == body_depth:
+                body.clear()
+
+
+def _pdf_page_blocks(page, page_no: int) -> Iterator[Block]:
+    """抽取单页文本，按空行分段并识别编号标题"""
+    paragraph: List[str] = []
+    for line in (page.extract_text() or "").splitlines():
+        line = line.strip()
+        if not line:
+            if paragraph:
+                yield "paragraph", "".join(paragraph), {"page": page_no}
+                paragraph = []
+            continue
+        level = None
+        if len(line) <= PDF_HEADING_MAX_CHARS:
+            level = next((lvl for lvl, pattern in PDF_HEADING_PATTERNS if pattern.match(line)), None)
+        if level is not None:
+            if paragraph:
+                yield "paragraph", "".join(paragraph), {"page": page_no}
+                paragraph = []
+            yield "heading", line, {"level": level, "page": page_no}
+        else:
+            paragraph.append(line)
+    if paragraph:
+        yield "paragraph", "".join(paragraph), {"page": page_no}
+
+
+def iter_pdf_blocks(path: Path) -> Iterator[Block]:
+    """逐页抽取 PDF 文本（依赖 pypdf，页面按需从文件解析）
+
+    PdfReader 会缓存解析过的对象直到 reader 被释放，因此每 PDF_PAGES_PER_READER 页
+    换用新的 reader，已处理页面的内容随旧 reader 一起释放。
+    """
+    try:
+        from pypdf import PdfReader
+    except ImportError as e:
+        raise RuntimeError("解析PDF需要安装 pypdf") from e
+
+    # 传入文件句柄而非路径，pypdf 按需从文件读取对象，不会整份读入内存
+    with open(path, "rb") as fh:
+        total = len(PdfReader(fh).pages)
+        for start in range(0, total, PDF_PAGES_PER_READER):
+            reader = PdfReader(fh)
+            for index in range(start, min(start + PDF_PAGES_PER_READER, total)):
+                yield from _pdf_page_blocks(reader.pages[index], index + 1)
+
+
+def _split_long(text: str, max_tokens: int) -> Iterator[str]:
+    """将超出Token上限的段落按句子切分，单句仍超限时按Token上限硬切"""
+    for sentence in SENTENCE_BOUNDARY.split(text):
+        sentence = sentence.strip()
+        while sentence:
+            if count_tokens(sentence) <= max_tokens:
+                yield sentence
+                break
+            # 二分查找不超过上限的最长前缀
+            low, high = 1, len(sentence)
+            while low < high:
+                mid = (low + high + 1) // 2
+                if count_tokens(sentence[:mid]) <= max_tokens:
+                    low = mid
+                else:
+                    high = mid - 1
+            yield sentence[:low]
+            sentence = sentence[low:].strip()
+
+
+def _tail(text: str, max_tokens: int) -> str:
+    """返回不超过 max_tokens 的最长文本末尾（二分查找起始位置）"""
+    if max_tokens <= 0:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    low, high = 1, len(text)
+    while low < high:
+        mid = (low + high) // 2
+        if count_tokens(text[mid:]) <= max_tokens:
+            high = mid
+        else:
+            low = mid + 1
+    return text[low:].strip()
+
+
+def chunk_blocks(blocks: Iterator[Block], max_tokens: int, overlap_tokens: int) -> Iterator[Dict[str, Any]]:
+    """将文本块组装为Token受限的分块
+
+    分块不跨越章节；同一章节内下一分块以上一分块末尾不超过 overlap_tokens 的完整片段开头，
+    最后一个片段本身超出重叠预算时取其末尾 overlap_tokens 个Token。
+    每个分块带章节路径与页码范围。内存中只保留当前分块。
+    """
+    headings: Dict[int, str] = {}
+    pieces: List[Tuple[str, int, Optional[int]]] = []
+    size = 0
+
+    def emit() -> Optional[Dict[str, Any]]:
+        if not pieces:
+            return None
+        pages = [page for _, _, page in pieces if page is not None]
+        return {
+            "content": "\n".join(text for text, _, _ in pieces),
+            "section": " > ".join(headings[level] for level in sorted(headings)),
+            "page_start": min(pages) if pages else None,
+            "page_end": max(pages) if pages else None,
+            "tokens": size
+        }
+
+    for kind, text, attrs in blocks:
+        if kind == "heading":
+            chunk = emit()
+            if chunk:
+                yield chunk
+            pieces, size = [], 0
+            level = attrs.get("level", 1)
+            headings = {lvl: title for lvl, title in headings.items() if lvl < level}
+            headings[level] = text
+            continue
+
+        for piece in _split_long(text, max_tokens):
+            tokens = count_tokens(piece)
+            if pieces and size + tokens > max_tokens:
+                yield emit()
+                # 保留末尾文本作为下一分块的重叠上下文（不挤占新片段的空间）
+                budget = min(overlap_tokens, max_tokens - tokens)
+                overlap: List[Tuple[str, int, Optional[int]]] = []
+                kept = 0
+                for item in reversed(pieces):
+                    if kept + item[1] <= budget:
+                        overlap.insert(0, item)
+                        kept += item[1]
+                        continue
+                    # 末尾片段本身超出预算时截取其末尾，避免重叠为空
+                    tail = "" if overlap else _tail(item[0], budget)
+                    if tail:
+                        tail_tokens = count_tokens(tail)
+                        overlap.insert(0, (tail, tail_tokens, item[2]))
+                        kept += tail_tokens
+                    break
+                pieces, size = overlap, kept
+            pieces.append((piece, tokens, attrs.get("page")))
+            size += tokens
+
+    chunk = emit()
+    if chunk:
+        yield chunk
+
+
+def resolve_upload(filename: str) -> Path:
+    """定位上传目录中的文件，拒绝目录穿越与不支持的类型"""
+    upload_dir = Path(settings.UPLOAD_DIR).resolve()
+    path = (upload_dir / filename).resolve()
+    if upload_dir not in path.parents:
+        raise ValueError("文件路径必须位于上传目录内")
+    suffix = path.suffix.lower().lstrip(".")
+    if suffix not in settings.ALLOWED_FILE_TYPES or suffix not in SUPPORTED_DOCUMENT_TYPES:
+        raise ValueError(f"不支持的文档类型: {suffix or '未知'}（支持 {', '.join(SUPPORTED_DOCUMENT_TYPES)}）")
+    if not path.is_file():
+        raise FileNotFoundError(f"文件不存在: {filename}")
+    return path
+
+
+class DocumentIngestor:
+    """上传文档导入流水线
+
+    文本抽取与分块在后台线程中逐块推进，分块交给 KnowledgeIngestor 分批嵌入与写入；
+    写入端的背压会暂停解析，整个文档不会同时驻留内存。每次导入的分块ID带有新的批次号，
+    不会覆盖旧分块：全部写入成功后再删除旧批次的分块；导入失败或中断时删除本次已写入的分块，
+    旧内容保持完整可检索（导入进行期间新旧分块会同时可检索）。
+    """
+
+    def __init__(self):
+        self.stats = {"documents": 0, "chunks": 0, "failures": 0}
+
+    @staticmethod
+    def _blocks(path: Path) -> Iterator[Block]:
+        if path.suffix.lower() == ".pdf":
+            return iter_pdf_blocks(path)
+        return iter_docx_blocks(path)
+
+    async def _rows(
+        self,
+        path: Path,
+        relative: str,
+        category: str,
+        generation: str,
+        written: Set[str]
+    ) -> AsyncIterator[ParsedRow]:
+        chunks = chunk_blocks(
+            self._blocks(path),
+            settings.DOCUMENT_CHUNK_MAX_TOKENS,
+            settings.DOCUMENT_CHUNK_OVERLAP_TOKENS
+        )
+        file_key = hashlib.sha1(relative.encode("utf-8")).hexdigest()[:12]
+        index = 0
+        while True:
+            # 解析为同步阻塞操作，逐块放到线程中执行，避免阻塞事件循环
+            chunk = await asyncio.to_thread(next, chunks, None)
+            if chunk is None:
+                return
+            index += 1
+            metadata = {
+                "file": relative,
+                "chunk_index": index,
+                "generation": generation,
+                "section": chunk["section"],
+                "tokens": chunk["tokens"]
+            }
+            if chunk["page_start"] is not None:
+                metadata.update(page_start=chunk["page_start"], page_end=chunk["page_end"])
+            chunk_id = f"upload_{file_key}_{generation}_{index:05d}"
+            written.add(chunk_id)
+            yield index, {
+                "id": chunk_id,
+                "content": chunk["content"],
+                "category": category,
+                "keywords": [part for part in chunk["section"].split(" > ") if part],
+                "metadata": metadata
+            }, None
+
+    async def ingest(self, filename: str, category: str = "政策文件") -> AsyncIterator[Dict[str, Any]]:
+        """导入上传目录中的文档，产出与批量导入一致的进度事件"""
+        path = resolve_upload(filename)
+        relative = path.relative_to(Path(settings.UPLOAD_DIR).resolve()).as_posix()
+        previous = await vector_db_service.get_knowledge_ids({"file": relative})
+        generation = uuid.uuid4().hex[:8]
+        written: Set[str] = set()
+        committed = False
+
+        logger.info(f"📄 开始导入文档: {relative}（批次 {generation}）")
+        try:
+            rows = self._rows(path, relative, category, generation, written)
+            async for event in knowledge_ingestor.ingest(rows, source="upload"):
+                if event["type"] == "done":
+                    removed = 0
+                    if event["success"]:
+                        committed = True
+                        # 新批次已完整写入，再删除旧批次的全部分块
+                        removed = await vector_db_service.delete_knowledge_ids(previous)
+                        if removed:
+                            logger.info(f"🧹 已删除文档 {relative} 的 {removed} 个旧分块")
+                    else:
+                        logger.warning(f"⚠️ 文档 {relative} 部分分块写入失败，保留旧分块")
+                    event = {**event, "file": relative, "generation": generation, "removed_chunks": removed}
+                    self.stats["documents"] += 1
+                    self.stats["chunks"] += event["documents"]
+                yield event
+        except Exception:
+            self.stats["failures"] += 1
+            raise
+        finally:
+            if not committed and written:
+                await self._discard(relative, generation, written)
+
+    @staticmethod
+    async def _discard(relative: str, generation: str, written: Set[str]):
+        """导入未完成时删除本次批次已写入的分块，旧批次不受影响"""
+        try:
+            await vector_db_service.delete_knowledge_ids(sorted(written))
+            logger.info(f"🧹 已撤回文档 {relative} 批次 {generation} 的 {len(written)} 个分块")
+        except Exception as e:
+            logger.error(f"❌ 撤回文档 {relative} 批次 {generation} 的分块失败: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "max_tokens": settings.DOCUMENT_CHUNK_MAX_TOKENS,
+            "overlap_tokens": settings.DOCUMENT_CHUNK_OVERLAP_TOKENS,
+            **self.stats
+        }
+
+# 全局实例
+document_ingestor = DocumentIngestor()
@@ -0,0 +1,124 @@
+"""
+文档向量矩阵 - 预归一化的 float32 文档矩阵，用于本地向量化重排
+"""
+
+import logging
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple, Callable
+
+import numpy as np
+
+from .vector_store import metadata_matches
+
+logger = logging.getLogger(__name__)
+
+
+class DocumentMatrix:
+    """语料的内存快照：文档、元数据、ID 与按行单位化的嵌入矩阵
+
+    矩阵只在语料版本变化时重建；打分为一次矩阵-向量乘法，
+    再用 argpartition 取 top-k，无需逐条计算范数。
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version: Optional[int] = None
+        # (ids, documents, metadatas, matrix) 整体替换，检索线程读取到的始终是一致的快照
+        self.snapshot: Tuple[List[str], List[str], List[Dict[str, Any]], np.ndarray] = (
+            [], [], [], np.zeros((0, 0), dtype=np.float32)
+        )
+        self.stats = {"builds": 0, "last_build_seconds": 0.0, "searches": 0}
+
+    @property
+    def size(self) -> int:
+        return len(self.snapshot[0])
+
+    @staticmethod
+    def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (vectors / norms).astype(np.float32, copy=False)
+
+    def ensure(
+        self,
+        version: int,
+        fetch: Callable[[], Dict[str, Any]],
+        embed: Optional[Callable[[List[str]], List[List[float]]]] = None
+    ):
+        """语料版本变化时重建矩阵
+
+        fetch 返回 Chroma get() 格式的数据（ids/documents/metadatas/embeddings）；
+        缺少已存储的嵌入时使用 embed 补算。
+        """
+        if self.version == version:
+            return
+        with self.lock:
+            if self.version == version:
+                return
+            started = time.monotonic()
+            data = fetch() or {}
+            ids = list(data.get("ids") or [])
+            documents = list(data.get("documents") or [])
+            metadatas = list(data.get("metadatas") or [])
+            embeddings = data.get("embeddings")
+
+            if ids and (embeddings is None or len(embeddings) != len(ids)):
+                if embed is None:
+                    logger.warning("文档矩阵重建跳过：缺少嵌入且未提供嵌入函数")
+                    return
+                embeddings = embed(documents)
+
+            if ids:
+                matrix = self._normalize_rows(np.asarray(embeddings, dtype=np.float32))
+            else:
+                matrix = np.zeros((0, 0), dtype=np.float32)
+
+            metadatas = metadatas + [{}] * (len(ids) - len(metadatas))
+            self.snapshot = (ids, documents, metadatas, matrix)
+            self.version = version
+            self.stats["builds"] += 1
+            self.stats["last_build_seconds"] = round(time.monotonic() - started, 4)
+            logger.info(f"🧮 文档矩阵已重建: {len(ids)} 条, 版本 {version}, 耗时 {self.stats['last_build_seconds']}s")
+
+    def search(
+        self,
+        query_vector: List[float],
+        limit: int,
+        where: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """返回距离最近的 limit 条检索结果（距离为余弦距离，升序；where 为元数据过滤条件）"""
+        ids, documents, metadatas, matrix = self.snapshot
+        if not ids or limit <= 0:
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = float(np.linalg.norm(query))
+        if norm == 0.0 or query.shape[0] != matrix.shape[1]:
+            return []
+        self.stats["searches"] += 1
+
+        similarities = matrix @ (query / norm)
+        if where:
+            excluded = np.array([not metadata_matches(meta, where) for meta in metadatas])
+            similarities[excluded] = -np.inf
+            k = min(limit, int((~excluded).sum()))
+            if k == 0:
+                return []
+        else:
+            k = min(limit, similarities.shape[0])
+        top = np.argpartition(-similarities, k - 1)[:k]
+        top = top[np.argsort(-similarities[top])]
+        return [{
+            "content": documents[i],
+            "metadata": metadatas[i] or {},
+            "distance": float(1.0 - similarities[i]),
+            "id": ids[i]
+        } for i in top]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            **self.stats,
+            "documents": self.size,
+            "dim": int(self.snapshot[3].shape[1]) if self.size else None,
+            "version": self.version
+        }
@@ -0,0 +1,110 @@
+"""
+嵌入请求微批处理 - 合并线程池中并发的嵌入函数调用
+"""
+
+import logging
+import threading
+from concurrent.futures import Future
+from typing import Dict, Any, List, Callable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingMicroBatcher:
+    """嵌入函数微批处理包装（与Chroma嵌入函数接口一致）
+
+    检索、导入与响应缓存都在向量数据库线程池中同步调用嵌入函数。
+    批次中的第一个调用方等待 max_wait 秒（或凑满 max_batch_size 条时立即发出），
+    期间其他线程提交的文本合并为一次上游调用，再把结果按顺序分发回各调用方。
+    单次调用已达到 max_batch_size 条时直接按块调用上游。
+    """
+
+    def __init__(
+        self,
+        inner: Callable[[List[str]], List[List[float]]],
+        max_batch_size: int,
+        max_wait: float
+    ):
+        self.inner = inner
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait
+        self.lock = threading.Lock()
+        self.pending: List[Tuple[List[str], Future]] = []
+        self.pending_texts = 0
+        self.batch_full: Optional[threading.Event] = None
+        self.stats = {
+            "requests": 0,
+            "texts": 0,
+            "batches": 0,
+            "upstream_calls": 0,
+            "max_batch_size": 0
+        }
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        texts = list(input)
+        if not texts:
+            return []
+        if len(texts) >= self.max_batch_size:
+            with self.lock:
+                self.stats["requests"] += 1
+            return self._embed(texts)
+
+        future: Future = Future()
+        with self.lock:
+            self.stats["requests"] += 1
+            self.pending.append((texts, future))
+            self.pending_texts += len(texts)
+            leader = len(self.pending) == 1
+            if leader:
+                self.batch_full = threading.Event()
+            batch_full = self.batch_full
+            if self.pending_texts >= self.max_batch_size:
+                batch_full.set()
+
+        if leader:
+            batch_full.wait(self.max_wait)
+            with self.lock:
+                batch, self.pending, self.pending_texts = self.pending, [], 0
+                self.batch_full = None
+                self.stats["batches"] += 1
+                self.stats["max_batch_size"] = max(self.stats["max_batch_size"], sum(len(t) for t, _ in batch))
+            self._run(batch)
+        return future.result()
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        """去重后按 max_batch_size 分块调用上游，结果按输入顺序返回"""
+        unique = list(dict.fromkeys(texts))
+        vectors: Dict[str, List[float]] = {}
+        for offset in range(0, len(unique), self.max_batch_size):
+            chunk = unique[offset:offset + self.max_batch_size]
+            embedded = self.inner(chunk)
+            # 条数不符时不能按位置分发
+            if len(embedded) != len(chunk):
+                raise ValueError(f"嵌入结果数量不符: 期望 {len(chunk)}, 实际 {len(embedded)}")
+            vectors.update(zip(chunk, embedded))
+            with self.lock:
+                self.stats["upstream_calls"] += 1
+        with self.lock:
+            self.stats["texts"] += len(texts)
+        return [vectors[text] for text in texts]
+
+    def _run(self, batch: List[Tuple[List[str], Future]]):
+        """发出一个批次并把结果分发给批次内的各调用方"""
+        try:
+            vectors = self._embed([text for texts, _ in batch for text in texts])
+        except Exception as e:
+            logger.error(f"❌ 批量嵌入失败: {e}")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        offset = 0
+        for texts, future in batch:
+            future.set_result(vectors[offset:offset + len(texts)])
+            offset += len(texts)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取批处理统计"""
+        return {
+            **self.stats,
+            "avg_texts_per_call": round(self.stats["texts"] / self.stats["upstream_calls"], 2) if self.stats["upstream_calls"] else 0.0
+        }
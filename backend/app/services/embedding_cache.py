@@ -0,0 +1,239 @@
+"""
+嵌入缓存 - 基于内容哈希的持久化嵌入向量缓存
+"""
+
+import hashlib
+import json
+import logging
+import re
+import threading
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+INITIAL_CAPACITY = 1024
+
+# 每个槽位记录所属条目的 SHA-256 摘要（32字节）
+KEY_BYTES = 32
+
+
+class EmbeddingCacheStore:
+    """单个嵌入模型的磁盘缓存
+
+    向量保存在内存映射的 float32 矩阵（vectors.f32）中，每行一个槽位；
+    keys.bin 与之逐行对应，记录槽位当前所属条目的摘要；
+    index.json 记录 SHA-256(文本) -> 槽位 的映射与各槽位最近访问序号。
+    条目数超过上限时淘汰最久未访问的槽位并复用。索引落盘前进程退出时，
+    加载阶段按 keys.bin 校验，已被复用的槽位不会返回其他文本的向量。
+    """
+
+    def __init__(self, directory: Path, max_entries: int):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.vectors_path = directory / "vectors.f32"
+        self.keys_path = directory / "keys.bin"
+        self.index_path = directory / "index.json"
+        self.lock = threading.Lock()
+        self.dim: Optional[int] = None
+        self.capacity = 0
+        self.matrix: Optional[np.memmap] = None
+        self.owners: Optional[np.memmap] = None
+        self.slots: Dict[str, int] = {}
+        self.slot_keys: Dict[int, str] = {}
+        # 未使用的槽位（栈顶为最小编号）
+        self.free: List[int] = []
+        self.access = np.zeros(0, dtype=np.int64)
+        self.tick = 0
+        self.dirty = 0
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+        self._load()
+
+    def _load(self):
+        """加载已有索引与向量文件；文件不一致时重置缓存"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if not self.index_path.exists() or not self.vectors_path.exists():
+            return
+        try:
+            index = json.loads(self.index_path.read_text(encoding="utf-8"))
+            dim, capacity = int(index["dim"]), int(index["capacity"])
+            if self.vectors_path.stat().st_size != dim * capacity * 4:
+                raise ValueError("向量文件大小与索引不一致")
+            if not self.keys_path.exists() or self.keys_path.stat().st_size != capacity * KEY_BYTES:
+                raise ValueError("槽位摘要文件缺失或大小与索引不一致")
+            self.dim, self.capacity = dim, capacity
+            self.matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(capacity, dim))
+            self.owners = np.memmap(self.keys_path, dtype=np.uint8, mode="r+", shape=(capacity, KEY_BYTES))
+            # 只保留槽位摘要与索引一致的条目（索引落盘后被淘汰复用的槽位会被丢弃）
+            self.slots = {
+                key: int(slot) for key, slot in index["slots"].items()
+                if self.owners[int(slot)].tobytes() == bytes.fromhex(key)
+            }
+            stale = len(index["slots"]) - len(self.slots)
+            if stale:
+                logger.warning(f"嵌入缓存 {self.directory.name} 丢弃 {stale} 个已被复用的槽位")
+            self.slot_keys = {slot: key for key, slot in self.slots.items()}
+            self.free = [slot for slot in range(capacity - 1, -1, -1) if slot not in self.slot_keys]
+            self.access = np.zeros(capacity, dtype=np.int64)
+            for slot, tick in index.get("access", {}).items():
+                if int(slot) in self.slot_keys:
+                    self.access[int(slot)] = int(tick)
+            self.tick = int(self.access.max()) if capacity else 0
+            logger.info(f"📂 加载嵌入缓存 {self.directory.name}: {len(self.slots)} 条")
+        except Exception as e:
+            logger.warning(f"嵌入缓存损坏，已重置 {self.directory}: {e}")
+            self.dim, self.capacity, self.matrix, self.owners = None, 0, None, None
+            self.slots, self.slot_keys, self.free = {}, {}, []
+            self.access = np.zeros(0, dtype=np.int64)
+
+    def _ensure_capacity(self, dim: int, needed: int):
+        """按需扩容向量文件（翻倍增长，不超过 max_entries）"""
+        if self.dim is None:
+            self.dim = dim
+        if needed <= self.capacity:
+            return
+        new_capacity = max(INITIAL_CAPACITY, self.capacity)
+        while new_capacity < needed:
+            new_capacity *= 2
+        new_capacity = min(new_capacity, self.max_entries)
+        if new_capacity <= self.capacity:
+            return
+        if self.matrix is not None:
+            self.matrix.flush()
+            self.owners.flush()
+            del self.matrix, self.owners
+        with open(self.vectors_path, "ab") as f:
+            f.truncate(new_capacity * self.dim * 4)
+        with open(self.keys_path, "ab") as f:
+            f.truncate(new_capacity * KEY_BYTES)
+        self.matrix = np.memmap(self.vectors_path, dtype=np.float32, mode="r+", shape=(new_capacity, self.dim))
+        self.owners = np.memmap(self.keys_path, dtype=np.uint8, mode="r+", shape=(new_capacity, KEY_BYTES))
+        self.access = np.concatenate([self.access, np.zeros(new_capacity - self.capacity, dtype=np.int64)])
+        self.free.extend(range(new_capacity - 1, self.capacity - 1, -1))
+        self.free.sort(reverse=True)
+        self.capacity = new_capacity
+
+    def _free_slot(self) -> int:
+        """返回一个可写槽位：优先未使用的槽位，否则淘汰最久未访问的条目"""
+        if self.free:
+            return self.free.pop()
+        slot = int(np.argmin(self.access[:self.capacity]))
+        old_key = self.slot_keys.pop(slot, None)
+        if old_key is not None:
+            self.slots.pop(old_key, None)
+            self.stats["evictions"] += 1
+        return slot
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self.lock:
+            slot = self.slots.get(key)
+            if slot is None:
+                self.stats["misses"] += 1
+                return None
+            self.tick += 1
+            self.access[slot] = self.tick
+            self.stats["hits"] += 1
+            return np.array(self.matrix[slot])
+
+    def put(self, key: str, vector: np.ndarray):
+        with self.lock:
+            if self.dim is not None and vector.shape[0] != self.dim:
+                logger.warning(f"嵌入维度变化({self.dim} -> {vector.shape[0]})，跳过缓存写入")
+                return
+            slot = self.slots.get(key)
+            if slot is None:
+                self._ensure_capacity(vector.shape[0], len(self.slots) + 1)
+                slot = self._free_slot()
+                self.slots[key] = slot
+                self.slot_keys[slot] = key
+                # 先清除槽位摘要，向量写完后再登记新的所属条目
+                self.owners[slot] = 0
+                self.matrix[slot] = vector
+                self.owners[slot] = np.frombuffer(bytes.fromhex(key), dtype=np.uint8)
+            else:
+                self.matrix[slot] = vector
+            self.tick += 1
+            self.access[slot] = self.tick
+            self.dirty += 1
+            if self.dirty >= settings.EMBEDDING_CACHE_FLUSH_EVERY:
+                self._flush_locked()
+
+    def _flush_locked(self):
+        if self.matrix is None:
+            return
+        self.matrix.flush()
+        self.owners.flush()
+        index = {
+            "dim": self.dim,
+            "capacity": self.capacity,
+            "slots": self.slots,
+            "access": {str(slot): int(self.access[slot]) for slot in self.slot_keys}
+        }
+        tmp_path = self.index_path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(index), encoding="utf-8")
+        tmp_path.replace(self.index_path)
+        self.dirty = 0
+
+    def flush(self):
+        """将向量与索引写回磁盘"""
+        with self.lock:
+            if self.dirty:
+                self._flush_locked()
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "entries": len(self.slots),
+            "capacity": self.capacity,
+            "dim": self.dim,
+            "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0
+        }
+
+
+class CachedEmbeddingFunction:
+    """包装Chroma嵌入函数：按 (模型名, SHA-256(文本)) 命中缓存，仅对未命中的文本调用底层函数"""
+
+    def __init__(self, inner, model_name: str):
+        self.inner = inner
+        self.model_name = model_name
+        safe_name = re.sub(r"[^A-Za-z0-9_.-]", "_", model_name)
+        self.store = EmbeddingCacheStore(
+            Path(settings.EMBEDDING_CACHE_DIR) / safe_name,
+            settings.EMBEDDING_CACHE_MAX_ENTRIES
+        )
+
+    @staticmethod
+    def _key(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        texts = list(input)
+        keys = [self._key(text) for text in texts]
+        results: List[Optional[np.ndarray]] = [self.store.get(key) for key in keys]
+
+        # 对未命中的文本去重后批量嵌入
+        missing: Dict[str, str] = {}
+        for text, key, vector in zip(texts, keys, results):
+            if vector is None and key not in missing:
+                missing[key] = text
+        if missing:
+            vectors = self.inner(list(missing.values()))
+            computed = {}
+            for key, vector in zip(missing.keys(), vectors):
+                array = np.asarray(vector, dtype=np.float32)
+                computed[key] = array
+                self.store.put(key, array)
+            results = [computed[key] if vector is None else vector for key, vector in zip(keys, results)]
+
+        return [vector.tolist() for vector in results]
+
+    def flush(self):
+        self.store.flush()
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"model": self.model_name, **self.store.get_stats()}
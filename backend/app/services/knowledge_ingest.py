@@ -0,0 +1,292 @@
+"""
+知识批量导入 - 流式解析 NDJSON/CSV，分批并发嵌入并写入向量存储
+"""
+
+import asyncio
+import codecs
+import csv
+import hashlib
+import io
+import json
+import logging
+import re
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple, AsyncIterator, Set, IO
+
+from app.core.config import settings
+from .vector_db import vector_db_service
+
+logger = logging.getLogger(__name__)
+
+# (行号, 原始记录, 解析错误)
+ParsedRow = Tuple[int, Optional[Dict[str, Any]], Optional[str]]
+
+KEYWORD_SEPARATORS = re.compile(r"[;,|；，、]")
+
+# 完成报告中最多返回的错误行数
+MAX_REPORTED_ERRORS = 20
+
+
+# 从暂存文件读取请求体的块大小
+SPOOL_READ_SIZE = 64 * 1024
+
+
+async def spool_body(chunks: AsyncIterator[bytes]) -> IO[bytes]:
+    """把请求体完整读入临时文件（超过 BULK_INGEST_SPOOL_MEMORY_BYTES 后写入磁盘）
+
+    流式响应开始后 Starlette 会同时监听客户端断开并消费请求体消息，
+    因此请求体必须在返回响应前读完。
+    """
+    spool = tempfile.SpooledTemporaryFile(max_size=settings.BULK_INGEST_SPOOL_MEMORY_BYTES)
+    try:
+        async for chunk in chunks:
+            spool.write(chunk)
+    except BaseException:
+        spool.close()
+        raise
+    spool.seek(0)
+    return spool
+
+
+async def iter_file(file: IO[bytes]) -> AsyncIterator[bytes]:
+    """按块读取暂存的请求体"""
+    while True:
+        chunk = file.read(SPOOL_READ_SIZE)
+        if not chunk:
+            return
+        yield chunk
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """将字节流按行切分（保留换行符，兼容UTF-8 BOM与跨块的多字节字符）"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    async for chunk in chunks:
+        buffer += decoder.decode(chunk)
+        *lines, buffer = buffer.split("\n")
+        for line in lines:
+            yield line + "\n"
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer
+
+
+async def parse_ndjson(lines: AsyncIterator[str]) -> AsyncIterator[ParsedRow]:
+    """逐行解析 NDJSON，每行一个JSON对象"""
+    line_no = 0
+    async for line in lines:
+        line_no += 1
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            raw = json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_no, None, f"JSON解析失败: {e}"
+            continue
+        if not isinstance(raw, dict):
+            yield line_no, None, "每行必须是JSON对象"
+            continue
+        yield line_no, raw, None
+
+
+async def parse_csv(lines: AsyncIterator[str]) -> AsyncIterator[ParsedRow]:
+    """逐条解析带表头的 CSV（content,category,keywords[,id]），支持引号内换行"""
+    header: Optional[List[str]] = None
+    pending = ""
+    start_line = line_no = 0
+    async for line in lines:
+        line_no += 1
+        if not pending:
+            start_line = line_no
+        pending += line
+        # 引号未闭合时继续读取下一行
+        if pending.count('"') % 2:
+            continue
+        text, pending = pending, ""
+        if not text.strip():
+            continue
+        try:
+            values = next(csv.reader(io.StringIO(text)))
+        except (csv.Error, StopIteration) as e:
+            yield start_line, None, f"CSV解析失败: {e}"
+            continue
+        if header is None:
+            header = [name.strip().lower() for name in values]
+            if "content" not in header:
+                raise ValueError("CSV表头缺少 content 列")
+            continue
+        yield start_line, dict(zip(header, values)), None
+    if pending.strip():
+        yield start_line, None, "CSV引号未闭合"
+
+
+def to_record(raw: Dict[str, Any], source: str) -> Dict[str, Any]:
+    """校验并规范化一条知识记录；未提供ID时按内容哈希生成（重复导入时覆盖而非重复）"""
+    content = str(raw.get("content") or "").strip()
+    if not content:
+        raise ValueError("缺少 content")
+    keywords = raw.get("keywords") or []
+    if isinstance(keywords, str):
+        keywords = [k.strip() for k in KEYWORD_SEPARATORS.split(keywords) if k.strip()]
+    elif not isinstance(keywords, (list, tuple)):
+        raise ValueError("keywords 必须是字符串或数组")
+    metadata = raw.get("metadata") or {}
+    if not isinstance(metadata, dict):
+        raise ValueError("metadata 必须是JSON对象")
+    doc_id = str(raw.get("id") or "").strip() or f"doc_{hashlib.sha1(content.encode('utf-8')).hexdigest()[:16]}"
+    # 附加元数据（如文档分块的章节与页码），只保留向量存储支持的标量值
+    extra = {
+        key: value for key, value in metadata.items()
+        if isinstance(value, (str, int, float, bool))
+    }
+    return {
+        "id": doc_id,
+        "content": content,
+        "metadata": {
+            **extra,
+            "category": str(raw.get("category") or "未分类"),
+            "keywords": json.dumps([str(k) for k in keywords], ensure_ascii=False),
+            "source": source,
+            "created_at": datetime.now().isoformat()
+        }
+    }
+
+
+class KnowledgeIngestor:
+    """批量导入流水线
+
+    输入按 BULK_INGEST_BATCH_SIZE 分批，最多 BULK_INGEST_EMBED_CONCURRENCY 批同时嵌入与写入；
+    并发批次已满时暂停读取输入，内存只保留在途批次。每批完成后产出一条进度事件。
+    """
+
+    def __init__(self):
+        self.stats = {
+            "jobs": 0,
+            "documents": 0,
+            "skipped": 0,
+            "batches": 0,
+            "failed_batches": 0,
+            "last_docs_per_second": 0.0
+        }
+
+    async def _run_batch(self, batch_no: int, batch: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        records = list(batch.values())
+        result = {"type": "batch", "batch": batch_no, "documents": len(records)}
+        try:
+            timings = await vector_db_service.upsert_knowledge_batch(
+                [r["id"] for r in records],
+                [r["content"] for r in records],
+                [r["metadata"] for r in records]
+            )
+            elapsed = timings["embed_seconds"] + timings["upsert_seconds"]
+            result.update(
+                success=True,
+                **timings,
+                docs_per_second=round(len(records) / elapsed, 2) if elapsed > 0 else None
+            )
+        except Exception as e:
+            logger.error(f"❌ 知识批次 {batch_no} 写入失败: {e}")
+            result.update(success=False, error=str(e))
+        return result
+
+    async def ingest(self, rows: AsyncIterator[ParsedRow], source: str = "bulk") -> AsyncIterator[Dict[str, Any]]:
+        """消费解析后的记录，产出每批进度事件与最终汇总"""
+        batch_size = max(1, settings.BULK_INGEST_BATCH_SIZE)
+        concurrency = max(1, settings.BULK_INGEST_EMBED_CONCURRENCY)
+        started = time.monotonic()
+        totals = {"documents": 0, "skipped": 0, "batches": 0, "failed_batches": 0}
+        errors: List[Dict[str, Any]] = []
+        pending: Set[asyncio.Task] = set()
+        # 同一批次内ID重复时保留最后一条
+        batch: Dict[str, Dict[str, Any]] = {}
+        self.stats["jobs"] += 1
+
+        def progress(result: Dict[str, Any]) -> Dict[str, Any]:
+            totals["batches"] += 1
+            if result["success"]:
+                totals["documents"] += result["documents"]
+            else:
+                totals["failed_batches"] += 1
+            elapsed = time.monotonic() - started
+            return {
+                **result,
+                "total_documents": totals["documents"],
+                "elapsed_seconds": round(elapsed, 3),
+                "overall_docs_per_second": round(totals["documents"] / elapsed, 2) if elapsed > 0 else None
+            }
+
+        try:
+            batch_no = 0
+            exhausted = False
+            rows_iter = rows.__aiter__()
+            while not exhausted or batch or pending:
+                # 读取输入直到凑满一批（并发批次已满时不读取，形成背压）
+                while not exhausted and len(batch) < batch_size and len(pending) < concurrency:
+                    try:
+                        line_no, raw, error = await rows_iter.__anext__()
+                    except StopAsyncIteration:
+                        exhausted = True
+                        break
+                    if error is None:
+                        try:
+                            record = to_record(raw, source)
+                            batch[record["id"]] = record
+                            continue
+                        except ValueError as e:
+                            error = str(e)
+                    totals["skipped"] += 1
+                    if len(errors) < MAX_REPORTED_ERRORS:
+                        errors.append({"line": line_no, "error": error})
+
+                if batch and len(pending) < concurrency and (len(batch) >= batch_size or exhausted):
+                    batch_no += 1
+                    pending.add(asyncio.create_task(self._run_batch(batch_no, batch)))
+                    batch = {}
+                    continue
+
+                if pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in sorted(done, key=lambda t: t.result()["batch"]):
+                        yield progress(task.result())
+        finally:
+            # 客户端中途断开时取消在途批次
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+
+        await vector_db_service.refresh_document_matrix()
+        # 批量导入结束后立即落盘，不必等到累计写入量达到阈值
+        await vector_db_service.flush_store()
+        elapsed = time.monotonic() - started
+        docs_per_second = round(totals["documents"] / elapsed, 2) if elapsed > 0 else 0.0
+        self.stats["documents"] += totals["documents"]
+        self.stats["skipped"] += totals["skipped"]
+        self.stats["batches"] += totals["batches"]
+        self.stats["failed_batches"] += totals["failed_batches"]
+        self.stats["last_docs_per_second"] = docs_per_second
+        logger.info(
+            f"✅ 知识批量导入完成: {totals['documents']} 条, 跳过 {totals['skipped']} 条, "
+            f"{totals['batches']} 批, {docs_per_second} 条/秒"
+        )
+        yield {
+            "type": "done",
+            "success": totals["failed_batches"] == 0,
+            **totals,
+            "elapsed_seconds": round(elapsed, 3),
+            "docs_per_second": docs_per_second,
+            "errors": errors
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "batch_size": settings.BULK_INGEST_BATCH_SIZE,
+            "embed_concurrency": settings.BULK_INGEST_EMBED_CONCURRENCY,
+            **self.stats
+        }
+
+# 全局实例
+knowledge_ingestor = KnowledgeIngestor()
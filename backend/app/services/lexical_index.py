@@ -0,0 +1,203 @@
+"""
+词法索引 - 基于倒排表的 BM25 检索（中文字符 n-gram + 英文/数字词元）
+"""
+
+import heapq
+import json
+import logging
+import math
+import re
+import threading
+import time
+from collections import Counter
+from typing import Dict, Any, List, Optional
+
+from .vector_store import metadata_matches
+
+logger = logging.getLogger(__name__)
+
+# 中文连续片段与英文/数字词元（产品代码如 INV001 作为一个词元）
+TOKEN_PATTERN = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff]+|[a-z0-9]+")
+CJK_PATTERN = re.compile(r"[\u3400-\u4dbf\u4e00-\u9fff]")
+
+
+def tokenize(text: str) -> List[str]:
+    """分词：中文片段切分为字符二元与三元组（单字片段保留单字），英文按词"""
+    tokens: List[str] = []
+    for piece in TOKEN_PATTERN.findall((text or "").lower()):
+        if not CJK_PATTERN.match(piece):
+            tokens.append(piece)
+            continue
+        if len(piece) == 1:
+            tokens.append(piece)
+            continue
+        for n in (2, 3):
+            tokens.extend(piece[i:i + n] for i in range(len(piece) - n + 1))
+    return tokens
+
+
+def _keywords(metadata: Optional[Dict[str, Any]]) -> List[str]:
+    """解析元数据中的关键词（写入时为JSON字符串）"""
+    raw = (metadata or {}).get("keywords")
+    if isinstance(raw, str):
+        try:
+            parsed = json.loads(raw)
+        except Exception:
+            return [raw]
+        return [str(k) for k in parsed] if isinstance(parsed, list) else [str(parsed)]
+    if isinstance(raw, list):
+        return [str(k) for k in raw]
+    return []
+
+
+def _index_document(
+    postings: Dict[str, Dict[str, int]],
+    doc_lengths: Dict[str, int],
+    docs: Dict[str, Dict[str, Any]],
+    doc_id: str,
+    document: str,
+    metadata: Optional[Dict[str, Any]]
+) -> int:
+    """把一篇文档写入给定的倒排表与文档表，返回其词元数"""
+    counts = Counter(tokenize(" ".join([document or "", *_keywords(metadata)])))
+    for term, tf in counts.items():
+        postings.setdefault(term, {})[doc_id] = tf
+    length = sum(counts.values())
+    doc_lengths[doc_id] = length
+    docs[doc_id] = {"content": document, "metadata": metadata or {}, "terms": list(counts)}
+    return length
+
+
+class BM25Index:
+    """增量维护的 BM25 倒排索引
+
+    文档正文与关键词元数据一起建索引；写入时更新倒排表与文档长度，
+    查询只遍历查询词元命中的倒排列表。
+    """
+
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.lock = threading.Lock()
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.doc_lengths: Dict[str, int] = {}
+        self.docs: Dict[str, Dict[str, Any]] = {}
+        self.total_length = 0
+        self.stats = {"searches": 0, "total_search_seconds": 0.0}
+
+    def _remove_locked(self, doc_id: str):
+        length = self.doc_lengths.pop(doc_id, None)
+        if length is None:
+            return
+        self.total_length -= length
+        terms = self.docs.pop(doc_id)["terms"]
+        for term in terms:
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            posting.pop(doc_id, None)
+            if not posting:
+                del self.postings[term]
+
+    def add(
+        self,
+        ids: List[str],
+        documents: List[str],
+        metadatas: Optional[List[Dict[str, Any]]] = None
+    ):
+        """写入文档（ID已存在时覆盖）"""
+        metadatas = metadatas or [{} for _ in ids]
+        with self.lock:
+            for doc_id, document, metadata in zip(ids, documents, metadatas):
+                self._remove_locked(doc_id)
+                self.total_length += _index_document(
+                    self.postings, self.doc_lengths, self.docs, doc_id, document, metadata
+                )
+
+    def remove(self, ids: List[str]):
+        with self.lock:
+            for doc_id in ids:
+                self._remove_locked(doc_id)
+
+    def rebuild(
+        self,
+        ids: List[str],
+        documents: List[str],
+        metadatas: Optional[List[Dict[str, Any]]] = None
+    ):
+        """全量重建：在锁外构建新的倒排表，完成后在锁内整体替换
+
+        重建期间的查询仍使用旧索引，不会看到清空或只建了一部分的索引。
+        """
+        metadatas = metadatas or [{} for _ in ids]
+        postings: Dict[str, Dict[str, int]] = {}
+        doc_lengths: Dict[str, int] = {}
+        docs: Dict[str, Dict[str, Any]] = {}
+        total_length = 0
+        for doc_id, document, metadata in zip(ids, documents, metadatas):
+            if doc_id in docs:
+                # 同一ID出现多次时保留最后一条（与 add 的覆盖语义一致）
+                total_length -= doc_lengths[doc_id]
+                for term in docs[doc_id]["terms"]:
+                    postings[term].pop(doc_id, None)
+                    if not postings[term]:
+                        del postings[term]
+            total_length += _index_document(postings, doc_lengths, docs, doc_id, document, metadata)
+        with self.lock:
+            self.postings, self.doc_lengths, self.docs = postings, doc_lengths, docs
+            self.total_length = total_length
+        logger.info(f"🔤 BM25索引已重建: {len(docs)} 条, {len(postings)} 个词元")
+
+    def search(
+        self,
+        query: str,
+        limit: int,
+        where: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """返回 BM25 得分最高的 limit 条（where 为元数据过滤条件）
+
+        distance 为 1 - 查询词元覆盖率（与向量检索的距离同为越小越相关），
+        原始得分记录在 bm25 字段中。
+        """
+        terms = set(tokenize(query))
+        if not terms or limit <= 0:
+            return []
+        started = time.monotonic()
+        with self.lock:
+            n = len(self.doc_lengths)
+            if n == 0:
+                return []
+            avg_length = self.total_length / n
+            scores: Dict[str, float] = {}
+            matched: Counter = Counter()
+            for term in terms:
+                posting = self.postings.get(term)
+                if not posting:
+                    continue
+                idf = math.log(1 + (n - len(posting) + 0.5) / (len(posting) + 0.5))
+                for doc_id, tf in posting.items():
+                    if where and not metadata_matches(self.docs[doc_id]["metadata"], where):
+                        continue
+                    norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / avg_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+                    matched[doc_id] += 1
+            top = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+            results = [{
+                "content": self.docs[doc_id]["content"],
+                "metadata": self.docs[doc_id]["metadata"],
+                "distance": round(1.0 - matched[doc_id] / len(terms), 6),
+                "id": doc_id,
+                "bm25": round(score, 6)
+            } for doc_id, score in top]
+        self.stats["searches"] += 1
+        self.stats["total_search_seconds"] += time.monotonic() - started
+        return results
+
+    def get_stats(self) -> Dict[str, Any]:
+        searches = self.stats["searches"]
+        return {
+            "documents": len(self.doc_lengths),
+            "terms": len(self.postings),
+            "searches": searches,
+            "avg_search_ms": round(self.stats["total_search_seconds"] / searches * 1000, 4) if searches else 0.0
+        }
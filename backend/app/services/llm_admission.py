@@ -0,0 +1,179 @@
+"""
+LLM准入控制 - 按提供商自适应并发上限（AIMD）与限流退避
+"""
+
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from typing import Dict, Any, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderRateLimitError(Exception):
+    """提供商返回限流（HTTP 429 或等价错误码）"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class AdmissionRejectedError(Exception):
+    """等待队列已满或排队超时"""
+
+
+def _parse_retry_after(headers) -> Optional[float]:
+    if not headers:
+        return None
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def rate_limit_delay(error: Exception) -> Optional[float]:
+    """判断异常是否为限流；是则返回建议等待秒数（未知时为0），否则返回None"""
+    if isinstance(error, ProviderRateLimitError):
+        return error.retry_after or 0.0
+    status = getattr(error, "status_code", None)
+    response = getattr(error, "response", None)
+    if status is None and response is not None:
+        status = getattr(response, "status_code", None)
+    if status != 429:
+        return None
+    headers = getattr(response, "headers", None) if response is not None else None
+    return _parse_retry_after(headers) or 0.0
+
+
+def backoff_delay(attempt: int, retry_after: float) -> float:
+    """限流重试的等待时间：优先遵循 Retry-After（附加少量抖动），否则使用全抖动指数退避"""
+    if retry_after > 0:
+        delay = retry_after * (1.0 + random.uniform(0, 0.25))
+    else:
+        delay = random.uniform(0, settings.LLM_RATE_LIMIT_BASE_BACKOFF * (2 ** attempt))
+    return min(delay, settings.LLM_RATE_LIMIT_MAX_BACKOFF)
+
+
+class AdaptiveConcurrencyLimiter:
+    """单个提供商的自适应并发限制器
+
+    成功时并发上限加性增长（每轮约 +1），遇到限流时乘性下降；
+    超过上限的请求进入有界等待队列，排队超过期限则拒绝。
+    """
+
+    def __init__(self, provider: str):
+        self.provider = provider
+        self.limit = float(settings.LLM_ADMISSION_INITIAL_LIMIT)
+        self.in_flight = 0
+        self.waiters: deque = deque()
+        self.last_decrease = 0.0
+        self.stats = {
+            "admitted": 0,
+            "queued": 0,
+            "rejected": 0,
+            "queue_timeouts": 0,
+            "rate_limited": 0,
+            "total_wait": 0.0,
+            "max_wait": 0.0
+        }
+
+    async def acquire(self, timeout: Optional[float] = None):
+        """获取并发名额；队列已满或等待超时抛出 AdmissionRejectedError"""
+        if self.in_flight < int(self.limit) and not self.waiters:
+            self.in_flight += 1
+            self.stats["admitted"] += 1
+            return
+
+        if len(self.waiters) >= settings.LLM_ADMISSION_MAX_QUEUE:
+            self.stats["rejected"] += 1
+            raise AdmissionRejectedError(f"{self.provider} 等待队列已满")
+
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.append(future)
+        self.stats["queued"] += 1
+        started = time.monotonic()
+        wait_timeout = settings.LLM_ADMISSION_QUEUE_TIMEOUT if timeout is None else timeout
+        try:
+            await asyncio.wait_for(future, timeout=wait_timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if future.done() and not future.cancelled():
+                # 名额已分配但调用方已放弃，归还名额
+                self.release()
+            else:
+                try:
+                    self.waiters.remove(future)
+                except ValueError:
+                    pass
+            if isinstance(e, asyncio.TimeoutError):
+                self.stats["queue_timeouts"] += 1
+                raise AdmissionRejectedError(
+                    f"{self.provider} 排队超过 {wait_timeout:.1f}s"
+                ) from None
+            raise
+        finally:
+            waited = time.monotonic() - started
+            self.stats["total_wait"] += waited
+            self.stats["max_wait"] = max(self.stats["max_wait"], waited)
+        self.stats["admitted"] += 1
+
+    def release(self, success: bool = False, rate_limited: bool = False):
+        """归还名额，并按调用结果调整并发上限"""
+        self.in_flight = max(0, self.in_flight - 1)
+        if rate_limited:
+            self.stats["rate_limited"] += 1
+            now = time.monotonic()
+            # 同一波限流只下调一次
+            if now - self.last_decrease >= settings.LLM_ADMISSION_DECREASE_INTERVAL:
+                self.limit = max(
+                    float(settings.LLM_ADMISSION_MIN_LIMIT),
+                    self.limit * settings.LLM_ADMISSION_BACKOFF_RATIO
+                )
+                self.last_decrease = now
+                logger.warning(f"🚦 {self.provider} 触发限流，并发上限下调至 {self.limit:.1f}")
+        elif success:
+            self.limit = min(float(settings.LLM_ADMISSION_MAX_LIMIT), self.limit + 1.0 / self.limit)
+        self._wake()
+
+    def _wake(self):
+        while self.waiters and self.in_flight < int(self.limit):
+            future = self.waiters.popleft()
+            if future.done():
+                continue
+            self.in_flight += 1
+            future.set_result(True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        waits = self.stats["queued"]
+        return {
+            "limit": round(self.limit, 2),
+            "in_flight": self.in_flight,
+            "queue_depth": len(self.waiters),
+            **{k: v for k, v in self.stats.items() if k != "total_wait"},
+            "max_wait": round(self.stats["max_wait"], 4),
+            "avg_wait": round(self.stats["total_wait"] / waits, 4) if waits else 0.0
+        }
+
+
+class AdmissionController:
+    """各提供商的准入控制器集合"""
+
+    def __init__(self):
+        self.limiters: Dict[str, AdaptiveConcurrencyLimiter] = {}
+
+    def limiter(self, provider: str) -> AdaptiveConcurrencyLimiter:
+        if provider not in self.limiters:
+            self.limiters[provider] = AdaptiveConcurrencyLimiter(provider)
+        return self.limiters[provider]
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": settings.LLM_ADMISSION_ENABLED,
+            "providers": {p: limiter.get_stats() for p, limiter in self.limiters.items()}
+        }
@@ -0,0 +1,318 @@
+"""
+LLM路由 - 提供商延迟统计、熔断器、健康度排序与请求合并
+"""
+
+import asyncio
+import contextvars
+import logging
+import time
+from collections import deque
+from typing import Dict, Any, List, Optional, Callable, Awaitable
+
+from app.core.config import settings
+from app.core.deadline import DeadlineExceededError, current_deadline, remaining_timeout
+
+logger = logging.getLogger(__name__)
+
+
+class ProviderTelemetry:
+    """提供商延迟滑动窗口与对冲请求统计"""
+
+    def __init__(self):
+        self.latencies: Dict[str, deque] = {}
+        # "primary->secondary" -> 计数
+        self.hedge_stats: Dict[str, Dict[str, int]] = {}
+
+    def record_latency(self, provider: str, seconds: float):
+        """记录一次成功调用的耗时"""
+        window = self.latencies.setdefault(provider, deque(maxlen=settings.LLM_LATENCY_WINDOW))
+        window.append(seconds)
+
+    def percentile(self, provider: str, q: float) -> Optional[float]:
+        """滑动窗口内的延迟分位数（样本不足时返回None）"""
+        window = self.latencies.get(provider)
+        if not window or len(window) < settings.LLM_HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(window)
+        index = min(len(ordered) - 1, max(0, int(round(q * (len(ordered) - 1)))))
+        return ordered[index]
+
+    def mean_latency(self, provider: str) -> Optional[float]:
+        """滑动窗口内的平均延迟（无样本时返回None）"""
+        window = self.latencies.get(provider)
+        if not window:
+            return None
+        return sum(window) / len(window)
+
+    def hedge_delay(self, provider: str) -> float:
+        """对冲触发阈值：主提供商的滚动分位延迟，样本不足时使用默认值"""
+        threshold = self.percentile(provider, settings.LLM_HEDGE_PERCENTILE)
+        if threshold is None:
+            threshold = settings.LLM_HEDGE_DEFAULT_DELAY
+        return max(settings.LLM_HEDGE_MIN_DELAY, threshold)
+
+    def _pair(self, primary: str, secondary: str) -> Dict[str, int]:
+        return self.hedge_stats.setdefault(f"{primary}->{secondary}", {
+            "requests": 0,
+            "hedged": 0,
+            "primary_wins": 0,
+            "secondary_wins": 0,
+            "both_failed": 0,
+            "failovers": 0,
+            "failover_successes": 0
+        })
+
+    def record_request(self, primary: str, secondary: str):
+        """记录一次可对冲的请求"""
+        self._pair(primary, secondary)["requests"] += 1
+
+    def record_hedge(self, primary: str, secondary: str, winner: Optional[str]):
+        """记录一次已发出的对冲请求及其胜者（None表示两者均失败）"""
+        stats = self._pair(primary, secondary)
+        stats["hedged"] += 1
+        if winner == primary:
+            stats["primary_wins"] += 1
+        elif winner == secondary:
+            stats["secondary_wins"] += 1
+        else:
+            stats["both_failed"] += 1
+
+    def record_failover(self, primary: str, secondary: str, succeeded: bool):
+        """记录一次主提供商在对冲阈值内失败、改由备用提供商处理的请求（不计入对冲）"""
+        stats = self._pair(primary, secondary)
+        stats["failovers"] += 1
+        if succeeded:
+            stats["failover_successes"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取延迟分位与对冲统计"""
+        latency = {}
+        for provider, window in self.latencies.items():
+            ordered = sorted(window)
+            latency[provider] = {
+                "samples": len(ordered),
+                "p50": ordered[len(ordered) // 2] if ordered else None,
+                "p90": self.percentile(provider, 0.9),
+                "hedge_delay": self.hedge_delay(provider)
+            }
+
+        hedging = {}
+        for pair, stats in self.hedge_stats.items():
+            hedging[pair] = {
+                **stats,
+                "hedge_rate": round(stats["hedged"] / stats["requests"], 4) if stats["requests"] else 0.0,
+                "secondary_win_rate": round(stats["secondary_wins"] / stats["hedged"], 4) if stats["hedged"] else 0.0
+            }
+
+        return {
+            "hedging_enabled": settings.LLM_HEDGING_ENABLED,
+            "latency": latency,
+            "hedging": hedging
+        }
+
+
+class CircuitBreaker:
+    """单个提供商的熔断器：closed -> open -> half_open -> closed"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, provider: str):
+        self.provider = provider
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.times_opened = 0
+
+    def available(self) -> bool:
+        """是否可以参与路由（open 状态冷却结束后转为 half_open）"""
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < settings.LLM_BREAKER_OPEN_SECONDS:
+                return False
+            self.state = self.HALF_OPEN
+            self.probe_in_flight = False
+            logger.info(f"🟡 {self.provider} 熔断冷却结束，进入半开探测")
+        if self.state == self.HALF_OPEN:
+            return not self.probe_in_flight
+        return True
+
+    def acquire(self) -> bool:
+        """获取调用许可；half_open 状态下只放行一个探测请求"""
+        if not self.available():
+            return False
+        if self.state == self.HALF_OPEN:
+            self.probe_in_flight = True
+        return True
+
+    def release(self):
+        """调用结束（含取消）后释放探测名额"""
+        self.probe_in_flight = False
+
+    def record_success(self):
+        self.consecutive_failures = 0
+        if self.state != self.CLOSED:
+            self.state = self.CLOSED
+            logger.info(f"🟢 {self.provider} 探测成功，熔断器关闭")
+
+    def record_failure(self, error_rate_exceeded: bool = False):
+        self.consecutive_failures += 1
+        should_open = (
+            self.state == self.HALF_OPEN
+            or self.consecutive_failures >= settings.LLM_BREAKER_FAILURE_THRESHOLD
+            or error_rate_exceeded
+        )
+        if should_open and self.state != self.OPEN:
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self.times_opened += 1
+            logger.warning(
+                f"🔴 {self.provider} 熔断器打开（连续失败 {self.consecutive_failures} 次），"
+                f"{settings.LLM_BREAKER_OPEN_SECONDS:.0f}s 后半开探测"
+            )
+
+
+class ProviderRouter:
+    """按健康度（滚动错误率与延迟）排序提供商，并跳过熔断中的提供商"""
+
+    def __init__(self, telemetry: ProviderTelemetry):
+        self.telemetry = telemetry
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        # 最近调用结果：True 成功 / False 失败
+        self.outcomes: Dict[str, deque] = {}
+
+    def _breaker(self, provider: str) -> CircuitBreaker:
+        if provider not in self.breakers:
+            self.breakers[provider] = CircuitBreaker(provider)
+        return self.breakers[provider]
+
+    def _outcomes(self, provider: str) -> deque:
+        return self.outcomes.setdefault(provider, deque(maxlen=settings.LLM_ROUTER_OUTCOME_WINDOW))
+
+    def error_rate(self, provider: str) -> float:
+        window = self.outcomes.get(provider)
+        if not window:
+            return 0.0
+        return 1.0 - sum(window) / len(window)
+
+    def health_score(self, provider: str) -> float:
+        """健康度：成功率减去延迟惩罚（延迟按 LLM_ROUTER_LATENCY_SCALE 归一化）"""
+        score = 1.0 - self.error_rate(provider)
+        latency = self.telemetry.mean_latency(provider)
+        if latency is not None:
+            score -= 0.5 * min(latency / settings.LLM_ROUTER_LATENCY_SCALE, 1.0)
+        return score
+
+    def order(self, providers: List[str], preferred: Optional[str] = None) -> List[str]:
+        """返回可用提供商：半开探测优先，其余按健康度降序（首选提供商有加分）
+
+        半开提供商排在最前，使探测请求尽快发生；探测失败时调用方会继续尝试下一个提供商。
+        """
+        candidates = [p for p in providers if self._breaker(p).available()]
+
+        def rank(provider: str):
+            bonus = settings.LLM_ROUTER_PREFERENCE_BONUS if provider == preferred else 0.0
+            probing = self._breaker(provider).state == CircuitBreaker.HALF_OPEN
+            return (probing, self.health_score(provider) + bonus)
+
+        return sorted(candidates, key=rank, reverse=True)
+
+    def acquire(self, provider: str) -> bool:
+        return self._breaker(provider).acquire()
+
+    def release(self, provider: str):
+        self._breaker(provider).release()
+
+    def record_success(self, provider: str):
+        self._outcomes(provider).append(True)
+        self._breaker(provider).record_success()
+
+    def record_failure(self, provider: str):
+        window = self._outcomes(provider)
+        window.append(False)
+        error_rate_exceeded = (
+            len(window) >= settings.LLM_BREAKER_MIN_REQUESTS
+            and self.error_rate(provider) >= settings.LLM_BREAKER_ERROR_RATE
+        )
+        self._breaker(provider).record_failure(error_rate_exceeded)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取各提供商的熔断状态与健康度"""
+        return {
+            provider: {
+                "state": breaker.state,
+                "consecutive_failures": breaker.consecutive_failures,
+                "times_opened": breaker.times_opened,
+                "error_rate": round(self.error_rate(provider), 4),
+                "health_score": round(self.health_score(provider), 4)
+            }
+            for provider, breaker in self.breakers.items()
+        }
+
+
+class SingleFlight:
+    """合并相同的在途请求：同一个键同时只发起一次上游调用，其余调用方等待共享结果
+
+    共享调用在独立的空上下文中运行，不继承发起方的截止时间；每个调用方按自己的
+    截止时间（不超过 LLM_SINGLEFLIGHT_TIMEOUT 秒）等待。当所有等待方都已放弃
+    （超时或被取消）时，取消共享的上游调用，避免挂起的请求长期占用资源。
+    """
+
+    def __init__(self):
+        # key -> {"task": asyncio.Task, "waiters": int}
+        self.calls: Dict[str, Dict[str, Any]] = {}
+        self.stats = {
+            "upstream_calls": 0,
+            "coalesced": 0,
+            "timeouts": 0,
+            "cancelled_upstream": 0
+        }
+
+    def _forget(self, key: str, task: asyncio.Task):
+        call = self.calls.get(key)
+        if call is not None and call["task"] is task:
+            del self.calls[key]
+
+    async def do(
+        self,
+        key: str,
+        factory: Callable[[], Awaitable[Any]],
+        timeout: Optional[float] = None
+    ) -> Any:
+        """执行或加入键为 key 的调用（timeout 未指定时为 LLM_SINGLEFLIGHT_TIMEOUT 与当前请求剩余时间的较小值）"""
+        timeout = remaining_timeout(settings.LLM_SINGLEFLIGHT_TIMEOUT) if timeout is None else timeout
+        call = self.calls.get(key)
+        if call is None:
+            # 发起方的截止时间只约束它自己的等待，不能让共享调用随其提前超时
+            task = asyncio.create_task(factory(), context=contextvars.Context())
+            call = {"task": task, "waiters": 0}
+            self.calls[key] = call
+            task.add_done_callback(lambda t, k=key: self._forget(k, t))
+            self.stats["upstream_calls"] += 1
+        else:
+            self.stats["coalesced"] += 1
+
+        call["waiters"] += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(call["task"]), timeout=timeout)
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+            deadline = current_deadline()
+            if deadline is not None and deadline.expired:
+                raise DeadlineExceededError(f"LLM调用: 请求已超过 {deadline.timeout:.1f}s 时间预算") from None
+            raise asyncio.TimeoutError(f"等待共享请求结果超过 {timeout:.1f}s") from None
+        finally:
+            call["waiters"] -= 1
+            if call["waiters"] == 0 and not call["task"].done():
+                call["task"].cancel()
+                self.stats["cancelled_upstream"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取请求合并统计"""
+        total = self.stats["upstream_calls"] + self.stats["coalesced"]
+        return {
+            **self.stats,
+            "in_flight": len(self.calls),
+            "coalesce_rate": round(self.stats["coalesced"] / total, 4) if total else 0.0
+        }
@@ -2,19 +2,58 @@
 LLM服务 - 大语言模型接口
 """
 
+import copy
 import logging
 import json
+import time
+import hashlib
+import asyncio
 import aiohttp
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple, AsyncIterator
 from datetime import datetime
 
+import httpx
 import openai
 import anthropic
 
 from app.core.config import settings
+from app.core.deadline import (
+    Deadline,
+    DeadlineExceededError,
+    current_deadline,
+    deadline_scope,
+    remaining_timeout,
+    run_with_deadline,
+)
+from .response_cache import response_cache
+from .llm_routing import ProviderTelemetry, ProviderRouter, SingleFlight
+from .prompt_context import prompt_context_builder, count_tokens
+from .mock_llm import MockLLMProvider, MOCK_PROVIDER_NAMES
+from .model_cascade import model_cascade, FAST_TIER, STRONG_TIER
+from .llm_admission import (
+    AdmissionController,
+    AdmissionRejectedError,
+    ProviderRateLimitError,
+    rate_limit_delay,
+    backoff_delay,
+)
 
 logger = logging.getLogger(__name__)
 
+# 各提供商的默认模型与模型名前缀（用于跨提供商回退/对冲时替换模型）
+DEFAULT_MODELS = {
+    "openai": "gpt-3.5-turbo",
+    "anthropic": "claude-3-haiku-20240307",
+    "minimax": "abab6.5s-chat",
+    "mock": "mock-banking"
+}
+MODEL_PREFIXES = {
+    "openai": ("gpt", "o1"),
+    "anthropic": ("claude",),
+    "minimax": ("abab",),
+    "mock": ("mock",)
+}
+
 class LLMService:
     """大语言模型服务"""
     
@@ -22,22 +61,57 @@ class LLMService:
         self.openai_client = None
         self.anthropic_client = None
         self.minimax_config = None
+        self.mock_provider: Optional[MockLLMProvider] = None
         self.current_provider = settings.DEFAULT_LLM_PROVIDER
+        if self.current_provider.lower() in MOCK_PROVIDER_NAMES:
+            self.current_provider = "mock"
+        # 每个提供商一个长连接HTTP会话（在应用生命周期内复用）
+        self.http_sessions: Dict[str, aiohttp.ClientSession] = {}
+        self.http_stats: Dict[str, Dict[str, int]] = {}
+        # 提供商延迟与对冲统计
+        self.telemetry = ProviderTelemetry()
+        # 基于健康度的提供商路由与熔断
+        self.router = ProviderRouter(self.telemetry)
+        # 相同在途请求合并
+        self.single_flight = SingleFlight()
+        # 按提供商的自适应并发准入控制
+        self.admission = AdmissionController()
+        # 流式输出因Token预算/停止序列提前结束的次数
+        self.generation_stats = {"stopped_by_budget": 0, "stopped_by_sequence": 0}
         
         # 初始化客户端
         self._init_clients()
     
     def _init_clients(self):
-        """初始化API客户端"""
+        """初始化API客户端（异步客户端，避免阻塞事件循环）"""
+        # 模拟提供商：离线压测时不初始化真实客户端，避免消耗额度
+        if self.current_provider == "mock":
+            self.mock_provider = MockLLMProvider()
+            logger.info("🧪 已启用本地模拟LLM提供商")
+            return
+        
         try:
+            timeout = httpx.Timeout(
+                settings.LLM_REQUEST_TIMEOUT,
+                connect=settings.LLM_CONNECT_TIMEOUT
+            )
+            
             # OpenAI客户端
             if settings.OPENAI_API_KEY:
-                self.openai_client = openai.OpenAI(api_key=settings.OPENAI_API_KEY)
+                self.openai_client = openai.AsyncOpenAI(
+                    api_key=settings.OPENAI_API_KEY,
+                    timeout=timeout,
+                    max_retries=settings.LLM_MAX_RETRIES
+                )
                 logger.info("✅ OpenAI客户端初始化成功")
             
             # Anthropic客户端
             if settings.ANTHROPIC_API_KEY:
-                self.anthropic_client = anthropic.Anthropic(api_key=settings.ANTHROPIC_API_KEY)
+                self.anthropic_client = anthropic.AsyncAnthropic(
+                    api_key=settings.ANTHROPIC_API_KEY,
+                    timeout=timeout,
+                    max_retries=settings.LLM_MAX_RETRIES
+                )
                 logger.info("✅ Anthropic客户端初始化成功")
             
             # MiniMax配置
@@ -52,44 +126,182 @@ class LLMService:
         except Exception as e:
             logger.error(f"❌ LLM客户端初始化失败: {e}")
     
+    def _aiohttp_timeout(self) -> aiohttp.ClientTimeout:
+        """MiniMax HTTP调用的超时配置"""
+        return aiohttp.ClientTimeout(
+            total=settings.LLM_REQUEST_TIMEOUT,
+            connect=settings.LLM_CONNECT_TIMEOUT
+        )
+    
+    def _trace_config(self, provider: str) -> aiohttp.TraceConfig:
+        """连接复用统计：记录新建连接与复用连接的次数"""
+        stats = self.http_stats.setdefault(provider, {
+            "requests": 0,
+            "connections_created": 0,
+            "connections_reused": 0,
+            "dns_cache_hits": 0,
+            "dns_cache_misses": 0
+        })
+        
+        async def on_request_start(session, ctx, params):
+            stats["requests"] += 1
+        
+        async def on_connection_create_end(session, ctx, params):
+            stats["connections_created"] += 1
+        
+        async def on_connection_reuseconn(session, ctx, params):
+            stats["connections_reused"] += 1
+        
+        async def on_dns_cache_hit(session, ctx, params):
+            stats["dns_cache_hits"] += 1
+        
+        async def on_dns_cache_miss(session, ctx, params):
+            stats["dns_cache_misses"] += 1
+        
+        trace_config = aiohttp.TraceConfig()
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_connection_create_end.append(on_connection_create_end)
+        trace_config.on_connection_reuseconn.append(on_connection_reuseconn)
+        trace_config.on_dns_cache_hit.append(on_dns_cache_hit)
+        trace_config.on_dns_cache_miss.append(on_dns_cache_miss)
+        return trace_config
+    
+    def _get_http_session(self, provider: str) -> aiohttp.ClientSession:
+        """获取提供商共享的HTTP会话（未通过startup创建时按需惰性创建）"""
+        session = self.http_sessions.get(provider)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=settings.LLM_HTTP_POOL_LIMIT,
+                limit_per_host=settings.LLM_HTTP_POOL_LIMIT_PER_HOST,
+                keepalive_timeout=settings.LLM_HTTP_KEEPALIVE_TIMEOUT,
+                ttl_dns_cache=settings.LLM_HTTP_DNS_CACHE_TTL,
+                use_dns_cache=True
+            )
+            session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=self._aiohttp_timeout(),
+                trace_configs=[self._trace_config(provider)]
+            )
+            self.http_sessions[provider] = session
+        return session
+    
+    async def startup(self):
+        """应用启动时创建共享HTTP会话，并按需预热连接"""
+        if not self.minimax_config:
+            return
+        session = self._get_http_session("minimax")
+        logger.info(
+            f"✅ MiniMax HTTP连接池已创建 (limit={settings.LLM_HTTP_POOL_LIMIT}, "
+            f"per_host={settings.LLM_HTTP_POOL_LIMIT_PER_HOST})"
+        )
+        
+        if settings.LLM_HTTP_WARMUP:
+            try:
+                # 仅用于建立TCP/TLS连接并填充DNS缓存，不关心响应内容
+                async with session.get(self.minimax_config["base_url"]) as response:
+                    await response.read()
+                logger.info("🔥 MiniMax连接预热完成")
+            except Exception as e:
+                logger.warning(f"MiniMax连接预热失败: {e}")
+    
+    async def shutdown(self):
+        """应用关闭时释放所有HTTP连接"""
+        for provider, session in list(self.http_sessions.items()):
+            try:
+                if not session.closed:
+                    await session.close()
+            except Exception as e:
+                logger.warning(f"关闭 {provider} HTTP会话失败: {e}")
+        self.http_sessions.clear()
+        
+        for client in (self.openai_client, self.anthropic_client):
+            try:
+                if client is not None:
+                    await client.close()
+            except Exception as e:
+                logger.warning(f"关闭LLM客户端失败: {e}")
+        await response_cache.close()
+        logger.info("🔌 LLM HTTP连接已关闭")
+    
+    def get_http_stats(self) -> Dict[str, Dict[str, int]]:
+        """获取各提供商的连接复用统计"""
+        return {provider: dict(stats) for provider, stats in self.http_stats.items()}
+    
+    def get_routing_stats(self) -> Dict[str, Any]:
+        """获取提供商延迟、对冲与熔断统计"""
+        return {
+            **self.telemetry.get_stats(),
+            "providers": self.router.get_stats(),
+            "single_flight": self.single_flight.get_stats(),
+            "admission": self.admission.get_stats(),
+            "generation": self.generation_stats,
+            **({"mock": self.mock_provider.get_stats()} if self.mock_provider else {})
+        }
+    
+    def _available_providers(self) -> List[str]:
+        """已配置的提供商（按回退优先级排序）"""
+        if self.mock_provider:
+            return ["mock"]
+        providers = []
+        if self.minimax_config:
+            providers.append("minimax")
+        if self.openai_client:
+            providers.append("openai")
+        if self.anthropic_client:
+            providers.append("anthropic")
+        return providers
+    
+    def _default_model(self, provider: str, model: str) -> str:
+        """根据提供商设置合理的默认模型（模型属于其他提供商时替换为该提供商默认模型）"""
+        if not model:
+            return DEFAULT_MODELS[provider]
+        for other, prefixes in MODEL_PREFIXES.items():
+            if other != provider and model.startswith(prefixes):
+                return DEFAULT_MODELS[provider]
+        return model
+    
+    def _resolve_provider(self, provider: str, model: str) -> Tuple[str, str]:
+        """解析实际使用的提供商与模型（请求的提供商不可用时回退）"""
+        provider = (provider or self.current_provider or "openai").lower()
+        available = self._available_providers()
+        if provider not in available:
+            if not available:
+                raise Exception("未配置任何LLM提供商，请设置 MINIMAX_API_KEY 或其他密钥")
+            # 选择一个可用的提供商进行回退
+            provider = available[0]
+        return provider, self._default_model(provider, model)
+    
     async def chat_completion(
         self,
         messages: List[Dict[str, str]],
         model: str = "gpt-3.5-turbo",
         temperature: float = 0.7,
         max_tokens: int = 2000,
-        provider: str = None
+        provider: str = None,
+        stop: Optional[List[str]] = None,
+        deadline: Optional[Deadline] = None
     ) -> Dict[str, Any]:
-        """聊天完成"""
-        provider = (provider or self.current_provider or "openai").lower()
-        # 根据提供商设置合理的默认模型
-        if provider == "minimax":
-            if not model or model == "gpt-3.5-turbo":
-                model = "abab6.5s-chat"
-        elif provider == "anthropic":
-            if not model or model == "gpt-3.5-turbo":
-                model = "claude-3-haiku-20240307"
-        
-        try:
-            if provider == "openai" and self.openai_client:
-                return await self._openai_chat(messages, model, temperature, max_tokens)
-            if provider == "anthropic" and self.anthropic_client:
-                return await self._anthropic_chat(messages, model, temperature, max_tokens)
-            if provider == "minimax" and self.minimax_config:
-                return await self._minimax_chat(messages, model, temperature, max_tokens)
-
-            # 选择一个可用的提供商进行回退
-            if self.minimax_config:
-                if not model or model == "gpt-3.5-turbo":
-                    model = "abab6.5s-chat"
-                return await self._minimax_chat(messages, model, temperature, max_tokens)
-            if self.openai_client:
-                return await self._openai_chat(messages, model, temperature, max_tokens)
-            if self.anthropic_client:
-                return await self._anthropic_chat(messages, model, temperature, max_tokens)
+        """聊天完成（相同的在途请求合并为一次上游调用）
 
-            # 如果没有任何提供商可用
-            raise Exception("未配置任何LLM提供商，请设置 MINIMAX_API_KEY 或其他密钥")
+        deadline 未传入时沿用当前请求的截止时间，各阶段超时收缩到剩余时间。
+        """
+        try:
+            with deadline_scope(deadline) as active_deadline:
+                if active_deadline is not None:
+                    active_deadline.check("LLM调用")
+                provider, model = self._resolve_provider(provider, model)
+                
+                if settings.LLM_SINGLEFLIGHT_ENABLED:
+                    key = self._flight_key(provider, model, messages, temperature, max_tokens, stop)
+                    result = await self.single_flight.do(
+                        key,
+                        lambda: self._complete(messages, provider, model, temperature, max_tokens, stop),
+                        timeout=remaining_timeout(settings.LLM_SINGLEFLIGHT_TIMEOUT)
+                    )
+                    # 共享结果按调用方深拷贝，避免相互修改（含嵌套的 usage）
+                    return copy.deepcopy(result)
+                
+                return await self._complete(messages, provider, model, temperature, max_tokens, stop)
                 
         except Exception as e:
             logger.error(f"❌ LLM调用失败: {e}")
@@ -99,20 +311,456 @@ class LLMService:
                 "content": "抱歉，我现在无法处理您的请求，请稍后再试。"
             }
     
+    @staticmethod
+    def _flight_key(
+        provider: str,
+        model: str,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: int,
+        stop: Optional[List[str]] = None
+    ) -> str:
+        """请求合并键：提供商、模型、消息、温度、最大Token数与停止序列"""
+        payload = json.dumps(
+            [provider, model, messages, temperature, max_tokens, stop],
+            ensure_ascii=False,
+            sort_keys=True
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    async def _complete(
+        self,
+        messages: List[Dict[str, str]],
+        provider: str,
+        model: str,
+        temperature: float,
+        max_tokens: int,
+        stop: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """按健康度依次尝试提供商，熔断中的提供商直接跳过"""
+        candidates = self.router.order(self._available_providers(), preferred=provider)
+        if not candidates:
+            raise Exception("所有LLM提供商均处于熔断状态，请稍后再试")
+        
+        deadline = current_deadline()
+        last_error = None
+        if settings.LLM_HEDGING_ENABLED and len(candidates) > 1:
+            try:
+                return await self._hedged_chat(
+                    candidates[0], candidates[1], messages, model, temperature, max_tokens, stop
+                )
+            except Exception as e:
+                logger.warning(f"⚠️ 对冲请求失败，尝试其余提供商: {e}")
+                last_error = e
+                # 对冲请求内主、备提供商均已尝试
+                candidates = candidates[2:]
+        
+        for candidate in candidates:
+            if deadline is not None and deadline.expired:
+                # 剩余时间已用完，不再尝试其余提供商
+                deadline.check("LLM调用")
+            try:
+                return await self._call_provider(candidate, messages, model, temperature, max_tokens, stop)
+            except Exception as e:
+                logger.warning(f"⚠️ {candidate} 调用失败，尝试下一个提供商: {e}")
+                last_error = e
+        
+        raise last_error
+    
+    async def _call_provider(
+        self,
+        provider: str,
+        messages: List[Dict[str, str]],
+        model: str,
+        temperature: float,
+        max_tokens: int,
+        stop: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """调用指定提供商，记录延迟与成功/失败（被取消的请求不计入失败）"""
+        if not self.router.acquire(provider):
+            raise Exception(f"{provider} 处于熔断状态，已跳过")
+        model = self._default_model(provider, model)
+        
+        try:
+            result = await self._call_with_admission(provider, messages, model, temperature, max_tokens, stop)
+        except (AdmissionRejectedError, DeadlineExceededError):
+            # 本地排队拒绝或请求时间预算用完不代表提供商故障，不计入熔断
+            raise
+        except Exception:
+            self.router.record_failure(provider)
+            raise
+        finally:
+            self.router.release(provider)
+        
+        self.router.record_success(provider)
+        result["provider"] = provider
+        return result
+    
+    async def _dispatch_chat(
+        self,
+        provider: str,
+        messages: List[Dict[str, str]],
+        model: str,
+        temperature: float,
+        max_tokens: int,
+        stop: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """按提供商分发非流式请求"""
+        if provider == "mock":
+            return await self.mock_provider.chat(messages, model, temperature, max_tokens, stop)
+        if provider == "openai":
+            return await self._openai_chat(messages, model, temperature, max_tokens, stop)
+        if provider == "anthropic":
+            return await self._anthropic_chat(messages, model, temperature, max_tokens, stop)
+        return await self._minimax_chat(messages, model, temperature, max_tokens, stop)
+    
+    async def _call_with_admission(
+        self,
+        provider: str,
+        messages: List[Dict[str, str]],
+        model: str,
+        temperature: float,
+        max_tokens: int,
+        stop: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """经准入控制调用提供商；遇到限流时按 Retry-After/抖动退避重试"""
+        stage = f"{provider} 调用"
+        if not settings.LLM_ADMISSION_ENABLED:
+            started = time.monotonic()
+            result = await run_with_deadline(
+                self._dispatch_chat(provider, messages, model, temperature, max_tokens, stop), stage
+            )
+            self.telemetry.record_latency(provider, time.monotonic() - started)
+            return result
+        
+        limiter = self.admission.limiter(provider)
+        attempt = 0
+        while True:
+            await limiter.acquire(timeout=remaining_timeout(settings.LLM_ADMISSION_QUEUE_TIMEOUT))
+            started = time.monotonic()
+            try:
+                result = await run_with_deadline(
+                    self._dispatch_chat(provider, messages, model, temperature, max_tokens, stop), stage
+                )
+            except Exception as e:
+                retry_after = rate_limit_delay(e)
+                limiter.release(rate_limited=retry_after is not None)
+                if retry_after is None or attempt >= settings.LLM_RATE_LIMIT_MAX_RETRIES:
+                    raise
+                delay = backoff_delay(attempt, retry_after)
+                remaining = remaining_timeout()
+                if remaining is not None and delay >= remaining:
+                    # 退避后已无剩余时间，直接放弃
+                    raise
+                attempt += 1
+                logger.warning(f"🚦 {provider} 限流，{delay:.2f}s 后第 {attempt} 次重试")
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                # 取消等情况只归还名额
+                limiter.release()
+                raise
+            
+            limiter.release(success=True)
+            self.telemetry.record_latency(provider, time.monotonic() - started)
+            return result
+    
+    async def _hedged_chat(
+        self,
+        primary: str,
+        secondary: str,
+        messages: List[Dict[str, str]],
+        model: str,
+        temperature: float,
+        max_tokens: int,
+        stop: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """对冲请求：主提供商超过滚动分位延迟仍未返回时，向备用提供商发出相同请求，取先返回者"""
+        self.telemetry.record_request(primary, secondary)
+        delay = self.telemetry.hedge_delay(primary)
+        
+        tasks = {
+            asyncio.create_task(
+                self._call_provider(primary, messages, model, temperature, max_tokens, stop)
+            ): primary
+        }
+        try:
+            done, pending = await asyncio.wait(tasks.keys(), timeout=delay)
+            last_error = None
+            # 只有阈值计时到期才算对冲；主提供商提前失败后的转发单独计为故障转移
+            hedged = not done
+
+            def record(winner: Optional[str]):
+                if hedged:
+                    self.telemetry.record_hedge(primary, secondary, winner)
+                else:
+                    self.telemetry.record_failover(primary, secondary, winner is not None)
+
+            if done:
+                first = next(iter(done))
+                if first.exception() is None:
+                    # 主提供商在阈值内成功返回
+                    return first.result()
+                # 主提供商提前失败：直接改由备用提供商处理，保证两者都被尝试过
+                last_error = first.exception()
+                logger.info(f"⏱️ {primary} 提前失败，改为请求 {secondary}: {last_error}")
+            else:
+                logger.info(f"⏱️ {primary} 超过 {delay:.2f}s 未返回，对冲请求 {secondary}")
+            secondary_task = asyncio.create_task(
+                self._call_provider(secondary, messages, model, temperature, max_tokens, stop)
+            )
+            tasks[secondary_task] = secondary
+            pending = set(pending) | {secondary_task}
+
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        record(tasks[task])
+                        return task.result()
+                    last_error = task.exception()
+            
+            record(None)
+            raise last_error
+        finally:
+            # 取消落败或未完成的请求
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+    
+    async def stream_chat_completion(
+        self,
+        messages: List[Dict[str, str]],
+        model: str = "gpt-3.5-turbo",
+        temperature: float = 0.7,
+        max_tokens: int = 2000,
+        provider: str = None,
+        stop: Optional[List[str]] = None,
+        raise_errors: bool = False
+    ) -> AsyncIterator[str]:
+        """流式聊天完成：逐段产出生成的文本增量
+
+        raise_errors 为 True 时失败直接抛出，由调用方决定兜底方式。
+        """
+        emitted = False
+        try:
+            provider, model = self._resolve_provider(provider, model)
+            candidates = self.router.order(self._available_providers(), preferred=provider)
+            if not candidates:
+                raise Exception("所有LLM提供商均处于熔断状态，请稍后再试")
+            
+            deadline = current_deadline()
+            last_error = None
+            for candidate in candidates:
+                if deadline is not None:
+                    deadline.check("LLM流式调用")
+                if not self.router.acquire(candidate):
+                    continue
+                candidate_model = self._default_model(candidate, model)
+                limiter = self.admission.limiter(candidate) if settings.LLM_ADMISSION_ENABLED else None
+                admitted = False
+                outcome = {}
+                try:
+                    if limiter:
+                        await limiter.acquire(timeout=remaining_timeout(settings.LLM_ADMISSION_QUEUE_TIMEOUT))
+                        admitted = True
+                    
+                    if candidate == "mock":
+                        stream = self.mock_provider.stream(messages, candidate_model, temperature, max_tokens, stop)
+                    elif candidate == "openai":
+                        stream = self._openai_stream(messages, candidate_model, temperature, max_tokens, stop)
+                    elif candidate == "anthropic":
+                        stream = self._anthropic_stream(messages, candidate_model, temperature, max_tokens, stop)
+                    else:
+                        stream = self._minimax_stream(messages, candidate_model, temperature, max_tokens, stop)
+                    
+                    # 每个增量的等待时间收缩到剩余时间；计时只覆盖等待上游，不覆盖 yield
+                    deltas = self._enforce_generation_budget(stream, candidate, max_tokens, stop).__aiter__()
+                    while True:
+                        try:
+                            delta = await run_with_deadline(deltas.__anext__(), f"{candidate} 流式调用")
+                        except StopAsyncIteration:
+                            break
+                        emitted = True
+                        yield delta
+                    
+                    self.router.record_success(candidate)
+                    outcome["success"] = True
+                    return
+                except Exception as e:
+                    if not isinstance(e, (AdmissionRejectedError, DeadlineExceededError)):
+                        self.router.record_failure(candidate)
+                    outcome["rate_limited"] = rate_limit_delay(e) is not None
+                    # 已产出部分内容时不再切换提供商，避免回复拼接错乱
+                    if emitted:
+                        raise
+                    logger.warning(f"⚠️ {candidate} 流式调用失败，尝试下一个提供商: {e}")
+                    last_error = e
+                finally:
+                    self.router.release(candidate)
+                    if admitted:
+                        limiter.release(**outcome)
+            
+            raise last_error or Exception("没有可用的LLM提供商")
+                    
+        except Exception as e:
+            logger.error(f"❌ LLM流式调用失败: {e}")
+            if raise_errors:
+                raise
+            # 尚未产出任何内容时返回兜底回复；已产出部分内容则直接结束
+            if not emitted:
+                yield "抱歉，我现在无法处理您的请求，请稍后再试。"
+    
+    @staticmethod
+    def _raise_for_minimax_rate_limit(response, result: Dict[str, Any] = None):
+        """MiniMax 限流：HTTP 429，或 HTTP 200 但 base_resp.status_code 为 1002"""
+        if response.status == 429:
+            retry_after = response.headers.get("Retry-After")
+            try:
+                retry_after = float(retry_after) if retry_after is not None else None
+            except ValueError:
+                retry_after = None
+            raise ProviderRateLimitError("MiniMax API限流: 429", retry_after)
+        if result and (result.get("base_resp") or {}).get("status_code") == 1002:
+            raise ProviderRateLimitError(
+                f"MiniMax API限流: {result['base_resp'].get('status_msg', '')}"
+            )
+    
+    @staticmethod
+    def _truncate_at_stop(content: str, stop: Optional[List[str]] = None) -> str:
+        """在最早出现的停止序列处截断（用于不支持 stop 参数的提供商）"""
+        if not stop or not content:
+            return content
+        positions = [content.find(seq) for seq in stop if seq and seq in content]
+        return content[:min(positions)].rstrip() if positions else content
+    
+    async def _enforce_generation_budget(
+        self,
+        stream: AsyncIterator[str],
+        provider: str,
+        max_tokens: int,
+        stop: Optional[List[str]] = None
+    ) -> AsyncIterator[str]:
+        """流式输出的本地兜底：超出Token预算或命中停止序列时提前结束
+
+        为识别跨增量的停止序列，末尾保留 (最长停止序列长度 - 1) 个字符暂不输出。
+        """
+        holdback = max((len(seq) for seq in stop or [] if seq), default=1) - 1
+        buffer = ""
+        used = 0
+        async for delta in stream:
+            if not delta:
+                continue
+            buffer += delta
+            if stop:
+                truncated = self._truncate_at_stop(buffer, stop)
+                if truncated != buffer:
+                    if truncated:
+                        yield truncated
+                    self.generation_stats["stopped_by_sequence"] += 1
+                    return
+            ready, buffer = (buffer[:-holdback], buffer[-holdback:]) if holdback else (buffer, "")
+            if ready:
+                used += count_tokens(ready, provider)
+                yield ready
+            if used >= max_tokens:
+                self.generation_stats["stopped_by_budget"] += 1
+                logger.info(f"✂️ {provider} 流式输出达到 {max_tokens} tokens 预算，提前结束")
+                return
+        if buffer:
+            yield buffer
+    
+    def _to_anthropic_messages(
+        self,
+        messages: List[Dict[str, str]]
+    ) -> Tuple[Optional[str], List[Dict[str, str]]]:
+        """转换为Anthropic消息格式，返回 (system, messages)
+
+        所有 system 消息合并为 system 参数；user/assistant 消息按原顺序保留，
+        相邻同角色消息合并，并保证首条为 user（Anthropic要求角色交替）。
+        """
+        system_parts = [msg["content"] for msg in messages if msg["role"] == "system" and msg["content"]]
+        system_message = "\n\n".join(system_parts) or None
+        
+        anthropic_messages: List[Dict[str, str]] = []
+        for msg in messages:
+            if msg["role"] not in ("user", "assistant") or not msg["content"]:
+                continue
+            if anthropic_messages and anthropic_messages[-1]["role"] == msg["role"]:
+                anthropic_messages[-1]["content"] += "\n\n" + msg["content"]
+            else:
+                anthropic_messages.append({"role": msg["role"], "content": msg["content"]})
+        
+        if anthropic_messages and anthropic_messages[0]["role"] == "assistant":
+            anthropic_messages.pop(0)
+        if not anthropic_messages:
+            anthropic_messages = [{"role": "user", "content": messages[-1]["content"]}]
+        
+        return system_message, anthropic_messages
+    
+    def _build_minimax_request(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        temperature: float,
+        max_tokens: int,
+        stream: bool = False
+    ) -> Tuple[Dict[str, str], Dict[str, Any]]:
+        """构建MiniMax请求，返回 (headers, request_data)"""
+        # 配置健壮性校验
+        if not self.minimax_config or not self.minimax_config.get("api_key") or not self.minimax_config.get("group_id"):
+            raise Exception("MiniMax 未配置 API key 或 GroupId")
+        # 转换消息格式
+        system_message = ""
+        user_messages = []
+        
+        for msg in messages:
+            if msg["role"] == "system":
+                system_message += msg["content"] + "\n"
+            elif msg["role"] == "user":
+                # MiniMax chatcompletion_v2 采用 role/content 格式
+                user_messages.append({"role": "user", "content": msg["content"]})
+            elif msg["role"] == "assistant":
+                user_messages.append({"role": "assistant", "content": msg["content"]})
+        
+        # 如果没有用户消息，使用最后一条消息
+        if not user_messages and messages:
+            user_messages = [{"sender_type": "USER", "sender_name": "用户", "text": messages[-1]["content"]}]
+        
+        # 构建请求数据
+        request_data = {
+            "model": model,
+            "messages": user_messages,
+            "system": system_message.strip(),
+            "tokens_to_generate": max_tokens,
+            "temperature": temperature,
+            "top_p": 0.9
+        }
+        if stream:
+            request_data["stream"] = True
+        
+        headers = {
+            "Authorization": f"Bearer {self.minimax_config['api_key']}",
+            "Content-Type": "application/json"
+        }
+        return headers, request_data
+    
     async def _openai_chat(
         self,
         messages: List[Dict[str, str]],
         model: str,
         temperature: float,
-        max_tokens: int
+        max_tokens: int,
+        stop: Optional[List[str]] = None
     ) -> Dict[str, Any]:
         """OpenAI聊天"""
         try:
-            response = self.openai_client.chat.completions.create(
+            response = await self.openai_client.chat.completions.create(
                 model=model,
                 messages=messages,
                 temperature=temperature,
-                max_tokens=max_tokens
+                max_tokens=max_tokens,
+                **({"stop": stop[:4]} if stop else {})
             )
             
             return {
@@ -135,31 +783,20 @@ class LLMService:
         messages: List[Dict[str, str]],
         model: str,
         temperature: float,
-        max_tokens: int
+        max_tokens: int,
+        stop: Optional[List[str]] = None
     ) -> Dict[str, Any]:
         """Anthropic聊天"""
         try:
-            # 转换消息格式
-            system_message = None
-            for msg in messages:
-                if msg["role"] == "system":
-                    system_message = msg["content"]
-                    break
-            
-            user_messages = [
-                msg["content"] for msg in messages 
-                if msg["role"] in ["user", "assistant"]
-            ]
-            
-            if not user_messages:
-                user_messages = [messages[-1]["content"]]
+            system_message, anthropic_messages = self._to_anthropic_messages(messages)
             
-            response = self.anthropic_client.messages.create(
+            response = await self.anthropic_client.messages.create(
                 model=model,
                 max_tokens=max_tokens,
                 temperature=temperature,
                 system=system_message,
-                messages=[{"role": "user", "content": user_messages[0]}]
+                messages=anthropic_messages,
+                **({"stop_sequences": stop} if stop else {})
             )
             
             return {
@@ -181,99 +818,183 @@ class LLMService:
         messages: List[Dict[str, str]],
         model: str,
         temperature: float,
-        max_tokens: int
+        max_tokens: int,
+        stop: Optional[List[str]] = None
     ) -> Dict[str, Any]:
         """MiniMax聊天"""
         try:
-            # 配置健壮性校验
-            if not self.minimax_config or not self.minimax_config.get("api_key") or not self.minimax_config.get("group_id"):
-                raise Exception("MiniMax 未配置 API key 或 GroupId")
-            # 转换消息格式
-            system_message = ""
-            user_messages = []
-            
-            for msg in messages:
-                if msg["role"] == "system":
-                    system_message += msg["content"] + "\n"
-                elif msg["role"] == "user":
-                    # MiniMax chatcompletion_v2 采用 role/content 格式
-                    user_messages.append({"role": "user", "content": msg["content"]})
-                elif msg["role"] == "assistant":
-                    user_messages.append({"role": "assistant", "content": msg["content"]})
-            
-            # 如果没有用户消息，使用最后一条消息
-            if not user_messages and messages:
-                user_messages = [{"sender_type": "USER", "sender_name": "用户", "text": messages[-1]["content"]}]
-            
-            # 构建请求数据
-            request_data = {
-                "model": model,
-                "messages": user_messages,
-                "system": system_message.strip(),
-                "tokens_to_generate": max_tokens,
-                "temperature": temperature,
-                "top_p": 0.9
-            }
-            
-            # 发送请求
-            headers = {
-                "Authorization": f"Bearer {self.minimax_config['api_key']}",
-                "Content-Type": "application/json"
-            }
+            headers, request_data = self._build_minimax_request(
+                messages, model, temperature, max_tokens
+            )
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f"{self.minimax_config['base_url']}/text/chatcompletion_v2",
-                    headers=headers,
-                    json=request_data,
-                    params={"GroupId": self.minimax_config['group_id']}
-                ) as response:
-                    if response.status == 200:
-                        result = await response.json()
-                        # 解析MiniMax响应格式（更健壮）
-                        choices = result.get("choices") or []
-                        if not choices:
-                            logger.error(f"MiniMax 响应缺少 choices 字段: {result}")
-                            raise Exception("MiniMax 响应格式错误：缺少 choices")
-                        choice0 = choices[0]
-                        # 两种可能的返回结构：messages[] 或 message{}
-                        msgs = choice0.get("messages") or []
-                        content = None
-                        if msgs:
-                            content = msgs[0].get("text") or msgs[0].get("content")
-                        elif isinstance(choice0.get("message"), dict):
-                            content = choice0["message"].get("content") or choice0["message"].get("text")
-                        if not content:
-                            content = "抱歉，无法生成回复。"
-                        
-                        return {
-                            "success": True,
-                            "content": content,
-                            "model": model,
-                            "usage": {
-                                "prompt_tokens": result.get("usage", {}).get("prompt_tokens", 0),
-                                "completion_tokens": result.get("usage", {}).get("completion_tokens", 0),
-                                "total_tokens": result.get("usage", {}).get("total_tokens", 0)
-                            }
+            session = self._get_http_session("minimax")
+            async with session.post(
+                f"{self.minimax_config['base_url']}/text/chatcompletion_v2",
+                headers=headers,
+                json=request_data,
+                params={"GroupId": self.minimax_config['group_id']}
+            ) as response:
+                self._raise_for_minimax_rate_limit(response)
+                if response.status == 200:
+                    result = await response.json()
+                    self._raise_for_minimax_rate_limit(response, result)
+                    # 解析MiniMax响应格式（更健壮）
+                    choices = result.get("choices") or []
+                    if not choices:
+                        logger.error(f"MiniMax 响应缺少 choices 字段: {result}")
+                        raise Exception("MiniMax 响应格式错误：缺少 choices")
+                    choice0 = choices[0]
+                    # 两种可能的返回结构：messages[] 或 message{}
+                    msgs = choice0.get("messages") or []
+                    content = None
+                    if msgs:
+                        content = msgs[0].get("text") or msgs[0].get("content")
+                    elif isinstance(choice0.get("message"), dict):
+                        content = choice0["message"].get("content") or choice0["message"].get("text")
+                    if not content:
+                        content = "抱歉，无法生成回复。"
+                    content = self._truncate_at_stop(content, stop)
+                    
+                    return {
+                        "success": True,
+                        "content": content,
+                        "model": model,
+                        "usage": {
+                            "prompt_tokens": result.get("usage", {}).get("prompt_tokens", 0),
+                            "completion_tokens": result.get("usage", {}).get("completion_tokens", 0),
+                            "total_tokens": result.get("usage", {}).get("total_tokens", 0)
                         }
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"MiniMax API错误: {response.status} - {error_text}")
-                        raise Exception(f"MiniMax API调用失败: {response.status}")
+                    }
+                else:
+                    error_text = await response.text()
+                    logger.error(f"MiniMax API错误: {response.status} - {error_text}")
+                    raise Exception(f"MiniMax API调用失败: {response.status}")
                         
         except Exception as e:
             logger.error(f"❌ MiniMax API调用失败: {e}")
             raise
     
+    async def _openai_stream(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        temperature: float,
+        max_tokens: int,
+        stop: Optional[List[str]] = None
+    ) -> AsyncIterator[str]:
+        """OpenAI流式聊天"""
+        stream = await self.openai_client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+            **({"stop": stop[:4]} if stop else {})
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    
+    async def _anthropic_stream(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        temperature: float,
+        max_tokens: int,
+        stop: Optional[List[str]] = None
+    ) -> AsyncIterator[str]:
+        """Anthropic流式聊天"""
+        system_message, anthropic_messages = self._to_anthropic_messages(messages)
+        stream = await self.anthropic_client.messages.create(
+            model=model,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            system=system_message,
+            messages=anthropic_messages,
+            stream=True,
+            **({"stop_sequences": stop} if stop else {})
+        )
+        async for event in stream:
+            if event.type == "content_block_delta" and getattr(event.delta, "text", None):
+                yield event.delta.text
+    
+    async def _minimax_stream(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        temperature: float,
+        max_tokens: int,
+        stop: Optional[List[str]] = None
+    ) -> AsyncIterator[str]:
+        """MiniMax流式聊天（SSE：每行 data: {...}）"""
+        headers, request_data = self._build_minimax_request(
+            messages, model, temperature, max_tokens, stream=True
+        )
+        session = self._get_http_session("minimax")
+        async with session.post(
+            f"{self.minimax_config['base_url']}/text/chatcompletion_v2",
+            headers=headers,
+            json=request_data,
+            params={"GroupId": self.minimax_config['group_id']}
+        ) as response:
+            self._raise_for_minimax_rate_limit(response)
+            if response.status != 200:
+                error_text = await response.text()
+                logger.error(f"MiniMax API错误: {response.status} - {error_text}")
+                raise Exception(f"MiniMax API调用失败: {response.status}")
+            
+            async for raw_line in response.content:
+                line = raw_line.decode("utf-8", errors="ignore").strip()
+                if not line.startswith("data:"):
+                    continue
+                payload = line[len("data:"):].strip()
+                if not payload or payload == "[DONE]":
+                    continue
+                try:
+                    chunk = json.loads(payload)
+                except json.JSONDecodeError:
+                    continue
+                choices = chunk.get("choices") or []
+                # 最后一帧携带完整消息（message字段），只取增量（delta字段）
+                delta = choices[0].get("delta") if choices else None
+                if isinstance(delta, dict) and delta.get("content"):
+                    yield delta["content"]
+    
     async def embed_text(self, text: str) -> List[float]:
         """文本嵌入"""
+        try:
+            # 上游返回的向量条数不足时 embed_texts 会抛出 KeyError
+            return (await self.embed_texts([text]))[0]
+        except Exception as e:
+            logger.error(f"❌ 文本嵌入失败: {e}")
+            return [0.1] * 1024  # 返回默认嵌入
+    
+    async def embed_texts(self, texts: List[str]) -> List[List[float]]:
+        """批量文本嵌入：按 EMBEDDING_MAX_BATCH_SIZE 分块，每块一次上游调用"""
+        if not texts:
+            return []
+        # 批内去重，相同文本只嵌入一次
+        unique_texts = list(dict.fromkeys(texts))
+        vectors: Dict[str, List[float]] = {}
+        batch_size = max(1, settings.EMBEDDING_MAX_BATCH_SIZE)
+        
+        for offset in range(0, len(unique_texts), batch_size):
+            chunk = unique_texts[offset:offset + batch_size]
+            for text, vector in zip(chunk, await self._embed_batch(chunk)):
+                vectors[text] = vector
+        
+        return [vectors[text] for text in texts]
+    
+    async def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        """单次上游批量嵌入调用（失败时返回默认嵌入）"""
         try:
             if self.openai_client:
-                response = self.openai_client.embeddings.create(
+                response = await self.openai_client.embeddings.create(
                     model="text-embedding-ada-002",
-                    input=text
+                    input=texts
                 )
-                return response.data[0].embedding
+                ordered = sorted(response.data, key=lambda item: item.index)
+                return [item.embedding for item in ordered]
             elif self.minimax_config:
                 # 使用MiniMax embedding API
                 headers = {
@@ -283,30 +1004,35 @@ class LLMService:
                 
                 request_data = {
                     "model": "embedding-1",
-                    "texts": [text]
+                    "texts": list(texts)
                 }
                 
-                async with aiohttp.ClientSession() as session:
-                    async with session.post(
-                        f"{self.minimax_config['base_url']}/embeddings",
-                        headers=headers,
-                        json=request_data,
-                        params={"GroupId": self.minimax_config['group_id']}
-                    ) as response:
-                        if response.status == 200:
-                            result = await response.json()
-                            return result["data"][0]["embedding"]
-                        else:
-                            logger.warning(f"MiniMax Embedding API调用失败: {response.status}")
-                            return [0.1] * 1024  # 返回1024维默认嵌入
+                session = self._get_http_session("minimax")
+                async with session.post(
+                    f"{self.minimax_config['base_url']}/embeddings",
+                    headers=headers,
+                    json=request_data,
+                    params={"GroupId": self.minimax_config['group_id']}
+                ) as response:
+                    if response.status == 200:
+                        result = await response.json()
+                        if result.get("vectors"):
+                            return result["vectors"]
+                        return [
+                            item.get("embedding") or item.get("vector")
+                            for item in result.get("data", [])
+                        ]
+                    else:
+                        logger.warning(f"MiniMax Embedding API调用失败: {response.status}")
+                        return [[0.1] * 1024 for _ in texts]  # 返回1024维默认嵌入
             else:
                 # 如果没有配置任何API，返回模拟嵌入
                 logger.warning("⚠️ 未配置任何LLM API，返回模拟嵌入")
-                return [0.1] * 1024  # 模拟1024维嵌入
+                return [[0.1] * 1024 for _ in texts]  # 模拟1024维嵌入
                 
         except Exception as e:
             logger.error(f"❌ 文本嵌入失败: {e}")
-            return [0.1] * 1024  # 返回默认嵌入
+            return [[0.1] * 1024 for _ in texts]  # 返回默认嵌入
     
     def get_available_models(self) -> Dict[str, List[str]]:
         """获取可用模型"""
@@ -326,14 +1052,17 @@ class LLMService:
                 "abab6.5c-chat-2405"
             ]
         
+        if self.mock_provider:
+            models["mock"] = ["mock-banking"]
+        
         return models
     
-    async def generate_banking_response(
+    def _build_banking_messages(
         self,
         user_message: str,
         context: Dict[str, Any] = None
-    ) -> Dict[str, Any]:
-        """生成银行相关回复"""
+    ) -> List[Dict[str, str]]:
+        """构建银行场景的对话消息"""
         
         # 构建系统提示
         system_prompt = """
@@ -364,13 +1093,165 @@ class LLMService:
             {"role": "user", "content": user_message}
         ]
         
-        # 如果有上下文，添加到对话中
+        # 如果有上下文，按Token预算压缩后添加到对话中
         if context:
-            context_str = f"当前上下文：{json.dumps(context, ensure_ascii=False)}"
-            messages.insert(1, {"role": "system", "content": context_str})
+            try:
+                provider = self._resolve_provider(None, None)[0]
+            except Exception:
+                provider = "openai"
+            compact_context = prompt_context_builder.build(context, provider)
+            if compact_context:
+                context_str = f"当前上下文：\n{compact_context}"
+                messages.insert(1, {"role": "system", "content": context_str})
+        
+        return messages
+    
+    def _response_cache_key(self, context: Dict[str, Any] = None) -> Optional[List[str]]:
+        """回复缓存使用的知识ID列表；带对话历史/摘要等不可复用的请求返回None"""
+        if not settings.RESPONSE_CACHE_ENABLED:
+            return None
+        if context and (context.get("conversation_history") or context.get("conversation_summary")):
+            response_cache.record_bypass()
+            return None
+        knowledge_results = (context or {}).get("knowledge_results") or []
+        return [item.get("id") for item in knowledge_results if isinstance(item, dict)]
+    
+    @staticmethod
+    def _response_cache_scope(
+        agent_type: Optional[str],
+        max_tokens: Optional[int],
+        temperature: Optional[float],
+        stop: Optional[List[str]]
+    ) -> Dict[str, Any]:
+        """回复缓存的生成范围：Agent类型与生效的生成策略"""
+        return {
+            "agent_type": agent_type,
+            "max_tokens": max_tokens or settings.MAX_TOKENS,
+            "temperature": settings.TEMPERATURE if temperature is None else temperature,
+            "stop": stop
+        }
+    
+    async def generate_banking_response(
+        self,
+        user_message: str,
+        context: Dict[str, Any] = None,
+        agent_type: Optional[str] = None,
+        max_tokens: Optional[int] = None,
+        temperature: Optional[float] = None,
+        stop: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """生成银行相关回复（简单问题先用快速模型，回答置信度不足时升级到强模型）
+
+        max_tokens/temperature/stop 由各Agent的生成策略指定，未指定时使用全局配置。
+        """
+        knowledge_ids = self._response_cache_key(context)
+        cache_scope = self._response_cache_scope(agent_type, max_tokens, temperature, stop)
+        if knowledge_ids is not None:
+            cached = await response_cache.get(user_message, knowledge_ids, cache_scope)
+            if cached is not None:
+                return {**cached, "cached": True}
+        
+        messages = self._build_banking_messages(user_message, context)
+        generation = {
+            "max_tokens": max_tokens or settings.MAX_TOKENS,
+            "temperature": settings.TEMPERATURE if temperature is None else temperature,
+            "stop": stop
+        }
         
         # 调用LLM
-        return await self.chat_completion(messages)
+        if settings.CASCADE_ENABLED:
+            response = await self._cascade_completion(messages, user_message, context, agent_type, generation)
+        else:
+            response = await self.chat_completion(messages, **generation)
+        if knowledge_ids is not None:
+            await response_cache.set(user_message, knowledge_ids, response, cache_scope)
+        return response
+    
+    def _cascade_model(self, tier: str) -> Optional[str]:
+        """首选提供商在指定层级使用的模型"""
+        try:
+            provider = self._resolve_provider(None, None)[0]
+        except Exception:
+            return None
+        return model_cascade.model_for(provider, tier)
+    
+    async def _cascade_completion(
+        self,
+        messages: List[Dict[str, str]],
+        user_message: str,
+        context: Dict[str, Any] = None,
+        agent_type: Optional[str] = None,
+        generation: Dict[str, Any] = None
+    ) -> Dict[str, Any]:
+        """模型级联调用"""
+        generation = generation or {}
+        tier = model_cascade.choose_tier(user_message, context, agent_type)
+        started = time.monotonic()
+        response = await self.chat_completion(messages, model=self._cascade_model(tier), **generation)
+        
+        if tier == FAST_TIER and model_cascade.needs_escalation(response):
+            logger.info("🔼 快速模型回答置信度不足，升级到强模型")
+            response = await self.chat_completion(
+                messages, model=self._cascade_model(STRONG_TIER), **generation
+            )
+            tier = "escalated"
+        
+        model_cascade.record(tier, time.monotonic() - started)
+        response["tier"] = tier
+        return response
+    
+    async def stream_banking_response(
+        self,
+        user_message: str,
+        context: Dict[str, Any] = None,
+        agent_type: Optional[str] = None,
+        max_tokens: Optional[int] = None,
+        temperature: Optional[float] = None,
+        stop: Optional[List[str]] = None
+    ) -> AsyncIterator[str]:
+        """流式生成银行相关回复（流式输出无法回退，仅按复杂度选择层级）"""
+        knowledge_ids = self._response_cache_key(context)
+        cache_scope = self._response_cache_scope(agent_type, max_tokens, temperature, stop)
+        if knowledge_ids is not None:
+            cached = await response_cache.get(user_message, knowledge_ids, cache_scope)
+            if cached is not None:
+                yield cached.get("content", "")
+                return
+        
+        messages = self._build_banking_messages(user_message, context)
+        
+        model = None
+        tier = None
+        if settings.CASCADE_ENABLED:
+            tier = model_cascade.choose_tier(user_message, context, agent_type)
+            model = self._cascade_model(tier)
+        
+        started = time.monotonic()
+        chunks = []
+        try:
+            async for delta in self.stream_chat_completion(
+                messages,
+                model=model,
+                temperature=settings.TEMPERATURE if temperature is None else temperature,
+                max_tokens=max_tokens or settings.MAX_TOKENS,
+                stop=stop,
+                raise_errors=True
+            ):
+                chunks.append(delta)
+                yield delta
+        except Exception:
+            # 失败的回复不写入缓存
+            if not chunks:
+                yield "抱歉，我现在无法处理您的请求，请稍后再试。"
+            return
+        
+        if tier:
+            model_cascade.record(tier, time.monotonic() - started)
+        if knowledge_ids is not None and chunks:
+            await response_cache.set(user_message, knowledge_ids, {
+                "success": True,
+                "content": "".join(chunks)
+            }, cache_scope)
 
 # 全局实例
 llm_service = LLMService()
\ No newline at end of file
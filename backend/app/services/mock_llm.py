@@ -0,0 +1,198 @@
+"""
+本地模拟LLM提供商 - 用于离线压测，不消耗真实API额度
+"""
+
+import asyncio
+import bisect
+import json
+import logging
+import random
+import re
+from pathlib import Path
+from typing import Dict, Any, List, Optional, AsyncIterator
+
+from app.core.config import settings
+from .llm_admission import ProviderRateLimitError
+
+logger = logging.getLogger(__name__)
+
+# DEFAULT_LLM_PROVIDER 取这些值时启用模拟提供商
+MOCK_PROVIDER_NAMES = ("mock", "local")
+
+# 输出单元：CJK单字、英文单词（含尾随空白）或空白
+TOKEN_PATTERN = re.compile(
+    r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]"
+    r"|[^\s\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]+\s*"
+    r"|\s+"
+)
+
+
+class LatencyModel:
+    """首Token延迟分布：fixed（固定值）、lognormal（对数正态）、histogram（回放录制的直方图）"""
+
+    def __init__(self, rng: random.Random):
+        self.rng = rng
+        self.mode = settings.MOCK_LLM_LATENCY_MODE.lower()
+        self.bounds: List[float] = []
+        self.cumulative: List[float] = []
+        self.raw_samples = False
+        if self.mode == "histogram":
+            self._load_histogram(settings.MOCK_LLM_LATENCY_HISTOGRAM_FILE)
+
+    def _load_histogram(self, path: Optional[str]):
+        """加载直方图文件
+
+        支持两种JSON格式：原始样本列表 [120, 180, ...]（毫秒），
+        或分桶 {"buckets": [[上界毫秒, 次数], ...]}（桶内均匀取值）。
+        """
+        try:
+            data = json.loads(Path(path).read_text(encoding="utf-8"))
+        except Exception as e:
+            logger.warning(f"⚠️ 延迟直方图加载失败，改用固定延迟: {e}")
+            self.mode = "fixed"
+            return
+
+        if isinstance(data, dict):
+            buckets = sorted((float(upper), float(count)) for upper, count in data.get("buckets", []))
+        else:
+            # 原始样本：每个样本作为宽度为0的桶
+            buckets = [(float(sample), 1.0) for sample in sorted(data)]
+        total = 0.0
+        for upper, count in buckets:
+            if count <= 0:
+                continue
+            total += count
+            self.bounds.append(upper)
+            self.cumulative.append(total)
+        if not self.bounds:
+            logger.warning("⚠️ 延迟直方图为空，改用固定延迟")
+            self.mode = "fixed"
+            return
+        self.raw_samples = not isinstance(data, dict)
+        logger.info(f"📊 已加载延迟直方图: {len(self.bounds)} 个桶, {int(total)} 个样本")
+
+    def sample(self) -> float:
+        """采样一次延迟（秒）"""
+        base_ms = settings.MOCK_LLM_LATENCY_MS
+        if self.mode == "lognormal":
+            # 以 MOCK_LLM_LATENCY_MS 为中位数
+            return base_ms * self.rng.lognormvariate(0.0, settings.MOCK_LLM_LATENCY_SIGMA) / 1000.0
+        if self.mode == "histogram":
+            index = bisect.bisect_left(self.cumulative, self.rng.uniform(0, self.cumulative[-1]))
+            index = min(index, len(self.bounds) - 1)
+            upper = self.bounds[index]
+            if self.raw_samples:
+                return upper / 1000.0
+            lower = self.bounds[index - 1] if index > 0 else 0.0
+            return self.rng.uniform(lower, upper) / 1000.0
+        return base_ms / 1000.0
+
+
+class MockLLMProvider:
+    """模拟提供商
+
+    按配置的延迟分布等待首Token，再按 MOCK_LLM_TOKENS_PER_SECOND 的速率输出；
+    可按概率注入失败或限流，回复为固定文本或回显用户消息。
+    设置 MOCK_LLM_SEED 可使延迟与故障注入序列可复现。
+    """
+
+    def __init__(self):
+        self.rng = random.Random(settings.MOCK_LLM_SEED)
+        self.latency = LatencyModel(self.rng)
+        self.stats = {
+            "requests": 0,
+            "streams": 0,
+            "injected_failures": 0,
+            "injected_rate_limits": 0,
+            "output_tokens": 0
+        }
+
+    def _maybe_fail(self):
+        """按配置概率注入限流或失败"""
+        roll = self.rng.random()
+        if roll < settings.MOCK_LLM_RATE_LIMIT_RATE:
+            self.stats["injected_rate_limits"] += 1
+            raise ProviderRateLimitError("模拟提供商注入限流", settings.MOCK_LLM_RETRY_AFTER)
+        if roll < settings.MOCK_LLM_RATE_LIMIT_RATE + settings.MOCK_LLM_FAILURE_RATE:
+            self.stats["injected_failures"] += 1
+            raise Exception("模拟提供商注入故障")
+
+    @staticmethod
+    def _response_text(messages: List[Dict[str, str]]) -> str:
+        """回复内容：canned 模式返回固定文本，echo 模式回显最后一条用户消息"""
+        if settings.MOCK_LLM_RESPONSE_MODE.lower() == "canned":
+            return settings.MOCK_LLM_CANNED_RESPONSE
+        user_message = next(
+            (msg["content"] for msg in reversed(messages) if msg.get("role") == "user"),
+            messages[-1]["content"] if messages else ""
+        )
+        return f"【模拟回复】您的问题是：{user_message}"
+
+    @staticmethod
+    def _tokens(text: str, max_tokens: int, stop: Optional[List[str]] = None) -> List[str]:
+        """切分为输出单元，并按停止序列与Token上限截断"""
+        if stop:
+            positions = [text.find(seq) for seq in stop if seq and seq in text]
+            if positions:
+                text = text[:min(positions)]
+        return TOKEN_PATTERN.findall(text)[:max_tokens]
+
+    @staticmethod
+    def _generation_time(token_count: int) -> float:
+        rate = settings.MOCK_LLM_TOKENS_PER_SECOND
+        return token_count / rate if rate > 0 else 0.0
+
+    async def chat(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        temperature: float,
+        max_tokens: int,
+        stop: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """非流式：等待首Token延迟与全部Token的生成时间后一次性返回"""
+        self.stats["requests"] += 1
+        delay = self.latency.sample()
+        self._maybe_fail()
+        tokens = self._tokens(self._response_text(messages), max_tokens, stop)
+        await asyncio.sleep(delay + self._generation_time(len(tokens)))
+        self.stats["output_tokens"] += len(tokens)
+        prompt_tokens = sum(len(TOKEN_PATTERN.findall(msg.get("content") or "")) for msg in messages)
+        return {
+            "success": True,
+            "content": "".join(tokens),
+            "model": model,
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": len(tokens),
+                "total_tokens": prompt_tokens + len(tokens)
+            }
+        }
+
+    async def stream(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        temperature: float,
+        max_tokens: int,
+        stop: Optional[List[str]] = None
+    ) -> AsyncIterator[str]:
+        """流式：等待首Token延迟后按固定速率逐个输出"""
+        self.stats["requests"] += 1
+        self.stats["streams"] += 1
+        delay = self.latency.sample()
+        self._maybe_fail()
+        await asyncio.sleep(delay)
+        interval = self._generation_time(1)
+        for index, token in enumerate(self._tokens(self._response_text(messages), max_tokens, stop)):
+            if index and interval:
+                await asyncio.sleep(interval)
+            self.stats["output_tokens"] += 1
+            yield token
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            "latency_mode": self.latency.mode,
+            "response_mode": settings.MOCK_LLM_RESPONSE_MODE,
+            **self.stats
+        }
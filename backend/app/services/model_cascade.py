@@ -0,0 +1,121 @@
+"""
+模型级联 - 简单问题使用快速小模型，复杂或低置信度问题升级到大模型
+"""
+
+import logging
+import re
+from typing import Dict, Any, List, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+FAST_TIER = "fast"
+STRONG_TIER = "strong"
+
+# 各提供商的快速/强模型
+CASCADE_MODELS = {
+    "minimax": {FAST_TIER: "abab6.5s-chat", STRONG_TIER: "abab6.5g-chat"},
+    "anthropic": {FAST_TIER: "claude-3-haiku-20240307", STRONG_TIER: "claude-3-sonnet-20240229"},
+    "openai": {FAST_TIER: "gpt-3.5-turbo", STRONG_TIER: "gpt-4-turbo"},
+}
+
+# 本身即可用快速模型回答的Agent类型；其余类型（理财、贷款）需要更高的检索置信度
+SIMPLE_AGENT_TYPES = {"general", "account", "transfer"}
+
+# 多问题/多条件的提问特征
+MULTI_PART_PATTERN = re.compile(r"(以及|并且|另外|同时|还有|分别|对比|比较|如果.+那么|\d[)）、.])")
+
+# 回答中表示不确定的措辞
+LOW_CONFIDENCE_PHRASES = ["无法回答", "不确定", "无法确定", "没有相关信息", "无法提供", "抱歉，我现在无法"]
+
+
+class ModelCascade:
+    """按问题复杂度选择模型层级，并统计各层级流量占比与节省的延迟"""
+
+    def __init__(self):
+        self.stats = {
+            FAST_TIER: {"requests": 0, "total_latency": 0.0},
+            STRONG_TIER: {"requests": 0, "total_latency": 0.0},
+            "escalated": {"requests": 0, "total_latency": 0.0}
+        }
+
+    @staticmethod
+    def retrieval_confidence(knowledge_results: List[Dict[str, Any]]) -> float:
+        """检索置信度：1 - 最佳结果的余弦距离（无结果时为0）
+
+        各向量存储后端返回的 distance 均为余弦距离（Chroma L2 集合已在查询时换算），
+        词法检索结果的 distance 为 None，不参与计算。
+        """
+        distances = [
+            item.get("distance") for item in knowledge_results or []
+            if isinstance(item, dict) and isinstance(item.get("distance"), (int, float))
+        ]
+        if not distances:
+            return 0.0
+        return max(0.0, 1.0 - min(distances))
+
+    def choose_tier(
+        self,
+        message: str,
+        context: Dict[str, Any] = None,
+        agent_type: Optional[str] = None
+    ) -> str:
+        """根据检索置信度、消息长度与Agent类型选择模型层级"""
+        text = (message or "").strip()
+        if len(text) > settings.CASCADE_SIMPLE_MAX_CHARS:
+            return STRONG_TIER
+        if len(re.findall(r"[?？]", text)) > 1 or MULTI_PART_PATTERN.search(text):
+            return STRONG_TIER
+
+        confidence = self.retrieval_confidence((context or {}).get("knowledge_results") or [])
+        required = settings.CASCADE_MIN_RETRIEVAL_CONFIDENCE
+        if agent_type and agent_type not in SIMPLE_AGENT_TYPES:
+            required = settings.CASCADE_SPECIALIST_MIN_RETRIEVAL_CONFIDENCE
+        return FAST_TIER if confidence >= required else STRONG_TIER
+
+    @staticmethod
+    def model_for(provider: str, tier: str) -> Optional[str]:
+        return CASCADE_MODELS.get(provider, {}).get(tier)
+
+    @staticmethod
+    def needs_escalation(response: Dict[str, Any]) -> bool:
+        """快速模型的回答是否置信度不足（失败、过短或包含不确定措辞）"""
+        if not response or not response.get("success"):
+            return True
+        content = (response.get("content") or "").strip()
+        if len(content) < settings.CASCADE_MIN_ANSWER_CHARS:
+            return True
+        return any(phrase in content for phrase in LOW_CONFIDENCE_PHRASES)
+
+    def record(self, tier: str, latency: float):
+        """记录最终由哪个层级给出回答及其耗时"""
+        stats = self.stats[tier]
+        stats["requests"] += 1
+        stats["total_latency"] += latency
+
+    def get_stats(self) -> Dict[str, Any]:
+        """各层级流量占比、平均延迟与估算节省的延迟"""
+        total = sum(s["requests"] for s in self.stats.values())
+        tiers = {}
+        for tier, stats in self.stats.items():
+            avg = stats["total_latency"] / stats["requests"] if stats["requests"] else None
+            tiers[tier] = {
+                "requests": stats["requests"],
+                "share": round(stats["requests"] / total, 4) if total else 0.0,
+                "avg_latency": round(avg, 4) if avg is not None else None
+            }
+
+        saved = None
+        fast_avg, strong_avg = tiers[FAST_TIER]["avg_latency"], tiers[STRONG_TIER]["avg_latency"]
+        if fast_avg is not None and strong_avg is not None:
+            saved = round((strong_avg - fast_avg) * self.stats[FAST_TIER]["requests"], 2)
+
+        return {
+            "enabled": settings.CASCADE_ENABLED,
+            "tiers": tiers,
+            "estimated_latency_saved": saved
+        }
+
+# 全局实例
+model_cascade = ModelCascade()
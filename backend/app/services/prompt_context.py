@@ -0,0 +1,188 @@
+"""
+提示词上下文构建 - 按Token预算压缩知识片段与对话历史
+"""
+
+import json
+import logging
+import re
+from typing import Dict, Any, List, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 各提供商的Token估算系数：(每个CJK字符的token数, 每个非CJK字符的token数)
+TOKEN_RATIOS = {
+    "openai": (1.0, 0.25),
+    "anthropic": (1.2, 0.28),
+    "minimax": (0.7, 0.25),
+}
+
+CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+
+_tiktoken_encoding = None
+
+
+def _get_tiktoken_encoding():
+    """OpenAI使用tiktoken精确计数（可选依赖，未安装时使用估算）"""
+    global _tiktoken_encoding
+    if _tiktoken_encoding is None:
+        try:
+            import tiktoken
+            _tiktoken_encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _tiktoken_encoding = False
+    return _tiktoken_encoding or None
+
+
+def count_tokens(text: str, provider: str = "openai") -> int:
+    """估算文本在指定提供商下的Token数"""
+    if not text:
+        return 0
+    if provider == "openai":
+        encoding = _get_tiktoken_encoding()
+        if encoding is not None:
+            return len(encoding.encode(text))
+    cjk_ratio, other_ratio = TOKEN_RATIOS.get(provider, TOKEN_RATIOS["openai"])
+    cjk_count = len(CJK_PATTERN.findall(text))
+    other_count = len(text) - cjk_count
+    return max(1, int(cjk_count * cjk_ratio + other_count * other_ratio + 0.5))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, provider: str = "openai") -> str:
+    """按Token预算截断文本（二分查找截断位置）"""
+    if count_tokens(text, provider) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if count_tokens(text[:mid], provider) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low].rstrip() + "…"
+
+
+class PromptContextBuilder:
+    """将检索结果与对话历史压缩为预算内的纯文本上下文
+
+    只保留回答所需的字段（知识内容与类别、对话角色与内容），
+    丢弃关键词、创建时间、距离、ID等元数据，并统计节省的Token数。
+    """
+
+    def __init__(self):
+        self.stats = {
+            "requests": 0,
+            "original_tokens": 0,
+            "compact_tokens": 0,
+            "dropped_snippets": 0,
+            "dropped_history_turns": 0
+        }
+
+    @staticmethod
+    def token_budget() -> int:
+        """上下文Token预算：显式配置优先，否则按 MAX_TOKENS 的比例计算"""
+        if settings.PROMPT_CONTEXT_MAX_TOKENS:
+            return settings.PROMPT_CONTEXT_MAX_TOKENS
+        return int(settings.MAX_TOKENS * settings.PROMPT_CONTEXT_BUDGET_RATIO)
+
+    @staticmethod
+    def _history_turns(history: List[Any]) -> List[str]:
+        """将对话历史条目转换为「角色: 内容」行"""
+        lines = []
+        for item in history or []:
+            if isinstance(item, str):
+                lines.append(f"用户: {item}")
+                continue
+            if not isinstance(item, dict):
+                continue
+            content = item.get("content") or item.get("message") or item.get("text")
+            role = item.get("role", "user")
+            if content:
+                lines.append(f"{'助手' if role == 'assistant' else '用户'}: {content}")
+            if item.get("response"):
+                lines.append(f"助手: {item['response']}")
+        return lines
+
+    def build(self, context: Dict[str, Any], provider: str = "openai") -> str:
+        """构建预算内的上下文文本"""
+        budget = self.token_budget()
+        knowledge_budget = int(budget * settings.PROMPT_CONTEXT_KNOWLEDGE_SHARE)
+
+        sections = []
+        used = 0
+
+        # 1) 知识片段：按检索顺序（相关度）依次放入，最后一条可截断
+        knowledge_lines = []
+        snippets = [k for k in (context.get("knowledge_results") or []) if isinstance(k, dict)]
+        for index, item in enumerate(snippets):
+            content = (item.get("content") or "").strip()
+            if not content:
+                continue
+            category = (item.get("metadata") or {}).get("category")
+            line = f"{len(knowledge_lines) + 1}. " + (f"[{category}] " if category else "") + content
+            tokens = count_tokens(line, provider)
+            remaining = knowledge_budget - used
+            if tokens > remaining:
+                if remaining >= settings.PROMPT_CONTEXT_MIN_SNIPPET_TOKENS:
+                    knowledge_lines.append(truncate_to_tokens(line, remaining, provider))
+                    used = knowledge_budget
+                    index += 1
+                self.stats["dropped_snippets"] += len(snippets) - index
+                break
+            knowledge_lines.append(line)
+            used += tokens
+        if knowledge_lines:
+            sections.append("参考知识：\n" + "\n".join(knowledge_lines))
+
+        # 2) 对话摘要（较早轮次的滚动摘要）
+        summary = (context.get("conversation_summary") or "").strip()
+        if summary and budget > used:
+            summary = truncate_to_tokens(summary, budget - used, provider)
+            sections.append("对话摘要：\n" + summary)
+            used += count_tokens(summary, provider)
+        
+        # 3) 对话历史：从最近一轮向前填充剩余预算
+        history_lines = self._history_turns(context.get("conversation_history") or [])
+        kept: List[str] = []
+        for line in reversed(history_lines):
+            tokens = count_tokens(line, provider)
+            if used + tokens > budget:
+                break
+            kept.append(line)
+            used += tokens
+        self.stats["dropped_history_turns"] += len(history_lines) - len(kept)
+        if kept:
+            sections.append("最近对话：\n" + "\n".join(reversed(kept)))
+
+        # 4) 其他上下文字段保持紧凑JSON
+        extra = {
+            k: v for k, v in context.items()
+            if k not in ("knowledge_results", "conversation_history", "conversation_summary") and v not in (None, "", [], {})
+        }
+        if extra:
+            sections.append("其他信息：" + json.dumps(extra, ensure_ascii=False, separators=(",", ":"), default=str))
+
+        compact = "\n\n".join(sections)
+
+        original_tokens = count_tokens(json.dumps(context, ensure_ascii=False, default=str), provider)
+        compact_tokens = count_tokens(compact, provider)
+        self.stats["requests"] += 1
+        self.stats["original_tokens"] += original_tokens
+        self.stats["compact_tokens"] += compact_tokens
+        logger.debug(f"上下文压缩: {original_tokens} -> {compact_tokens} tokens (预算 {budget})")
+
+        return compact
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取上下文压缩统计"""
+        saved = self.stats["original_tokens"] - self.stats["compact_tokens"]
+        return {
+            **self.stats,
+            "token_budget": self.token_budget(),
+            "saved_tokens": saved,
+            "saving_ratio": round(saved / self.stats["original_tokens"], 4) if self.stats["original_tokens"] else 0.0
+        }
+
+# 全局实例
+prompt_context_builder = PromptContextBuilder()
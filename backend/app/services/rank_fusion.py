@@ -0,0 +1,55 @@
+"""
+排序融合 - 多路检索结果的倒数排名融合（RRF）
+"""
+
+from typing import Dict, Any, List, Optional
+
+
+def reciprocal_rank_fusion(
+    ranked_lists: Dict[str, List[Dict[str, Any]]],
+    limit: int,
+    k: int = 60,
+    weights: Optional[Dict[str, float]] = None
+) -> List[Dict[str, Any]]:
+    """融合多路排序结果
+
+    每条结果的得分为 Σ weight / (k + rank)（rank 从1开始），按文档ID去重；
+    返回得分最高的 limit 条，各路的名次与得分贡献记录在 fusion 字段中。
+    某一路的结果本身已是融合结果（带 fusion 字段，如多个扩展查询词的RRF）时，
+    原有记录保留在该路贡献的 fusion 字段下。distance 取各路中的最小值。
+    """
+    fused: Dict[str, Dict[str, Any]] = {}
+    for source, items in ranked_lists.items():
+        weight = (weights or {}).get(source, 1.0)
+        if weight <= 0:
+            continue
+        seen = set()
+        for rank, item in enumerate(items, start=1):
+            doc_id = item.get("id")
+            if doc_id is None or doc_id in seen:
+                continue
+            seen.add(doc_id)
+            contribution = weight / (k + rank)
+
+            entry = fused.get(doc_id)
+            if entry is None:
+                entry = {
+                    **{key: value for key, value in item.items() if key != "fusion"},
+                    "fusion": {"score": 0.0, "contributions": {}}
+                }
+                fused[doc_id] = entry
+            elif item.get("distance") is not None and (
+                entry.get("distance") is None or item["distance"] < entry["distance"]
+            ):
+                entry["distance"] = item["distance"]
+
+            entry["fusion"]["score"] += contribution
+            record = {"rank": rank, "score": round(contribution, 6)}
+            if item.get("fusion"):
+                record["fusion"] = item["fusion"]
+            entry["fusion"]["contributions"][source] = record
+
+    results = sorted(fused.values(), key=lambda entry: entry["fusion"]["score"], reverse=True)[:limit]
+    for entry in results:
+        entry["fusion"]["score"] = round(entry["fusion"]["score"], 6)
+    return results
@@ -0,0 +1,326 @@
+"""
+语义回复缓存 - 相似问题复用LLM回复
+"""
+
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from .vector_db import vector_db_service
+from .search_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+REDIS_KEY_PREFIX = "bank_ai:response_cache"
+
+
+class SemanticResponseCache:
+    """语义回复缓存
+
+    缓存键由「检索到的知识ID集合 + 生成范围（Agent类型与生成策略）」与「归一化问题的嵌入向量」组成：
+    只有知识ID集合与生成范围完全一致、且问题向量余弦相似度达到阈值时才命中。
+    内存LRU为一级缓存，Redis（可选）为跨进程共享的二级缓存。
+    知识库变更（corpus_version 变化）时整体失效。
+    """
+
+    def __init__(self):
+        self.max_entries = settings.RESPONSE_CACHE_MAX_ENTRIES
+        self.ttl = settings.RESPONSE_CACHE_TTL
+        self.threshold = settings.RESPONSE_CACHE_SIMILARITY_THRESHOLD
+        # entry_key -> {"bucket", "embedding", "response", "expires_at", "generation"}
+        self.entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # 最近问题的嵌入，避免 get/set 重复计算
+        self.embedding_memo: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.redis = None
+        self.redis_generation = 0
+        self.corpus_version = vector_db_service.corpus_version
+        self.stats = {
+            "hits": 0,
+            "memory_hits": 0,
+            "redis_hits": 0,
+            "semantic_hits": 0,
+            "misses": 0,
+            "stores": 0,
+            "bypassed": 0,
+            "invalidations": 0
+        }
+
+    @staticmethod
+    def knowledge_bucket(knowledge_ids: List[str], scope: Optional[Dict[str, Any]] = None) -> str:
+        """知识ID集合（与顺序无关）与生成范围的摘要
+
+        scope 为影响回复内容的其他条件（如 Agent 类型、max_tokens/temperature/stop），
+        检索到相同知识的不同 Agent 或生成策略不会互相复用回复。
+        """
+        joined = "|".join(sorted(str(i) for i in knowledge_ids if i is not None))
+        if scope:
+            joined += "#" + json.dumps(scope, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha1(joined.encode("utf-8")).hexdigest()
+
+    def _entry_key(self, bucket: str, normalized: str) -> str:
+        digest = hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+        return f"{bucket}:{digest}"
+
+    async def _get_redis(self):
+        """惰性创建Redis客户端；未启用或连接失败时返回None"""
+        if not settings.RESPONSE_CACHE_REDIS_ENABLED:
+            return None
+        if self.redis is None:
+            try:
+                import redis.asyncio as aioredis
+                self.redis = aioredis.from_url(
+                    settings.REDIS_URL,
+                    password=settings.REDIS_PASSWORD,
+                    decode_responses=True
+                )
+            except Exception as e:
+                logger.warning(f"回复缓存Redis初始化失败，仅使用内存缓存: {e}")
+                return None
+        return self.redis
+
+    async def _generation(self) -> Tuple[int, int]:
+        """当前缓存代数：(本进程知识库版本, Redis共享代数)"""
+        if vector_db_service.corpus_version != self.corpus_version:
+            await self.invalidate()
+        redis = await self._get_redis()
+        if redis is not None:
+            try:
+                value = await redis.get(f"{REDIS_KEY_PREFIX}:generation")
+                self.redis_generation = int(value or 0)
+            except Exception as e:
+                logger.debug(f"读取回复缓存代数失败: {e}")
+        return self.corpus_version, self.redis_generation
+
+    async def _embed(self, normalized: str) -> Optional[np.ndarray]:
+        """计算归一化问题的单位向量（复用知识库的嵌入函数）"""
+        cached = self.embedding_memo.get(normalized)
+        if cached is not None:
+            self.embedding_memo.move_to_end(normalized)
+            return cached
+        embedding_function = vector_db_service.embedding_function
+        if embedding_function is None:
+            return None
+        try:
+            vectors = await vector_db_service.run_blocking(embedding_function, [normalized])
+            vector = np.asarray(vectors[0], dtype=np.float32)
+            norm = float(np.linalg.norm(vector))
+            if norm == 0.0:
+                return None
+            vector = vector / norm
+        except Exception as e:
+            logger.debug(f"回复缓存嵌入失败: {e}")
+            return None
+        self.embedding_memo[normalized] = vector
+        if len(self.embedding_memo) > 256:
+            self.embedding_memo.popitem(last=False)
+        return vector
+
+    def _memory_lookup(
+        self,
+        bucket: str,
+        entry_key: str,
+        generation: Tuple[int, int],
+        vector: Optional[np.ndarray]
+    ) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        entry = self.entries.get(entry_key)
+        if entry and entry["expires_at"] > now and entry["generation"] == generation:
+            self.entries.move_to_end(entry_key)
+            return entry["response"]
+        if vector is None:
+            return None
+
+        best_key, best_score = None, self.threshold
+        for key, candidate in self.entries.items():
+            if candidate["bucket"] != bucket or candidate["generation"] != generation:
+                continue
+            if candidate["expires_at"] <= now:
+                continue
+            score = float(np.dot(vector, candidate["embedding"]))
+            if score >= best_score:
+                best_key, best_score = key, score
+        if best_key is None:
+            return None
+        self.entries.move_to_end(best_key)
+        self.stats["semantic_hits"] += 1
+        return self.entries[best_key]["response"]
+
+    async def _redis_lookup(
+        self,
+        bucket: str,
+        entry_key: str,
+        generation: Tuple[int, int],
+        vector: Optional[np.ndarray]
+    ) -> Optional[Dict[str, Any]]:
+        redis = await self._get_redis()
+        if redis is None:
+            return None
+        try:
+            raw_entries = await redis.hgetall(f"{REDIS_KEY_PREFIX}:{generation[1]}:{bucket}")
+        except Exception as e:
+            logger.debug(f"读取Redis回复缓存失败: {e}")
+            return None
+
+        now = time.time()
+        best, best_score = None, self.threshold
+        for field, raw in (raw_entries or {}).items():
+            try:
+                item = json.loads(raw)
+            except json.JSONDecodeError:
+                continue
+            if item.get("expires_at", 0) <= now:
+                continue
+            if field == entry_key:
+                best = item
+                break
+            if vector is None:
+                continue
+            score = float(np.dot(vector, np.asarray(item["embedding"], dtype=np.float32)))
+            if score >= best_score:
+                best, best_score = item, score
+        if best is None:
+            return None
+
+        # 回填内存缓存
+        self._memory_store(
+            bucket, entry_key, generation,
+            np.asarray(best["embedding"], dtype=np.float32), best["response"]
+        )
+        return best["response"]
+
+    def _memory_store(
+        self,
+        bucket: str,
+        entry_key: str,
+        generation: Tuple[int, int],
+        vector: np.ndarray,
+        response: Dict[str, Any]
+    ):
+        self.entries[entry_key] = {
+            "bucket": bucket,
+            "embedding": vector,
+            "response": response,
+            "expires_at": time.time() + self.ttl,
+            "generation": generation
+        }
+        self.entries.move_to_end(entry_key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    async def get(
+        self,
+        question: str,
+        knowledge_ids: List[str],
+        scope: Optional[Dict[str, Any]] = None
+    ) -> Optional[Dict[str, Any]]:
+        """查找缓存的回复，未命中返回None"""
+        try:
+            normalized = normalize_query(question)
+            bucket = self.knowledge_bucket(knowledge_ids, scope)
+            entry_key = self._entry_key(bucket, normalized)
+            generation = await self._generation()
+
+            # 精确命中无需计算嵌入
+            response = self._memory_lookup(bucket, entry_key, generation, None)
+            if response is not None:
+                self.stats["hits"] += 1
+                self.stats["memory_hits"] += 1
+                return response
+
+            vector = await self._embed(normalized)
+            response = self._memory_lookup(bucket, entry_key, generation, vector)
+            if response is not None:
+                self.stats["hits"] += 1
+                self.stats["memory_hits"] += 1
+                return response
+
+            response = await self._redis_lookup(bucket, entry_key, generation, vector)
+            if response is not None:
+                self.stats["hits"] += 1
+                self.stats["redis_hits"] += 1
+                return response
+        except Exception as e:
+            logger.warning(f"回复缓存查询失败: {e}")
+
+        self.stats["misses"] += 1
+        return None
+
+    async def set(
+        self,
+        question: str,
+        knowledge_ids: List[str],
+        response: Dict[str, Any],
+        scope: Optional[Dict[str, Any]] = None
+    ):
+        """写入回复缓存（仅缓存成功的回复）"""
+        if not response or not response.get("success"):
+            return
+        try:
+            normalized = normalize_query(question)
+            vector = await self._embed(normalized)
+            if vector is None:
+                return
+            bucket = self.knowledge_bucket(knowledge_ids, scope)
+            entry_key = self._entry_key(bucket, normalized)
+            generation = await self._generation()
+
+            self._memory_store(bucket, entry_key, generation, vector, response)
+            self.stats["stores"] += 1
+
+            redis = await self._get_redis()
+            if redis is not None:
+                redis_key = f"{REDIS_KEY_PREFIX}:{generation[1]}:{bucket}"
+                item = {
+                    "embedding": vector.tolist(),
+                    "response": response,
+                    "expires_at": time.time() + self.ttl
+                }
+                await redis.hset(redis_key, entry_key, json.dumps(item, ensure_ascii=False))
+                await redis.expire(redis_key, self.ttl)
+        except Exception as e:
+            logger.warning(f"回复缓存写入失败: {e}")
+
+    def record_bypass(self):
+        """记录未走缓存的请求（如带有对话历史）"""
+        self.stats["bypassed"] += 1
+
+    async def invalidate(self):
+        """知识库变更时清空缓存（Redis通过递增共享代数失效）"""
+        self.entries.clear()
+        self.corpus_version = vector_db_service.corpus_version
+        self.stats["invalidations"] += 1
+        redis = await self._get_redis()
+        if redis is not None:
+            try:
+                self.redis_generation = int(await redis.incr(f"{REDIS_KEY_PREFIX}:generation"))
+            except Exception as e:
+                logger.warning(f"Redis回复缓存失效失败: {e}")
+        logger.info("🧹 回复缓存已失效")
+
+    async def close(self):
+        """关闭Redis连接"""
+        if self.redis is not None:
+            try:
+                await self.redis.close()
+            except Exception as e:
+                logger.warning(f"关闭回复缓存Redis连接失败: {e}")
+            self.redis = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存命中统计"""
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "entries": len(self.entries),
+            "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+            "redis_enabled": settings.RESPONSE_CACHE_REDIS_ENABLED
+        }
+
+# 全局实例
+response_cache = SemanticResponseCache()
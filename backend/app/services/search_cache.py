@@ -0,0 +1,87 @@
+"""
+检索结果缓存 - 按知识库版本失效的知识检索结果缓存
+"""
+
+import copy
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+from app.core.config import settings
+
+
+def normalize_query(query: str) -> str:
+    """归一化查询文本：去首尾空白、小写、合并空白、去掉结尾标点（检索缓存与回复缓存共用）"""
+    text = re.sub(r"\s+", " ", (query or "").strip().lower())
+    return text.rstrip("?？。!！.~ ")
+
+
+class SearchResultCache:
+    """知识检索结果缓存（LRU + TTL）
+
+    键为（归一化查询, limit, 过滤条件），每条结果记录写入时的知识库版本；
+    版本不一致的条目视为未命中并删除，知识库变更后立即失效。
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries: "OrderedDict[Tuple[str, int, str], Dict[str, Any]]" = OrderedDict()
+        self.stats = {"hits": 0, "misses": 0, "stale": 0, "expired": 0, "evictions": 0, "stores": 0}
+
+    def key(self, query: str, limit: int, where: Optional[Dict[str, Any]] = None) -> Tuple[str, int, str]:
+        filters = json.dumps(where, sort_keys=True, ensure_ascii=False) if where else ""
+        return normalize_query(query), limit, filters
+
+    def get(self, key: Tuple[str, int, str], version: int) -> Optional[List[Dict[str, Any]]]:
+        if not settings.SEARCH_CACHE_ENABLED:
+            return None
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            if entry["version"] != version or entry["expires_at"] <= time.monotonic():
+                self.stats["stale" if entry["version"] != version else "expired"] += 1
+                self.stats["misses"] += 1
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            self.stats["hits"] += 1
+            results = entry["results"]
+        # 返回深拷贝，调用方修改结果（含嵌套的元数据与融合明细）不影响缓存
+        return copy.deepcopy(results)
+
+    def set(self, key: Tuple[str, int, str], version: int, results: List[Dict[str, Any]]):
+        if not settings.SEARCH_CACHE_ENABLED:
+            return
+        # 存入深拷贝，调用方之后修改原结果不影响缓存
+        results = copy.deepcopy(results)
+        with self.lock:
+            self.entries[key] = {
+                "version": version,
+                "expires_at": time.monotonic() + settings.SEARCH_CACHE_TTL,
+                "results": results
+            }
+            self.entries.move_to_end(key)
+            self.stats["stores"] += 1
+            while len(self.entries) > settings.SEARCH_CACHE_MAX_ENTRIES:
+                self.entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            "enabled": settings.SEARCH_CACHE_ENABLED,
+            "entries": len(self.entries),
+            "max_entries": settings.SEARCH_CACHE_MAX_ENTRIES,
+            "ttl": settings.SEARCH_CACHE_TTL,
+            **self.stats,
+            "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0
+        }
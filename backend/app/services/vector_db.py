@@ -4,10 +4,11 @@
 
 import logging
 import json
-from typing import List, Dict, Any, Optional
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Callable
 from datetime import datetime
 import asyncio
-import numpy as np
 
 import chromadb
 from chromadb.config import Settings
@@ -15,6 +16,14 @@ from chromadb.utils import embedding_functions
 import httpx
 
 from app.core.config import settings
+from app.core.deadline import Deadline, DeadlineExceededError, deadline_scope, run_with_deadline
+from .embedding_cache import CachedEmbeddingFunction
+from .embedding_batcher import EmbeddingMicroBatcher
+from .rank_fusion import reciprocal_rank_fusion
+from .document_matrix import DocumentMatrix
+from .lexical_index import BM25Index
+from .search_cache import SearchResultCache
+from .vector_store import VectorStore, create_vector_store
 
 logger = logging.getLogger(__name__)
 
@@ -23,33 +32,158 @@ class VectorDBService:
     
     def __init__(self):
         self.client = None
-        self.collection = None
+        # 知识集合（Chroma 或进程内向量存储，由 VECTOR_STORE_BACKEND 决定）
+        self.collection: Optional[VectorStore] = None
         self.embedding_function = None
+        self.embedding_batcher: Optional[EmbeddingMicroBatcher] = None
+        # 知识库版本号：每次语料变更时递增，供下游缓存判断失效
+        self.corpus_version = 0
+        # 本地重排使用的归一化文档矩阵，随语料版本重建
+        self.document_matrix = DocumentMatrix()
+        # 文档正文与关键词的BM25倒排索引，随写入增量更新
+        self.lexical_index = BM25Index()
+        # 知识检索结果缓存（按 corpus_version 失效）
+        self.search_cache = SearchResultCache()
+        self.retrieval_stats = {
+            "hybrid_searches": 0,
+            "both": 0,
+            "dense_only": 0,
+            "lexical_only": 0,
+            "cut_by_distance": 0,
+            "cut_by_score": 0
+        }
+        # Chroma客户端与嵌入函数均为同步调用，统一放入专用的有界线程池执行
+        self.executor = ThreadPoolExecutor(
+            max_workers=settings.VECTOR_DB_THREAD_POOL_SIZE,
+            thread_name_prefix="vector-db"
+        )
+        self.pool_stats = {
+            "submitted": 0,
+            "completed": 0,
+            "in_flight": 0,
+            "max_in_flight": 0,
+            "total_queue_wait": 0.0,
+            "max_queue_wait": 0.0
+        }
+        
+    def _wrap_embedding_function(self, selected, model_name: str):
+        """为所选嵌入函数加上微批处理与持久化缓存
+
+        缓存在外层：只有未命中的文本进入微批处理，线程池中并发的检索、导入与
+        响应缓存调用再合并为较少的上游请求。
+        """
+        if settings.EMBEDDING_BATCH_ENABLED:
+            self.embedding_batcher = EmbeddingMicroBatcher(
+                selected,
+                max_batch_size=settings.EMBEDDING_MAX_BATCH_SIZE,
+                max_wait=settings.EMBEDDING_BATCH_WINDOW_MS / 1000.0
+            )
+            selected = self.embedding_batcher
+            logger.info(f"✅ 已启用嵌入微批处理: 窗口 {settings.EMBEDDING_BATCH_WINDOW_MS}ms, 每批最多 {settings.EMBEDDING_MAX_BATCH_SIZE} 条")
+        # 使用持久化嵌入缓存包装所选嵌入函数，避免重复嵌入相同文本
+        if settings.EMBEDDING_CACHE_ENABLED:
+            try:
+                selected = CachedEmbeddingFunction(selected, model_name)
+                logger.info(f"✅ 已启用嵌入缓存: {settings.EMBEDDING_CACHE_DIR}")
+            except Exception as e:
+                logger.warning(f"嵌入缓存初始化失败，直接使用嵌入函数：{e}")
+        return selected
+
+    def _bump_corpus_version(self):
+        """语料变更后递增版本号，并释放旧版本的检索结果缓存"""
+        self.corpus_version += 1
+        self.search_cache.clear()
+
+    def _refresh_document_matrix(self):
+        """语料版本变化时重建文档矩阵（优先使用Chroma中已存储的嵌入，同步调用）"""
+        if not self.collection:
+            return
+        self.document_matrix.ensure(
+            self.corpus_version,
+            lambda: self.collection.get(include=["documents", "metadatas", "embeddings"]),
+            self.embedding_function
+        )
+
+    def _rebuild_lexical_index(self):
+        """从集合全量重建BM25索引（同步调用）"""
+        if not self.collection:
+            return
+        all_docs = self.collection.get(include=["documents", "metadatas"])
+        self.lexical_index.rebuild(
+            list(all_docs.get("ids") or []),
+            list(all_docs.get("documents") or []),
+            list(all_docs.get("metadatas") or [])
+        )
+
+    async def rebuild_lexical_index(self):
+        """在线程池中重建BM25索引，失败不影响主流程"""
+        try:
+            await self.run_blocking(self._rebuild_lexical_index)
+        except Exception as e:
+            logger.warning(f"BM25索引重建失败: {e}")
+
+    async def refresh_document_matrix(self):
+        """在线程池中预热文档矩阵，失败不影响主流程"""
+        try:
+            await self.run_blocking(self._refresh_document_matrix)
+        except Exception as e:
+            logger.warning(f"文档矩阵重建失败，将在下次兜底重排时重试: {e}")
+    
+    async def run_blocking(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """在向量数据库线程池中执行同步调用，不阻塞事件循环"""
+        submitted_at = time.monotonic()
+        stats = self.pool_stats
+        
+        def _call():
+            waited = time.monotonic() - submitted_at
+            stats["total_queue_wait"] += waited
+            stats["max_queue_wait"] = max(stats["max_queue_wait"], waited)
+            return fn(*args, **kwargs)
+        
+        stats["submitted"] += 1
+        stats["in_flight"] += 1
+        stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, _call)
+        finally:
+            stats["in_flight"] -= 1
+            stats["completed"] += 1
+    
+    def get_pool_stats(self) -> Dict[str, Any]:
+        """获取线程池统计"""
+        completed = self.pool_stats["completed"]
+        return {
+            "max_workers": settings.VECTOR_DB_THREAD_POOL_SIZE,
+            **{k: v for k, v in self.pool_stats.items() if k != "total_queue_wait"},
+            "max_queue_wait": round(self.pool_stats["max_queue_wait"], 4),
+            "avg_queue_wait": round(self.pool_stats["total_queue_wait"] / completed, 4) if completed else 0.0
+        }
         
     async def init(self):
         """初始化向量数据库"""
         try:
-            # 等待并重试连接 Chroma 服务，避免容器尚未就绪导致连接拒绝
-            max_attempts = 10
-            for attempt in range(1, max_attempts + 1):
-                try:
-                    # 使用 HttpClient（与 chromadb==0.4.18 服务端兼容）
-                    self.client = chromadb.HttpClient(
-                        host=settings.CHROMA_HOST,
-                        port=settings.CHROMA_PORT,
-                        settings=Settings(
-                            anonymized_telemetry=False,
-                            allow_reset=True,
-                        ),
-                    )
-                    # 触发一次简单调用以验证连接
-                    _ = self.client.list_collections()
-                    break
-                except Exception as conn_err:
-                    if attempt == max_attempts:
-                        raise conn_err
-                    logger.warning(f"Chroma未就绪，重试({attempt}/{max_attempts})... 错误: {conn_err}")
-                    await asyncio.sleep(1.0)
+            # 远程 Chroma 后端：等待并重试连接，避免容器尚未就绪导致连接拒绝
+            if settings.VECTOR_STORE_BACKEND == "chroma":
+                max_attempts = 10
+                for attempt in range(1, max_attempts + 1):
+                    try:
+                        # 使用 HttpClient（与 chromadb==0.4.18 服务端兼容）
+                        self.client = chromadb.HttpClient(
+                            host=settings.CHROMA_HOST,
+                            port=settings.CHROMA_PORT,
+                            settings=Settings(
+                                anonymized_telemetry=False,
+                                allow_reset=True,
+                            ),
+                        )
+                        # 触发一次简单调用以验证连接
+                        _ = await self.run_blocking(self.client.list_collections)
+                        break
+                    except Exception as conn_err:
+                        if attempt == max_attempts:
+                            raise conn_err
+                        logger.warning(f"Chroma未就绪，重试({attempt}/{max_attempts})... 错误: {conn_err}")
+                        await asyncio.sleep(1.0)
             
             # 初始化嵌入函数（优先：OpenAI -> MiniMax -> 本地），并进行探针校验；失败则回退到本地
             def _probe_embedding(func) -> bool:
@@ -61,6 +195,7 @@ class VectorDBService:
                     return False
 
             selected = None
+            selected_model = None
             # 优先使用 OpenAI（多语言模型）
             if settings.OPENAI_API_KEY:
                 try:
@@ -68,8 +203,9 @@ class VectorDBService:
                         api_key=settings.OPENAI_API_KEY,
                         model_name="text-embedding-3-small"
                     )
-                    if _probe_embedding(candidate):
+                    if await self.run_blocking(_probe_embedding, candidate):
                         selected = candidate
+                        selected_model = "openai/text-embedding-3-small"
                         logger.info("✅ 使用 OpenAI Embeddings (text-embedding-3-small)")
                 except Exception as e:
                     logger.warning(f"OpenAI嵌入初始化失败：{e}")
@@ -98,37 +234,44 @@ class VectorDBService:
                         api_key=settings.MINIMAX_API_KEY,
                         group_id=settings.MINIMAX_GROUP_ID,
                     )
-                    if _probe_embedding(candidate):
+                    if await self.run_blocking(_probe_embedding, candidate):
                         selected = candidate
+                        selected_model = f"minimax/{candidate.model}"
                         logger.info("✅ 使用 MiniMax Embeddings")
                 except Exception as e:
                     logger.warning(f"MiniMax嵌入初始化失败：{e}")
             # 回退到本地 Sentence-Transformers（中文友好模型）
             if not selected:
                 try:
-                    selected = embedding_functions.SentenceTransformerEmbeddingFunction(
+                    # 加载本地模型较慢，同样放入线程池
+                    selected = await self.run_blocking(
+                        embedding_functions.SentenceTransformerEmbeddingFunction,
                         model_name="paraphrase-multilingual-MiniLM-L12-v2"
                     )
+                    selected_model = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
                     # 本地模型无需探针
                     logger.info("✅ 使用本地 Sentence-Transformers (paraphrase-multilingual-MiniLM-L12-v2)")
                 except Exception as e:
                     logger.warning(f"本地嵌入初始化失败：{e}")
                     selected = None
-            self.embedding_function = selected
+            self.embedding_function = self._wrap_embedding_function(selected, selected_model) if selected else None
             
-            # 创建或获取集合
             # 创建或获取集合（允许无嵌入函数，以保证初始化成功）
-            self.collection = self.client.get_or_create_collection(
-                name="bank_knowledge",
-                embedding_function=self.embedding_function,
+            self.collection = await self.run_blocking(
+                create_vector_store,
+                "bank_knowledge",
+                self.embedding_function,
+                client=self.client,
                 metadata={"description": "银行业务知识库"}
             )
             
-            logger.info("✅ 向量数据库初始化成功")
+            logger.info(f"✅ 向量数据库初始化成功（后端: {self.collection.backend}）")
 
             # 初始化知识库（若无嵌入函数，则仅跳过数据写入，避免失败）
             if self.embedding_function:
                 await self._init_knowledge_base()
+                await self.rebuild_lexical_index()
+                await self.refresh_document_matrix()
             else:
                 logger.info("已跳过知识库初始数据写入：未配置嵌入函数。")
             
@@ -146,7 +289,7 @@ class VectorDBService:
             existing_docs = []
             try:
                 if self.collection:
-                    all_docs = self.collection.get()
+                    all_docs = await self.run_blocking(self.collection.get)
                     existing_docs = list(all_docs.get("documents", []) or [])
             except Exception as _e:
                 logger.debug(f"读取现有知识库失败，视为空集合: {_e}")
@@ -173,11 +316,14 @@ class VectorDBService:
                 })
                 ids.append(f"doc_{base_idx + i}")
 
-            self.collection.add(
+            await self.run_blocking(
+                self.collection.add,
                 documents=documents,
                 metadatas=metadatas,
                 ids=ids
             )
+            self._bump_corpus_version()
+            self.lexical_index.add(ids, documents, metadatas)
 
             logger.info(f"✅ 知识库增量初始化完成，新增 {len(to_add)} 条文档，总计 {len(existing_docs) + len(to_add)} 条")
 
@@ -275,8 +421,158 @@ class VectorDBService:
             }
         ]
     
-    async def search_knowledge(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
-        """搜索知识库"""
+    async def search_knowledge(
+        self,
+        query: str,
+        limit: int = 5,
+        deadline: Optional[Deadline] = None,
+        where: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """搜索知识库
+
+        查询嵌入与Chroma调用在专用线程池中执行，等待时间收缩到请求剩余时间；
+        deadline 未传入时沿用当前请求的截止时间，超时后停止扩展查询与兜底重排。
+        RETRIEVAL_MODE 为 hybrid 时向量检索与BM25词法检索并发执行，按加权RRF融合。
+        where 为元数据过滤条件（Chroma where 语法的等值子集）。
+        非空结果按知识库版本缓存，语料变更后自动失效。
+        """
+        cache_key = self.search_cache.key(query, limit, where)
+        version = self.corpus_version
+        cached = self.search_cache.get(cache_key, version)
+        if cached is not None:
+            return cached
+        
+        with deadline_scope(deadline) as active_deadline:
+            try:
+                if settings.RETRIEVAL_MODE == "hybrid":
+                    search = self._hybrid_search(query, limit, active_deadline, where)
+                else:
+                    search = self.run_blocking(self._search_sync, query, limit, active_deadline, where=where)
+                results = await run_with_deadline(search, "知识检索")
+            except DeadlineExceededError as e:
+                logger.warning(f"⏱️ {e}")
+                return []
+        
+        # 空结果可能来自超时或异常，不缓存；版本取检索开始前的值，检索期间语料变更则该条目不会命中
+        if results:
+            self.search_cache.set(cache_key, version, results)
+        return results
+    
+    async def _hybrid_search(
+        self,
+        query: str,
+        limit: int,
+        deadline: Optional[Deadline] = None,
+        where: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """并发执行向量检索与词法检索，各取 limit × RETRIEVAL_CANDIDATE_MULTIPLIER 条候选后融合"""
+        candidates = limit * max(1, settings.RETRIEVAL_CANDIDATE_MULTIPLIER)
+        dense, lexical = await asyncio.gather(
+            self.run_blocking(self._search_sync, query, candidates, deadline, False, where),
+            self.run_blocking(self.lexical_index.search, query, candidates, where)
+        )
+        return self._fuse_hybrid(query, limit, dense, lexical)
+    
+    def _fuse_hybrid(
+        self,
+        query: str,
+        limit: int,
+        dense: List[Dict[str, Any]],
+        lexical: List[Dict[str, Any]]
+    ) -> List[Dict[str, Any]]:
+        """加权RRF融合，并按距离上限与相对得分下限过滤"""
+        stats = self.retrieval_stats
+        stats["hybrid_searches"] += 1
+        if settings.RETRIEVAL_DENSE_MAX_DISTANCE > 0:
+            kept = [
+                item for item in dense
+                if item.get("distance") is None or item["distance"] <= settings.RETRIEVAL_DENSE_MAX_DISTANCE
+            ]
+            stats["cut_by_distance"] += len(dense) - len(kept)
+            dense = kept
+        relative = self._relative_scores(dense, lexical)
+        # 词法覆盖率与向量距离量纲不同，融合结果的 distance 只保留向量距离
+        lexical = [{**item, "distance": None} for item in lexical]
+
+        fused = reciprocal_rank_fusion(
+            {"dense": dense, "lexical": lexical},
+            limit,
+            k=settings.RETRIEVAL_RRF_K,
+            weights={"dense": settings.RETRIEVAL_DENSE_WEIGHT, "lexical": settings.RETRIEVAL_LEXICAL_WEIGHT}
+        )
+        if fused and settings.RETRIEVAL_MIN_RELATIVE_SCORE > 0:
+            kept = [
+                item for item in fused
+                if relative.get(item["id"], 1.0) >= settings.RETRIEVAL_MIN_RELATIVE_SCORE
+            ]
+            stats["cut_by_score"] += len(fused) - len(kept)
+            fused = kept
+
+        for item in fused:
+            sources = item["fusion"]["contributions"]
+            key = "both" if len(sources) > 1 else ("dense_only" if "dense" in sources else "lexical_only")
+            stats[key] += 1
+        logger.info(
+            f"🔍 混合检索完成，查询: '{query}', 向量: {len(dense)}, 词法: {len(lexical)}, 结果数: {len(fused)}"
+        )
+        return fused
+    
+    @staticmethod
+    def _relative_scores(
+        dense: List[Dict[str, Any]],
+        lexical: List[Dict[str, Any]]
+    ) -> Dict[str, float]:
+        """每条候选相对所在检索路第一名的得分比例（出现在两路时取较大值）
+
+        向量检索按相似度（1 - 距离）、词法检索按 BM25 得分各自归一化：
+        RRF 得分中两路都命中的结果约为单路命中的两倍，若按融合得分截断，
+        只被一路召回的结果（如精确匹配的产品代码）会被整体过滤掉。
+        """
+        relative: Dict[str, float] = {}
+
+        def rank(items: List[Dict[str, Any]], score_of):
+            scores = [(item.get("id"), score_of(item)) for item in items]
+            top = max((score for _, score in scores if score is not None), default=None)
+            for doc_id, score in scores:
+                if doc_id is None:
+                    continue
+                ratio = 1.0 if score is None or not top or top <= 0 else max(0.0, score) / top
+                relative[doc_id] = max(relative.get(doc_id, 0.0), ratio)
+
+        rank(dense, lambda item: None if item.get("distance") is None else 1.0 - item["distance"])
+        rank(lexical, lambda item: item.get("bm25"))
+        return relative
+    
+    @staticmethod
+    def _ranked_lists(queries: List[str], results: Dict[str, Any]) -> Dict[str, List[Dict[str, Any]]]:
+        """将批量查询结果拆分为每个查询词的有序命中列表"""
+        def column(key: str, i: int) -> List[Any]:
+            values = results.get(key) or []
+            return (values[i] if i < len(values) else None) or []
+        
+        ranked = {}
+        for i, q in enumerate(queries):
+            metas, dists, ids = column("metadatas", i), column("distances", i), column("ids", i)
+            ranked[q] = [{
+                "content": doc,
+                "metadata": metas[j] if j < len(metas) else {},
+                "distance": dists[j] if j < len(dists) else None,
+                "id": ids[j] if j < len(ids) else None
+            } for j, doc in enumerate(column("documents", i))]
+        return ranked
+    
+    def _search_sync(
+        self,
+        query: str,
+        limit: int,
+        deadline: Optional[Deadline] = None,
+        lexical_fallback: bool = True,
+        where: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """同步检索实现（在线程池中运行）
+
+        混合检索时词法检索单独并发执行，此处不再退回到BM25。
+        """
         try:
             if not self.collection or not self.embedding_function:
                 logger.warning("查询被跳过：向量集合或嵌入函数未初始化。")
@@ -304,116 +600,54 @@ class VectorDBService:
                 return uniq
 
             expanded_queries = _expand(query)
-            results = None
-            for idx, q in enumerate(expanded_queries):
-                results = self.collection.query(
-                    query_texts=[q],
-                    n_results=limit,
-                    include=["documents", "metadatas", "distances"]
-                )
-                if results and results.get("documents") and results["documents"] and results["documents"][0]:
-                    if idx > 0:
-                        logger.info(f"🔍 原始查询无结果，使用扩展词 '{q}' 命中 {len(results['documents'][0])} 条")
-                    break
+            # 所有扩展词一次批量查询（一次嵌入批量调用 + 一次Chroma往返），再做倒数排名融合
+            results = self.collection.query(
+                query_texts=expanded_queries,
+                n_results=limit,
+                where=where,
+                include=["documents", "metadatas", "distances"]
+            )
+            fused = reciprocal_rank_fusion(
+                self._ranked_lists(expanded_queries, results),
+                limit,
+                k=settings.RETRIEVAL_RRF_K
+            )
             try:
                 # 追加调试日志，帮助定位返回结构
                 logger.debug(f"Chroma原始返回: keys={list(results.keys())}; sizes={{'documents': len(results.get('documents', [])) if isinstance(results.get('documents'), list) else 'n/a', 'metadatas': len(results.get('metadatas', [])) if isinstance(results.get('metadatas'), list) else 'n/a', 'distances': len(results.get('distances', [])) if isinstance(results.get('distances'), list) else 'n/a'}}")
             except Exception:
                 pass
-            if not results or not results.get("documents") or not results["documents"]:
-                # 向量检索为空时，尝试使用本地嵌入进行余弦相似度重排（无需依赖Chroma索引）
+            if not fused:
+                if deadline is not None and deadline.expired:
+                    logger.warning("⏱️ 请求时间预算已用完，跳过兜底重排")
+                    return []
+                # 向量检索为空时，使用缓存的归一化文档矩阵做本地余弦相似度重排（无需依赖Chroma索引）
                 try:
-                    all_docs = self.collection.get()
-                    docs = all_docs.get("documents", []) or []
-                    metas = all_docs.get("metadatas", []) or []
-                    ids = all_docs.get("ids", []) or []
-                    if docs and self.embedding_function:
-                        qe = self.embedding_function([str(query)])
-                        if qe and len(qe) > 0:
-                            qv = np.array(qe[0], dtype=float)
-                            dv = self.embedding_function(docs)
-                            scores = []
-                            for i, emb in enumerate(dv):
-                                v = np.array(emb, dtype=float)
-                                # 余弦距离 = 1 - 余弦相似度
-                                denom = (np.linalg.norm(qv) * np.linalg.norm(v))
-                                dist = 1.0 - float(np.dot(qv, v) / denom) if denom > 0 else 1.0
-                                scores.append((dist, i))
-                            # 取最小距离的前N个
-                            scores.sort(key=lambda x: x[0])
-                            top = scores[:limit]
-                            formatted = [{
-                                "content": docs[j],
-                                "metadata": metas[j] if j < len(metas) else {},
-                                "distance": top_dist,
-                                "id": ids[j] if j < len(ids) else None
-                            } for (top_dist, j) in top]
+                    self._refresh_document_matrix()
+                    qe = self.embedding_function([str(query)])
+                    if qe and len(qe) > 0:
+                        formatted = self.document_matrix.search(qe[0], limit, where)
+                        if formatted:
                             logger.info(f"🔍 向量检索为空，使用本地嵌入重排返回 {len(formatted)} 条")
                             return formatted
                 except Exception as _e:
                     logger.debug(f"本地嵌入重排失败: {_e}")
 
-                # 若本地重排也不可用，则退回到关键字/全文匹配
+                # 若本地重排也不可用，则退回到BM25词法检索
+                if not lexical_fallback:
+                    return []
                 try:
-                    all_docs = self.collection.get()
-                    fallback = []
-                    docs = all_docs.get("documents", []) or []
-                    metas = all_docs.get("metadatas", []) or []
-                    ids = all_docs.get("ids", []) or []
-                    q = str(query).strip()
-                    # 简单分词函数：按空格与常见中文标点分割
-                    def tokenize(text: str) -> List[str]:
-                        if not text:
-                            return []
-                        seps = " ，。！？；、:：;,.!?\n\t"
-                        t = "".join([c if c not in seps else " " for c in text])
-                        return [w for w in t.split(" ") if w]
-                    q_tokens = set(tokenize(q))
-                    for i, doc in enumerate(docs):
-                        meta = metas[i] if i < len(metas) else {}
-                        kw_raw = meta.get("keywords")
-                        kw_list = []
-                        if isinstance(kw_raw, str):
-                            try:
-                                kw_list = json.loads(kw_raw)
-                            except Exception:
-                                kw_list = [kw_raw]
-                        elif isinstance(kw_raw, list):
-                            kw_list = kw_raw
-                        cond = (q and q in (doc or "")) or any(q and q in str(k) for k in kw_list)
-                        if cond:
-                            d_tokens = set(tokenize(doc or ""))
-                            inter = len(q_tokens.intersection(d_tokens))
-                            union = len(q_tokens.union(d_tokens)) or 1
-                            jaccard = inter / union
-                            # 将距离归一化为 [0,1] 的值
-                            dist = float(1.0 - jaccard)
-                            fallback.append({
-                                "content": doc,
-                                "metadata": meta,
-                                "distance": dist,
-                                "id": ids[i] if i < len(ids) else None
-                            })
-                    if fallback:
-                        logger.info(f"🔍 使用关键词重排返回 {len(fallback)} 条")
-                        return fallback[:limit]
+                    lexical = self.lexical_index.search(query, limit, where)
+                    if lexical:
+                        logger.info(f"🔍 使用BM25词法检索返回 {len(lexical)} 条")
+                        return lexical
                 except Exception as _e:
-                    logger.debug(f"关键词重排失败: {_e}")
+                    logger.debug(f"BM25词法检索失败: {_e}")
                 logger.info(f"🔍 知识库搜索完成，查询: '{query}', 结果数: 0")
                 return []
             
-            # 格式化结果
-            formatted_results = []
-            for i, doc in enumerate(results["documents"][0]):
-                formatted_results.append({
-                    "content": doc,
-                    "metadata": results["metadatas"][0][i],
-                    "distance": results["distances"][0][i],
-                    "id": results["ids"][0][i]
-                })
-            
-            logger.info(f"🔍 知识库搜索完成，查询: '{query}', 结果数: {len(formatted_results)}")
-            return formatted_results
+            logger.info(f"🔍 知识库搜索完成，查询: '{query}', 扩展词: {len(expanded_queries)}, 结果数: {len(fused)}")
+            return fused
 
         except Exception as e:
             logger.error(f"❌ 知识库搜索失败: {e}")
@@ -424,36 +658,28 @@ class VectorDBService:
         适用于切换嵌入模型后导致查询空间不一致的情况。
         """
         try:
-            if not self.client:
-                logger.warning("重建跳过：Chroma客户端未初始化。")
+            if not self.collection:
+                logger.warning("重建跳过：向量集合未初始化。")
                 return False
             # 读取现有文档
             docs_all = None
             try:
-                docs_all = self.collection.get()
+                docs_all = await self.run_blocking(self.collection.get)
             except Exception as e:
                 logger.warning(f"读取现有集合失败，将执行空重建: {e}")
             documents = list((docs_all or {}).get("documents", []) or [])
             metadatas = list((docs_all or {}).get("metadatas", []) or [])
             ids = list((docs_all or {}).get("ids", []) or [])
 
-            # 删除并重建集合
-            try:
-                self.client.delete_collection(name="bank_knowledge")
-                logger.info("🧹 已删除旧集合 bank_knowledge")
-            except Exception as e:
-                logger.warning(f"删除集合失败或不存在: {e}")
-
-            self.collection = self.client.get_or_create_collection(
-                name="bank_knowledge",
-                embedding_function=self.embedding_function,
-                metadata={"description": "银行业务知识库"}
-            )
-            logger.info("📦 已创建新集合 bank_knowledge 并绑定当前嵌入函数")
+            # 清空集合并绑定当前嵌入函数
+            await self.run_blocking(self.collection.reset, self.embedding_function)
+            logger.info("📦 已重建集合 bank_knowledge 并绑定当前嵌入函数")
+            self._bump_corpus_version()
 
             # 回灌文档
             if documents:
-                self.collection.add(
+                await self.run_blocking(
+                    self.collection.add,
                     documents=documents,
                     metadatas=metadatas,
                     ids=ids
@@ -463,6 +689,8 @@ class VectorDBService:
                 # 若之前为空，则进行种子数据初始化
                 await self._init_knowledge_base()
                 logger.info("✅ 重建完成，使用种子数据初始化集合")
+            await self.rebuild_lexical_index()
+            await self.refresh_document_matrix()
             return True
         except Exception as e:
             logger.error(f"❌ 集合重建失败: {e}")
@@ -475,16 +703,21 @@ class VectorDBService:
                 logger.warning("添加被跳过：向量集合未初始化。")
                 return False
             doc_id = f"doc_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+            metadata = {
+                "category": category,
+                "keywords": json.dumps(keywords),
+                "created_at": datetime.now().isoformat()
+            }
             
-            self.collection.add(
+            await self.run_blocking(
+                self.collection.add,
                 documents=[content],
-                metadatas=[{
-                    "category": category,
-                    "keywords": json.dumps(keywords),
-                    "created_at": datetime.now().isoformat()
-                }],
+                metadatas=[metadata],
                 ids=[doc_id]
             )
+            self._bump_corpus_version()
+            self.lexical_index.add([doc_id], [content], [metadata])
+            await self.refresh_document_matrix()
             
             logger.info(f"✅ 知识添加成功: {doc_id}")
             return True
@@ -493,13 +726,64 @@ class VectorDBService:
             logger.error(f"❌ 知识添加失败: {e}")
             return False
     
+    async def upsert_knowledge_batch(
+        self,
+        ids: List[str],
+        documents: List[str],
+        metadatas: List[Dict[str, Any]]
+    ) -> Dict[str, float]:
+        """嵌入并写入一批文档（ID已存在时覆盖），返回嵌入与写入耗时
+
+        嵌入在调用方并发执行，写入时直接传入向量，存储后端不再重复嵌入。
+        文档矩阵由调用方在整批导入结束后统一刷新。
+        """
+        if not self.collection or not self.embedding_function:
+            raise RuntimeError("向量集合或嵌入函数未初始化")
+        started = time.monotonic()
+        embeddings = await self.run_blocking(self.embedding_function, documents)
+        embedded = time.monotonic()
+        await self.run_blocking(
+            self.collection.upsert,
+            ids=ids,
+            documents=documents,
+            metadatas=metadatas,
+            embeddings=[list(map(float, vector)) for vector in embeddings]
+        )
+        self._bump_corpus_version()
+        await self.run_blocking(self.lexical_index.add, ids, documents, metadatas)
+        return {
+            "embed_seconds": round(embedded - started, 4),
+            "upsert_seconds": round(time.monotonic() - embedded, 4)
+        }
+    
+    async def get_knowledge_ids(self, where: Dict[str, Any]) -> List[str]:
+        """按元数据条件列出文档ID"""
+        if not self.collection:
+            return []
+        existing = await self.run_blocking(self.collection.get, where=where, include=[])
+        return list(existing.get("ids") or [])
+    
+    async def delete_knowledge(self, where: Dict[str, Any]) -> int:
+        """按元数据条件删除文档，返回删除条数"""
+        return await self.delete_knowledge_ids(await self.get_knowledge_ids(where))
+    
+    async def delete_knowledge_ids(self, ids: List[str]) -> int:
+        """按ID删除文档，返回删除条数"""
+        if not self.collection or not ids:
+            return 0
+        await self.run_blocking(self.collection.delete, ids)
+        self._bump_corpus_version()
+        await self.run_blocking(self.lexical_index.remove, ids)
+        await self.refresh_document_matrix()
+        return len(ids)
+    
     async def get_collection_info(self) -> Dict[str, Any]:
         """获取集合信息"""
         try:
-            count = self.collection.count()
+            count = await self.run_blocking(self.collection.count)
             
             # 获取类别统计
-            results = self.collection.get()
+            results = await self.run_blocking(self.collection.get, include=["metadatas"])
             categories = {}
             for metadata in results["metadatas"]:
                 category = metadata.get("category", "未分类")
@@ -508,13 +792,51 @@ class VectorDBService:
             return {
                 "total_documents": count,
                 "categories": categories,
-                "collection_name": self.collection.name
+                "collection_name": self.collection.name,
+                "backend": self.collection.backend
             }
             
         except Exception as e:
             logger.error(f"❌ 获取集合信息失败: {e}")
             return {}
 
+    def get_retrieval_stats(self) -> Dict[str, Any]:
+        """获取检索模式与混合检索命中来源统计"""
+        return {"mode": settings.RETRIEVAL_MODE, **self.retrieval_stats}
+
+    def get_store_stats(self) -> Dict[str, Any]:
+        """获取向量存储后端统计"""
+        return self.collection.get_stats() if self.collection else {"backend": settings.VECTOR_STORE_BACKEND}
+
+    def get_embedding_cache_stats(self) -> Dict[str, Any]:
+        """获取嵌入缓存统计"""
+        if isinstance(self.embedding_function, CachedEmbeddingFunction):
+            return self.embedding_function.get_stats()
+        return {}
+    
+    def get_embedding_batcher_stats(self) -> Dict[str, Any]:
+        """获取嵌入微批处理统计"""
+        return self.embedding_batcher.get_stats() if self.embedding_batcher else {}
+    
+    async def flush_store(self):
+        """将向量存储中尚未落盘的写入持久化"""
+        if self.collection:
+            await self.run_blocking(self.collection.flush)
+    
+    def shutdown(self):
+        """关闭时将向量存储与嵌入缓存写回磁盘并释放线程池"""
+        if self.collection:
+            try:
+                self.collection.flush()
+            except Exception as e:
+                logger.warning(f"向量存储写回失败: {e}")
+        if isinstance(self.embedding_function, CachedEmbeddingFunction):
+            try:
+                self.embedding_function.flush()
+            except Exception as e:
+                logger.warning(f"嵌入缓存写回失败: {e}")
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
 # 全局实例
 vector_db_service = VectorDBService()
 
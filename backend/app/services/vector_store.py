@@ -0,0 +1,576 @@
+"""
+向量存储 - 统一的知识集合接口，支持远程Chroma与进程内ANN索引
+"""
+
+import json
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Callable
+
+import numpy as np
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+EmbeddingFunction = Callable[[List[str]], List[List[float]]]
+
+VECTOR_STORE_BACKENDS = ("chroma", "local")
+
+# 本地向量矩阵的初始行数（之后按翻倍扩容）
+INITIAL_CAPACITY = 1024
+
+
+class VectorStore(ABC):
+    """知识集合接口（方法签名与返回结构与 Chroma Collection 保持一致）
+
+    所有方法均为同步调用，由 VectorDBService 放入线程池执行。
+    """
+
+    backend: str = ""
+    name: str = ""
+
+    @abstractmethod
+    def add(
+        self,
+        ids: List[str],
+        documents: List[str],
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        embeddings: Optional[List[List[float]]] = None
+    ):
+        """新增文档（ID已存在时由具体后端决定是否报错）"""
+
+    @abstractmethod
+    def upsert(
+        self,
+        ids: List[str],
+        documents: List[str],
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        embeddings: Optional[List[List[float]]] = None
+    ):
+        """新增或覆盖文档"""
+
+    @abstractmethod
+    def query(
+        self,
+        query_texts: Optional[List[str]] = None,
+        query_embeddings: Optional[List[List[float]]] = None,
+        n_results: int = 10,
+        where: Optional[Dict[str, Any]] = None,
+        include: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """批量近邻查询，返回按查询分组的 ids/documents/metadatas/distances"""
+
+    @abstractmethod
+    def get(
+        self,
+        ids: Optional[List[str]] = None,
+        where: Optional[Dict[str, Any]] = None,
+        include: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """按ID或元数据读取文档（均为空时返回全部）"""
+
+    @abstractmethod
+    def delete(self, ids: List[str]):
+        """删除文档"""
+
+    @abstractmethod
+    def count(self) -> int:
+        """文档总数"""
+
+    @abstractmethod
+    def reset(self, embedding_function: Optional[EmbeddingFunction]):
+        """清空集合并绑定新的嵌入函数（切换嵌入模型后重建使用）"""
+
+    def flush(self):
+        """将尚未落盘的写入持久化（远程后端由服务端负责，无需处理）"""
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"backend": self.backend, "name": self.name}
+
+
+class ChromaVectorStore(VectorStore):
+    """远程 Chroma 集合
+
+    新建集合使用余弦距离空间；早期以默认 L2 空间创建的集合在查询结果中把
+    平方L2距离换算为余弦距离（嵌入为单位向量时 L2² = 2 - 2cos），
+    使各后端返回的 distance 含义一致。重建集合后即切换到余弦空间。
+    """
+
+    backend = "chroma"
+
+    def __init__(
+        self,
+        client,
+        name: str,
+        embedding_function: Optional[EmbeddingFunction],
+        metadata: Optional[Dict[str, Any]] = None
+    ):
+        self.client = client
+        self.name = name
+        self.metadata = {**(metadata or {}), "hnsw:space": "cosine"}
+        self.collection = None
+        self.space = "cosine"
+        self._open(embedding_function)
+
+    def _open(self, embedding_function: Optional[EmbeddingFunction]):
+        # 集合不存在时各客户端抛出的异常类型不同（HttpClient 为普通 Exception），按集合列表判断；
+        # 已有集合不传入元数据：get_or_create 会覆盖集合元数据，而距离空间在创建时已确定
+        existing = {getattr(collection, "name", collection) for collection in self.client.list_collections()}
+        self.collection = self.client.get_or_create_collection(
+            name=self.name,
+            embedding_function=embedding_function,
+            metadata=None if self.name in existing else self.metadata
+        )
+        self.space = (self.collection.metadata or {}).get("hnsw:space", "l2")
+        if self.space != "cosine":
+            logger.warning(f"集合 {self.name} 使用 {self.space} 距离空间，查询距离将换算为余弦距离；重建集合后切换为余弦空间")
+
+    @staticmethod
+    def _kwargs(**kwargs) -> Dict[str, Any]:
+        # Chroma 对显式传入的 None 参数与缺省参数处理不同，只传有值的参数
+        return {key: value for key, value in kwargs.items() if value is not None}
+
+    def add(self, ids, documents, metadatas=None, embeddings=None):
+        self.collection.add(**self._kwargs(ids=ids, documents=documents, metadatas=metadatas, embeddings=embeddings))
+
+    def upsert(self, ids, documents, metadatas=None, embeddings=None):
+        self.collection.upsert(**self._kwargs(ids=ids, documents=documents, metadatas=metadatas, embeddings=embeddings))
+
+    def query(self, query_texts=None, query_embeddings=None, n_results=10, where=None, include=None):
+        result = self.collection.query(**self._kwargs(
+            query_texts=query_texts,
+            query_embeddings=query_embeddings,
+            n_results=n_results,
+            where=where,
+            include=include
+        ))
+        if self.space == "l2" and result.get("distances"):
+            result["distances"] = [[d / 2.0 for d in row] for row in result["distances"]]
+        return result
+
+    def get(self, ids=None, where=None, include=None):
+        return self.collection.get(**self._kwargs(ids=ids, where=where, include=include))
+
+    def delete(self, ids):
+        self.collection.delete(ids=ids)
+
+    def count(self) -> int:
+        return self.collection.count()
+
+    def reset(self, embedding_function):
+        try:
+            self.client.delete_collection(name=self.name)
+            logger.info(f"🧹 已删除旧集合 {self.name}")
+        except Exception as e:
+            logger.warning(f"删除集合失败或不存在: {e}")
+        self._open(embedding_function)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {**super().get_stats(), "distance_space": self.space}
+
+
+def metadata_matches(metadata: Optional[Dict[str, Any]], where: Optional[Dict[str, Any]]) -> bool:
+    """元数据等值过滤（支持 {"key": value} 与 {"key": {"$eq"/"$in": ...}}，与Chroma where 语义一致）"""
+    for key, cond in (where or {}).items():
+        value = (metadata or {}).get(key)
+        if isinstance(cond, dict):
+            if "$eq" in cond and value != cond["$eq"]:
+                return False
+            if "$in" in cond and value not in cond["$in"]:
+                return False
+        elif value != cond:
+            return False
+    return True
+
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32, copy=False)
+
+
+def _argmax_blocks(vectors: np.ndarray, centroids: np.ndarray, block: int = 8192) -> np.ndarray:
+    """分块计算每个向量最相似的质心，避免一次生成 n × nlist 的大矩阵"""
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), block):
+        labels[start:start + block] = np.argmax(vectors[start:start + block] @ centroids.T, axis=1)
+    return labels
+
+
+class IVFIndex:
+    """倒排文件索引
+
+    球面 k-means 将单位向量划分为 nlist 个簇，每个簇保存所属行号；
+    查询只扫描与查询向量最相似的 nprobe 个簇。写入时只为新增或被覆盖的行分配簇，
+    并返回新索引对象（只复制受影响的簇），正在查询的旧索引不受影响。
+    """
+
+    def __init__(self, vectors: np.ndarray, nlist: int, iterations: int = 10, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        centroids = vectors[rng.choice(len(vectors), nlist, replace=False)].copy()
+        for _ in range(iterations):
+            labels = _argmax_blocks(vectors, centroids)
+            counts = np.bincount(labels, minlength=nlist)
+            empty = counts == 0
+            # 按簇排序后分段求和（比 np.add.at 快一个数量级）
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+            sums = np.zeros_like(centroids)
+            sums[~empty] = np.add.reduceat(vectors[np.argsort(labels, kind="stable")], starts[~empty])
+            # 空簇重新随机取一个样本作为质心
+            sums[empty] = vectors[rng.integers(len(vectors), size=int(empty.sum()))]
+            centroids = _normalize_rows(sums)
+        self.centroids = centroids
+        self.trained_size = len(vectors)
+        self._assign_all(vectors)
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    def _derive(self) -> "IVFIndex":
+        index = object.__new__(IVFIndex)
+        index.centroids = self.centroids
+        index.trained_size = self.trained_size
+        index.lists = list(self.lists)
+        # 行号 -> 簇号 只由写线程使用，新旧索引共用
+        index.labels = self.labels
+        return index
+
+    def _assign_all(self, vectors: np.ndarray):
+        labels = _argmax_blocks(vectors, self.centroids)
+        order = np.argsort(labels, kind="stable")
+        offsets = np.concatenate(([0], np.cumsum(np.bincount(labels, minlength=self.nlist))))
+        self.lists = [order[offsets[c]:offsets[c + 1]] for c in range(self.nlist)]
+        self.labels = labels
+
+    def reassigned(self, vectors: np.ndarray) -> "IVFIndex":
+        """按现有质心重新分配全部向量，返回新索引（删除文档导致行号变化后调用，无需重新训练）"""
+        index = self._derive()
+        index._assign_all(vectors)
+        return index
+
+    def updated(self, vectors: np.ndarray, rows: List[int]) -> "IVFIndex":
+        """只为指定行（新增或向量被覆盖）分配簇，返回新索引"""
+        index = self._derive()
+        if not rows:
+            return index
+        rows = np.asarray(rows, dtype=np.int64)
+        if len(index.labels) < len(vectors):
+            # 簇号数组按翻倍扩容，未分配的行记为 -1
+            grown = np.full(max(len(vectors), 2 * len(index.labels)), -1, dtype=np.int32)
+            grown[:len(index.labels)] = index.labels
+            index.labels = grown
+        old = index.labels[rows]
+        new = _argmax_blocks(vectors[rows], self.centroids)
+        moved = old != new
+        for c in np.unique(old[moved & (old >= 0)]):
+            cluster = index.lists[c]
+            index.lists[c] = cluster[~np.isin(cluster, rows[moved & (old == c)])]
+        for c in np.unique(new[moved]):
+            index.lists[c] = np.concatenate([index.lists[c], rows[moved & (new == c)]])
+        index.labels[rows] = new
+        return index
+
+    def candidates(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        nprobe = min(nprobe, self.nlist)
+        probe = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        return np.concatenate([self.lists[c] for c in probe])
+
+
+class LocalVectorStore(VectorStore):
+    """进程内向量存储
+
+    向量按行单位化存放于预分配的 float32 矩阵（容量按翻倍增长），距离为余弦距离（1 - 余弦相似度）。
+    文档数不足 LOCAL_VECTOR_STORE_IVF_MIN_DOCS 时精确扫描，超过后使用 IVF 索引。
+    写入只追加新行并为其分配簇；累计写入量达到 LOCAL_VECTOR_STORE_FLUSH_EVERY 且不少于
+    已落盘文档数时（以及 flush/关闭时）将向量与文档/元数据整体写入 store.npz，
+    先写临时文件再原子替换，两者始终一致。
+    """
+
+    backend = "local"
+
+    def __init__(self, directory: Path, name: str, embedding_function: Optional[EmbeddingFunction]):
+        self.name = name
+        self.directory = Path(directory) / name
+        self.store_path = self.directory / "store.npz"
+        self.embedding_function = embedding_function
+        self.lock = threading.Lock()
+        self.buffer: Optional[np.ndarray] = None
+        # (ids, documents, metadatas, positions, vectors, index) 整体替换，读线程无需加锁；
+        # 新增行只追加到快照范围之外（读线程以 len(vectors) 为准），覆盖已有行时复制列表与矩阵
+        self.state = ([], [], [], {}, np.zeros((0, 0), dtype=np.float32), None)
+        self.dirty = 0
+        self.persisted = 0
+        self.stats = {"queries": 0, "ivf_queries": 0, "index_builds": 0, "flushes": 0, "total_query_seconds": 0.0}
+        self._load()
+
+    def _load(self):
+        """加载磁盘数据；文件缺失或不一致时从空集合开始"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        if not self.store_path.exists():
+            return
+        try:
+            with np.load(self.store_path, allow_pickle=False) as data:
+                vectors = data["vectors"].astype(np.float32, copy=False)
+                records = json.loads(data["records"].tobytes().decode("utf-8"))
+            ids = list(records["ids"])
+            if len(vectors) != len(ids):
+                raise ValueError("向量行数与文档数不一致")
+            self.buffer = vectors
+            self._publish(
+                ids, list(records["documents"]), list(records["metadatas"]),
+                {doc_id: i for i, doc_id in enumerate(ids)}, len(ids)
+            )
+            self.persisted = len(ids)
+            logger.info(f"📂 加载本地向量集合 {self.name}: {len(ids)} 条")
+        except Exception as e:
+            logger.warning(f"本地向量集合损坏，已重置 {self.directory}: {e}")
+
+    def _persist(self):
+        ids, documents, metadatas, _, vectors, _ = self.state
+        n = len(vectors)
+        records = json.dumps(
+            {"ids": ids[:n], "documents": documents[:n], "metadatas": metadatas[:n]},
+            ensure_ascii=False
+        ).encode("utf-8")
+        tmp_path = self.store_path.with_suffix(".tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(f, vectors=vectors, records=np.frombuffer(records, dtype=np.uint8))
+        tmp_path.replace(self.store_path)
+        self.dirty = 0
+        self.persisted = n
+        self.stats["flushes"] += 1
+
+    def _reserve(self, n: int, needed: int, dim: int):
+        """确保矩阵至少容纳 needed 行（翻倍扩容，已有行复制到新矩阵）"""
+        if self.buffer is None or (n == 0 and self.buffer.shape[1] != dim):
+            self.buffer = np.empty((max(INITIAL_CAPACITY, needed), dim), dtype=np.float32)
+            return
+        capacity = len(self.buffer)
+        if needed <= capacity:
+            return
+        capacity = max(capacity, INITIAL_CAPACITY)
+        while capacity < needed:
+            capacity *= 2
+        grown = np.empty((capacity, dim), dtype=np.float32)
+        grown[:n] = self.buffer[:n]
+        self.buffer = grown
+
+    def _publish(self, ids, documents, metadatas, positions, n: int, changed: Optional[List[int]] = None):
+        """发布新快照，并按规模决定精确扫描、增量分配、全量重新分配或重新训练IVF索引
+
+        changed 为本次新增或覆盖的行号；为 None 时行号整体变化（加载或删除后）。
+        """
+        vectors = self.buffer[:n] if self.buffer is not None else np.zeros((0, 0), dtype=np.float32)
+        index = self.state[5]
+        if n < settings.LOCAL_VECTOR_STORE_IVF_MIN_DOCS:
+            index = None
+        elif index is None or n > 2 * index.trained_size or n < index.trained_size // 2:
+            index = IVFIndex(vectors, nlist=max(1, int(np.sqrt(n))))
+            self.stats["index_builds"] += 1
+            logger.info(f"🧭 本地向量集合 {self.name} 已训练IVF索引: {n} 条, {index.nlist} 个簇")
+        elif changed is None:
+            index = index.reassigned(vectors)
+        else:
+            index = index.updated(vectors, changed)
+        self.state = (ids, documents, metadatas, positions, vectors, index)
+
+    def _embed(self, documents: List[str], embeddings: Optional[List[List[float]]]) -> np.ndarray:
+        if embeddings is None:
+            if self.embedding_function is None:
+                raise ValueError("未提供嵌入且集合未绑定嵌入函数")
+            embeddings = self.embedding_function(list(documents))
+        return _normalize_rows(np.asarray(embeddings, dtype=np.float32))
+
+    def _write(self, ids, documents, metadatas, embeddings, overwrite: bool):
+        if len(set(ids)) != len(ids):
+            raise ValueError("同一批次中存在重复ID")
+        metadatas = list(metadatas) if metadatas is not None else [{} for _ in ids]
+        new_vectors = self._embed(documents, embeddings)
+        with self.lock:
+            cur_ids, cur_docs, cur_metas, positions, cur_vectors, _ = self.state
+            n = len(cur_vectors)
+            if n and new_vectors.shape[1] != cur_vectors.shape[1]:
+                raise ValueError(f"嵌入维度不一致: {new_vectors.shape[1]} != {cur_vectors.shape[1]}")
+            existing = [doc_id for doc_id in ids if doc_id in positions]
+            if existing and not overwrite:
+                raise ValueError(f"ID已存在: {existing[:5]}")
+
+            reserved = self.buffer
+            self._reserve(n, n + len(ids) - len(existing), new_vectors.shape[1])
+            if existing:
+                # 覆盖已有行时写时复制：读线程持有的旧快照（列表与矩阵视图）保持不变
+                cur_docs, cur_metas = list(cur_docs), list(cur_metas)
+                if self.buffer is reserved:
+                    self.buffer = self.buffer.copy()
+            changed = []
+            for j, doc_id in enumerate(ids):
+                i = positions.get(doc_id)
+                if i is None:
+                    # 新行写在当前快照范围之外，发布前对读线程不可见
+                    i = n
+                    n += 1
+                    cur_ids.append(doc_id)
+                    cur_docs.append(documents[j])
+                    cur_metas.append(metadatas[j] or {})
+                    positions[doc_id] = i
+                else:
+                    cur_docs[i], cur_metas[i] = documents[j], metadatas[j] or {}
+                self.buffer[i] = new_vectors[j]
+                changed.append(i)
+            self._publish(cur_ids, cur_docs, cur_metas, positions, n, changed)
+            self.dirty += len(ids)
+            if self.dirty >= max(settings.LOCAL_VECTOR_STORE_FLUSH_EVERY, self.persisted):
+                self._persist()
+
+    def add(self, ids, documents, metadatas=None, embeddings=None):
+        self._write(ids, documents, metadatas, embeddings, overwrite=False)
+
+    def upsert(self, ids, documents, metadatas=None, embeddings=None):
+        self._write(ids, documents, metadatas, embeddings, overwrite=True)
+
+    def query(self, query_texts=None, query_embeddings=None, n_results=10, where=None, include=None):
+        include = ["documents", "metadatas", "distances"] if include is None else include
+        ids, documents, metadatas, _, vectors, index = self.state
+        if query_embeddings is None:
+            if self.embedding_function is None:
+                raise ValueError("未提供查询嵌入且集合未绑定嵌入函数")
+            query_embeddings = self.embedding_function(list(query_texts or []))
+        if len(query_embeddings) == 0:
+            return {"ids": [], **{key: [] for key in include}}
+        queries = _normalize_rows(np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1))
+
+        started = time.monotonic()
+        n = len(vectors)
+        allowed = None
+        if where:
+            allowed = np.array([i for i in range(n) if metadata_matches(metadatas[i], where)], dtype=np.int64)
+        result = {"ids": [], **{key: [] for key in include if key in ("documents", "metadatas", "distances", "embeddings")}}
+        for q in queries:
+            top_rows, top_sims = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+            if n and q.shape[0] == vectors.shape[1]:
+                if allowed is not None:
+                    candidates = allowed
+                elif index is not None:
+                    candidates = index.candidates(q, settings.LOCAL_VECTOR_STORE_IVF_NPROBE)
+                    self.stats["ivf_queries"] += 1
+                    if len(candidates) < n_results:
+                        candidates = None
+                else:
+                    candidates = None
+                sims = vectors @ q if candidates is None else vectors[candidates] @ q
+                k = min(n_results, len(sims))
+                if k > 0:
+                    top = np.argpartition(-sims, k - 1)[:k]
+                    top = top[np.argsort(-sims[top])]
+                    top_rows = top if candidates is None else candidates[top]
+                    top_sims = sims[top]
+            result["ids"].append([ids[i] for i in top_rows])
+            if "documents" in result:
+                result["documents"].append([documents[i] for i in top_rows])
+            if "metadatas" in result:
+                result["metadatas"].append([metadatas[i] for i in top_rows])
+            if "distances" in result:
+                result["distances"].append([float(1.0 - s) for s in top_sims])
+            if "embeddings" in result:
+                result["embeddings"].append(vectors[top_rows].tolist())
+        self.stats["queries"] += len(queries)
+        self.stats["total_query_seconds"] += time.monotonic() - started
+        return result
+
+    def get(self, ids=None, where=None, include=None):
+        include = ["documents", "metadatas"] if include is None else include
+        all_ids, documents, metadatas, positions, vectors, _ = self.state
+        n = len(vectors)
+        if ids is not None:
+            rows = [positions[doc_id] for doc_id in ids if positions.get(doc_id, n) < n]
+        else:
+            rows = range(n)
+        if where:
+            rows = [i for i in rows if metadata_matches(metadatas[i], where)]
+        rows = list(rows)
+        result = {"ids": [all_ids[i] for i in rows]}
+        if "documents" in include:
+            result["documents"] = [documents[i] for i in rows]
+        if "metadatas" in include:
+            result["metadatas"] = [metadatas[i] for i in rows]
+        if "embeddings" in include:
+            result["embeddings"] = vectors[rows].tolist() if rows else []
+        return result
+
+    def delete(self, ids):
+        with self.lock:
+            cur_ids, cur_docs, cur_metas, positions, cur_vectors, _ = self.state
+            removed = {doc_id for doc_id in ids if doc_id in positions}
+            if not removed:
+                return
+            # 删除会改变行号，压缩为新的列表与矩阵（旧快照保持不变）
+            keep = [i for i in range(len(cur_vectors)) if cur_ids[i] not in removed]
+            kept_ids = [cur_ids[i] for i in keep]
+            self.buffer = None
+            self._reserve(0, len(keep), cur_vectors.shape[1])
+            self.buffer[:len(keep)] = cur_vectors[keep]
+            self._publish(
+                kept_ids,
+                [cur_docs[i] for i in keep],
+                [cur_metas[i] for i in keep],
+                {doc_id: i for i, doc_id in enumerate(kept_ids)},
+                len(keep)
+            )
+            self.dirty += len(removed)
+            if self.dirty >= max(settings.LOCAL_VECTOR_STORE_FLUSH_EVERY, self.persisted):
+                self._persist()
+
+    def count(self) -> int:
+        return len(self.state[4])
+
+    def flush(self):
+        with self.lock:
+            if self.dirty:
+                self._persist()
+
+    def reset(self, embedding_function):
+        with self.lock:
+            self.embedding_function = embedding_function
+            self.buffer = None
+            self.state = ([], [], [], {}, np.zeros((0, 0), dtype=np.float32), None)
+            self._persist()
+        logger.info(f"🧹 已清空本地向量集合 {self.name}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        _, _, _, _, vectors, index = self.state
+        queries = self.stats["queries"]
+        return {
+            **super().get_stats(),
+            "documents": len(vectors),
+            "dim": int(vectors.shape[1]) if len(vectors) else None,
+            "capacity": len(self.buffer) if self.buffer is not None else 0,
+            "index": f"ivf{index.nlist}" if index is not None else "flat",
+            "nprobe": settings.LOCAL_VECTOR_STORE_IVF_NPROBE if index is not None else None,
+            "queries": queries,
+            "ivf_queries": self.stats["ivf_queries"],
+            "index_builds": self.stats["index_builds"],
+            "unflushed_writes": self.dirty,
+            "flushes": self.stats["flushes"],
+            "avg_query_ms": round(self.stats["total_query_seconds"] / queries * 1000, 4) if queries else 0.0
+        }
+
+
+def create_vector_store(
+    name: str,
+    embedding_function: Optional[EmbeddingFunction],
+    client=None,
+    metadata: Optional[Dict[str, Any]] = None
+) -> VectorStore:
+    """按 VECTOR_STORE_BACKEND 创建知识集合（同步调用）"""
+    if settings.VECTOR_STORE_BACKEND not in VECTOR_STORE_BACKENDS:
+        raise ValueError(f"未知的向量存储后端: {settings.VECTOR_STORE_BACKEND}")
+    if settings.VECTOR_STORE_BACKEND == "local":
+        return LocalVectorStore(Path(settings.LOCAL_VECTOR_STORE_DIR), name, embedding_function)
+    if client is None:
+        raise ValueError("Chroma 后端需要已连接的客户端")
+    return ChromaVectorStore(client, name, embedding_function, metadata)
@@ -29,8 +29,12 @@ async def lifespan(app: FastAPI):
     # 初始化数据库
     await init_db()
     
+    # 初始化LLM共享HTTP连接池
+    from app.services.llm_service import llm_service
+    await llm_service.startup()
+    
     # 初始化向量数据库
-    from app.services.vector_db import init_vector_db
+    from app.services.vector_db import init_vector_db, vector_db_service
     await init_vector_db()
     
     # 初始化Agent系统
@@ -43,6 +47,10 @@ async def lifespan(app: FastAPI):
     
     # 关闭时执行
     logger.info("🔄 应用正在关闭...")
+    from app.services.conversation_memory import conversation_memory
+    await conversation_memory.shutdown()
+    await llm_service.shutdown()
+    vector_db_service.shutdown()
 
 # 创建FastAPI应用
 app = FastAPI(
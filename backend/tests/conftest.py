@@ -0,0 +1,9 @@
+"""
+测试公共配置
+"""
+
+import sys
+from pathlib import Path
+
+# 使 app 包可从 backend 目录外导入
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
@@ -0,0 +1,54 @@
+"""
+聊天端点测试
+"""
+
+import asyncio
+import json
+
+import pytest
+
+from app.api.v1.endpoints.chat import ClientDisconnected, dump_frame, run_until_disconnected
+
+
+class FakeRequest:
+    """请求体已读取完毕的请求：receive 在客户端断开前一直阻塞"""
+
+    def __init__(self):
+        self.disconnected = asyncio.Event()
+
+    async def receive(self):
+        await self.disconnected.wait()
+        return {"type": "http.disconnect"}
+
+
+@pytest.mark.asyncio
+async def test_returns_result_when_client_stays_connected():
+    result = await run_until_disconnected(FakeRequest(), asyncio.sleep(0.01, result={"response": "好的"}))
+    assert result == {"response": "好的"}
+
+
+@pytest.mark.asyncio
+async def test_cancels_work_as_soon_as_client_disconnects():
+    request = FakeRequest()
+    cancelled = asyncio.Event()
+
+    async def work():
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    asyncio.get_running_loop().call_later(0.05, request.disconnected.set)
+    started = asyncio.get_running_loop().time()
+    with pytest.raises(ClientDisconnected):
+        await run_until_disconnected(request, work())
+
+    assert cancelled.is_set()
+    assert asyncio.get_running_loop().time() - started < 0.3
+
+
+def test_frames_keep_chinese_text():
+    frame = dump_frame({"type": "chat_delta", "data": {"delta": "您好"}})
+    assert "您好" in frame
+    assert json.loads(frame)["data"]["delta"] == "您好"
@@ -0,0 +1,66 @@
+"""
+请求截止时间测试
+"""
+
+import asyncio
+
+import pytest
+
+from app.core.deadline import (
+    Deadline,
+    DeadlineExceededError,
+    current_deadline,
+    run_with_deadline,
+    stream_with_deadline,
+)
+
+
+@pytest.mark.asyncio
+async def test_stream_deadline_does_not_leak_into_consumer():
+    deadline = Deadline(5.0)
+    seen_by_producer = []
+
+    async def events():
+        for i in range(3):
+            seen_by_producer.append(current_deadline())
+            yield i
+
+    received = []
+    async for item in stream_with_deadline(events(), deadline):
+        assert current_deadline() is None
+        received.append(item)
+
+    assert received == [0, 1, 2]
+    assert seen_by_producer == [deadline] * 3
+    assert current_deadline() is None
+
+
+@pytest.mark.asyncio
+async def test_stream_producer_errors_reach_consumer():
+    async def events():
+        yield "partial"
+        await run_with_deadline(asyncio.sleep(1.0), "LLM调用")
+
+    received = []
+    with pytest.raises(DeadlineExceededError):
+        async for item in stream_with_deadline(events(), Deadline(0.05)):
+            received.append(item)
+    assert received == ["partial"]
+
+
+@pytest.mark.asyncio
+async def test_closing_stream_early_cancels_producer():
+    closed = asyncio.Event()
+
+    async def events():
+        try:
+            for i in range(100):
+                yield i
+                await asyncio.sleep(0.01)
+        finally:
+            closed.set()
+
+    stream = stream_with_deadline(events(), Deadline(5.0), buffer=1)
+    assert await stream.__anext__() == 0
+    await stream.aclose()
+    await asyncio.wait_for(closed.wait(), timeout=0.5)
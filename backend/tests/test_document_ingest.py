@@ -0,0 +1,133 @@
+"""
+文档分块测试
+"""
+
+import zipfile
+
+import pytest
+
+from app.core.config import settings
+from app.services.document_ingest import chunk_blocks, document_ingestor
+from app.services.prompt_context import count_tokens
+
+
+def _section(sentences: int):
+    text = "".join(
+        f"第{i}条规定个人住房贷款的利率调整规则与提前还款的处理方式，并列出需要提交的材料清单。"
+        for i in range(sentences)
+    )
+    return [("heading", "第一章 个人贷款", {"level": 1}), ("paragraph", text, {"page": 3})]
+
+
+def test_adjacent_chunks_share_overlap_text():
+    chunks = list(chunk_blocks(iter(_section(12)), max_tokens=100, overlap_tokens=30))
+
+    assert len(chunks) > 2
+    for previous, current in zip(chunks, chunks[1:]):
+        head = current["content"].split("\n")[0]
+        assert head and previous["content"].endswith(head)
+        assert count_tokens(head) <= 30
+
+
+def test_overlap_takes_tail_of_piece_larger_than_budget():
+    chunks = list(chunk_blocks(iter(_section(12)), max_tokens=100, overlap_tokens=10))
+
+    for previous, current in zip(chunks, chunks[1:]):
+        head = current["content"].split("\n")[0]
+        assert head and previous["content"].endswith(head)
+        assert 0 < count_tokens(head) <= 10
+
+
+def test_chunks_respect_token_limit_and_sections():
+    blocks = _section(12) + [("heading", "第二章 信用卡", {"level": 1}), ("paragraph", "年费规则。", {"page": 4})]
+    chunks = list(chunk_blocks(iter(blocks), max_tokens=100, overlap_tokens=30))
+
+    assert all(chunk["tokens"] <= 100 for chunk in chunks)
+    assert chunks[-1]["section"] == "第二章 信用卡"
+    assert chunks[-1]["content"] == "年费规则。"
+    assert chunks[-1]["page_start"] == chunks[-1]["page_end"] == 4
+
+
+def _write_docx(path, paragraphs):
+    """生成只含正文段落的最小 DOCX"""
+    ns = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+    body = "".join(f"<w:p><w:r><w:t>{text}</w:t></w:r></w:p>" for text in paragraphs)
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("word/document.xml", f'<w:document xmlns:w="{ns}"><w:body>{body}</w:body></w:document>')
+
+
+class MemoryKnowledgeStore:
+    """内存中的知识存储，可指定从第几批开始写入失败"""
+
+    def __init__(self):
+        self.docs = {}
+        self.batches = 0
+        self.fail_from_batch = None
+
+    async def upsert_knowledge_batch(self, ids, documents, metadatas):
+        self.batches += 1
+        if self.fail_from_batch is not None and self.batches >= self.fail_from_batch:
+            raise RuntimeError("写入失败")
+        for doc_id, document, metadata in zip(ids, documents, metadatas):
+            self.docs[doc_id] = (document, metadata)
+        return {"embed_seconds": 0.001, "upsert_seconds": 0.001}
+
+    async def get_knowledge_ids(self, where):
+        return [doc_id for doc_id, (_, metadata) in self.docs.items() if metadata.get("file") == where["file"]]
+
+    async def delete_knowledge_ids(self, ids):
+        removed = [doc_id for doc_id in ids if self.docs.pop(doc_id, None) is not None]
+        return len(removed)
+
+    async def noop(self):
+        return None
+
+
+@pytest.fixture
+def memory_store(monkeypatch, tmp_path):
+    from app.services import document_ingest, knowledge_ingest
+
+    store = MemoryKnowledgeStore()
+    for module in (document_ingest, knowledge_ingest):
+        for name in ("upsert_knowledge_batch", "get_knowledge_ids", "delete_knowledge_ids"):
+            monkeypatch.setattr(module.vector_db_service, name, getattr(store, name))
+        monkeypatch.setattr(module.vector_db_service, "refresh_document_matrix", store.noop)
+        monkeypatch.setattr(module.vector_db_service, "flush_store", store.noop)
+    monkeypatch.setattr(settings, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(settings, "BULK_INGEST_BATCH_SIZE", 2)
+    monkeypatch.setattr(settings, "BULK_INGEST_EMBED_CONCURRENCY", 1)
+    monkeypatch.setattr(settings, "DOCUMENT_CHUNK_MAX_TOKENS", 20)
+    monkeypatch.setattr(settings, "DOCUMENT_CHUNK_OVERLAP_TOKENS", 0)
+    return store
+
+
+async def _ingest(tmp_path, version, count):
+    _write_docx(tmp_path / "policy.docx", [f"第{i}条说明版本{version}的内容与办理要求细则" for i in range(count)])
+    return [event async for event in document_ingestor.ingest("policy.docx")][-1]
+
+
+@pytest.mark.asyncio
+async def test_reingest_replaces_the_previous_generation(memory_store, tmp_path):
+    first = await _ingest(tmp_path, "一", 6)
+    second = await _ingest(tmp_path, "二", 4)
+
+    assert first["success"] and second["success"]
+    assert second["generation"] != first["generation"]
+    assert second["removed_chunks"] == first["documents"]
+    contents = [document for document, _ in memory_store.docs.values()]
+    assert contents and all("版本二" in content for content in contents)
+    assert {metadata["generation"] for _, metadata in memory_store.docs.values()} == {second["generation"]}
+
+
+@pytest.mark.asyncio
+async def test_failed_reingest_keeps_the_previous_document_intact(memory_store, tmp_path):
+    await _ingest(tmp_path, "一", 6)
+    before = dict(memory_store.docs)
+
+    # 第二次导入的第一批写入成功、之后的批次失败
+    memory_store.fail_from_batch = memory_store.batches + 2
+    failed = await _ingest(tmp_path, "二", 6)
+
+    assert not failed["success"]
+    assert failed["removed_chunks"] == 0
+    assert memory_store.docs == before
@@ -0,0 +1,96 @@
+"""
+嵌入微批处理测试
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.core.config import settings
+from app.services.embedding_batcher import EmbeddingMicroBatcher
+from app.services.embedding_cache import CachedEmbeddingFunction
+from app.services.llm_service import LLMService
+from app.services.vector_db import VectorDBService
+
+
+class CountingEmbedding:
+    """记录上游调用次数的嵌入函数"""
+
+    def __init__(self, short: bool = False):
+        self.calls = []
+        self.lock = threading.Lock()
+        self.short = short
+
+    def __call__(self, input):
+        with self.lock:
+            self.calls.append(list(input))
+        time.sleep(0.01)
+        vectors = [[float(len(text)), 1.0] for text in input]
+        return vectors[:-1] if self.short else vectors
+
+
+def test_concurrent_calls_from_pool_threads_share_upstream_calls():
+    inner = CountingEmbedding()
+    batcher = EmbeddingMicroBatcher(inner, max_batch_size=64, max_wait=0.05)
+    inputs = [[f"查询{i}", "公共文本"] for i in range(16)]
+
+    with ThreadPoolExecutor(max_workers=16) as pool:
+        results = list(pool.map(batcher, inputs))
+
+    assert results == [[[float(len(text)), 1.0] for text in texts] for texts in inputs]
+    # 16 个并发调用合并为少量上游请求，相同文本只嵌入一次
+    assert len(inner.calls) < 4
+    assert sum(len(call) for call in inner.calls) == 17
+    assert batcher.get_stats()["requests"] == 16
+
+
+def test_full_batch_is_sent_without_waiting_for_the_window():
+    inner = CountingEmbedding()
+    batcher = EmbeddingMicroBatcher(inner, max_batch_size=4, max_wait=5)
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        list(pool.map(batcher, [[f"文本{i}"] for i in range(4)]))
+
+    assert time.monotonic() - started < 1
+    assert batcher([f"大批量{i}" for i in range(10)])[9] == [float(len("大批量9")), 1.0]
+    assert [len(call) for call in inner.calls[-3:]] == [4, 4, 2]
+
+
+def test_short_upstream_result_fails_every_caller():
+    batcher = EmbeddingMicroBatcher(CountingEmbedding(short=True), max_batch_size=64, max_wait=0.05)
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        futures = [pool.submit(batcher, [text]) for text in ("a", "b")]
+        for future in futures:
+            with pytest.raises(ValueError):
+                future.result(timeout=5)
+
+
+def test_vector_db_embedding_function_batches_below_the_cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(settings, "EMBEDDING_BATCH_ENABLED", True)
+    monkeypatch.setattr(settings, "EMBEDDING_CACHE_ENABLED", True)
+    monkeypatch.setattr(settings, "EMBEDDING_CACHE_DIR", str(tmp_path))
+    service = VectorDBService()
+    inner = CountingEmbedding()
+    try:
+        wrapped = service._wrap_embedding_function(inner, "test/model")
+    finally:
+        service.executor.shutdown(wait=True)
+
+    assert isinstance(wrapped, CachedEmbeddingFunction)
+    assert wrapped.inner is service.embedding_batcher
+    assert service.embedding_batcher.inner is inner
+
+
+@pytest.mark.asyncio
+async def test_embed_text_falls_back_on_short_result(monkeypatch):
+    llm = LLMService()
+
+    async def empty_batch(texts):
+        return []
+
+    monkeypatch.setattr(llm, "_embed_batch", empty_batch)
+    assert await llm.embed_text("文本") == [0.1] * 1024
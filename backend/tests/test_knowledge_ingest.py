@@ -0,0 +1,111 @@
+"""
+知识批量导入测试
+"""
+
+import json
+import socket
+import threading
+import time
+
+import httpx
+import pytest
+import uvicorn
+from fastapi import FastAPI
+
+from app.services.knowledge_ingest import to_record
+
+
+def test_to_record_normalizes_keywords_and_metadata():
+    record = to_record(
+        {"content": " 转账限额说明 ", "keywords": "转账；限额,手机银行", "metadata": {"page": 3, "tags": ["x"]}},
+        source="bulk"
+    )
+
+    assert record["content"] == "转账限额说明"
+    assert record["id"].startswith("doc_")
+    assert json.loads(record["metadata"]["keywords"]) == ["转账", "限额", "手机银行"]
+    assert record["metadata"]["page"] == 3
+    assert "tags" not in record["metadata"]
+
+
+@pytest.mark.parametrize("raw", [
+    {"content": "说明", "metadata": "page=3"},
+    {"content": "说明", "metadata": [1, 2]},
+    {"content": "说明", "keywords": 42},
+    {"content": "说明", "keywords": {"a": 1}},
+    {"content": "   "},
+])
+def test_to_record_rejects_malformed_rows_with_value_error(raw):
+    with pytest.raises(ValueError):
+        to_record(raw, source="bulk")
+
+
+@pytest.fixture
+def bulk_server(monkeypatch):
+    """在后台线程中用 uvicorn 运行知识导入端点，向量库写入替换为内存记录"""
+    from app.api.v1.endpoints import agents
+    from app.services.vector_db import vector_db_service
+
+    written = []
+
+    async def upsert_knowledge_batch(ids, documents, metadatas):
+        written.extend(ids)
+        return {"embed_seconds": 0.001, "upsert_seconds": 0.001}
+
+    async def noop():
+        return None
+
+    monkeypatch.setattr(vector_db_service, "collection", object())
+    monkeypatch.setattr(vector_db_service, "embedding_function", object())
+    monkeypatch.setattr(vector_db_service, "upsert_knowledge_batch", upsert_knowledge_batch)
+    monkeypatch.setattr(vector_db_service, "refresh_document_matrix", noop)
+    monkeypatch.setattr(vector_db_service, "flush_store", noop)
+
+    app = FastAPI()
+    app.include_router(agents.router, prefix="/agents")
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        assert time.monotonic() < deadline, "uvicorn 未能启动"
+        time.sleep(0.02)
+    try:
+        yield f"http://127.0.0.1:{port}", written
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+
+
+def test_bulk_endpoint_reads_the_whole_chunked_body(bulk_server):
+    url, written = bulk_server
+    rows = 2000
+    lines = [
+        json.dumps({"id": f"doc_{i}", "content": f"第{i}条知识" + "说明" * 300}, ensure_ascii=False) + "\n"
+        for i in range(rows)
+    ]
+
+    def body():
+        # 分块发送（Transfer-Encoding: chunked），每块约 64KB
+        chunk = []
+        for line in lines:
+            chunk.append(line)
+            if len(chunk) == 32:
+                yield "".join(chunk).encode("utf-8")
+                chunk = []
+        if chunk:
+            yield "".join(chunk).encode("utf-8")
+
+    response = httpx.post(
+        f"{url}/agents/knowledge/bulk", content=body(),
+        headers={"content-type": "application/x-ndjson"}, timeout=30
+    )
+
+    events = [json.loads(line) for line in response.text.splitlines()]
+    done = events[-1]
+    assert done["type"] == "done" and done["success"]
+    assert done["documents"] == rows and done["skipped"] == 0
+    assert sorted(written) == sorted(f"doc_{i}" for i in range(rows))
@@ -0,0 +1,48 @@
+"""
+BM25 词法索引测试
+"""
+
+import threading
+
+from app.services import lexical_index
+from app.services.lexical_index import BM25Index
+
+
+def test_rebuild_replaces_index_and_keeps_last_duplicate():
+    index = BM25Index()
+    index.add(["old"], ["退货政策"])
+    index.rebuild(["a", "b", "a"], ["发票开具", "物流查询", "发票抬头修改"])
+
+    assert index.get_stats()["documents"] == 2
+    assert index.search("退货", 5) == []
+    results = index.search("发票抬头", 5)
+    assert [r["id"] for r in results] == ["a"]
+    assert results[0]["content"] == "发票抬头修改"
+    assert index.total_length == sum(index.doc_lengths.values())
+
+
+def test_search_during_rebuild_sees_the_old_index(monkeypatch):
+    index = BM25Index()
+    index.add(["old"], ["退货政策"])
+    building = threading.Event()
+    resume = threading.Event()
+    original = lexical_index._index_document
+
+    def slow_index_document(*args):
+        building.set()
+        resume.wait(timeout=5)
+        return original(*args)
+
+    monkeypatch.setattr(lexical_index, "_index_document", slow_index_document)
+    worker = threading.Thread(target=index.rebuild, args=(["new"], ["发票开具"]))
+    worker.start()
+    try:
+        assert building.wait(timeout=5)
+        # 重建进行中：查询不被阻塞，且仍能查到旧文档
+        assert [r["id"] for r in index.search("退货", 5)] == ["old"]
+    finally:
+        resume.set()
+        worker.join(timeout=5)
+
+    assert index.search("退货", 5) == []
+    assert [r["id"] for r in index.search("发票", 5)] == ["new"]
@@ -0,0 +1,127 @@
+"""
+请求合并与对冲统计测试
+"""
+
+import asyncio
+
+import pytest
+
+from app.core.config import settings
+from app.core.deadline import Deadline, DeadlineExceededError, current_deadline, deadline_scope
+from app.services.llm_routing import SingleFlight
+from app.services.llm_service import LLMService
+
+
+@pytest.mark.asyncio
+async def test_shared_call_does_not_inherit_leader_deadline():
+    flight = SingleFlight()
+    seen = []
+
+    async def upstream():
+        seen.append(current_deadline())
+        await asyncio.sleep(0.2)
+        return {"content": "ok"}
+
+    async def leader():
+        with deadline_scope(Deadline(0.05)):
+            return await flight.do("key", upstream)
+
+    async def follower():
+        with deadline_scope(Deadline(1.0)):
+            return await flight.do("key", upstream)
+
+    leader_result, follower_result = await asyncio.gather(leader(), follower(), return_exceptions=True)
+
+    assert seen == [None]
+    assert isinstance(leader_result, DeadlineExceededError)
+    assert follower_result == {"content": "ok"}
+    assert flight.get_stats()["upstream_calls"] == 1
+
+
+@pytest.mark.asyncio
+async def test_shared_call_cancelled_when_all_waiters_leave():
+    flight = SingleFlight()
+    cancelled = asyncio.Event()
+
+    async def upstream():
+        try:
+            await asyncio.sleep(1.0)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    with pytest.raises(asyncio.TimeoutError):
+        await flight.do("key", upstream, timeout=0.05)
+    await asyncio.wait_for(cancelled.wait(), timeout=0.5)
+    assert flight.get_stats()["cancelled_upstream"] == 1
+
+
+@pytest.fixture
+def hedging_service(monkeypatch):
+    """对冲阈值为 50ms 的服务；delays 为各提供商的响应耗时，None 表示立即失败"""
+    monkeypatch.setattr(settings, "LLM_HEDGE_DEFAULT_DELAY", 0.05)
+    monkeypatch.setattr(settings, "LLM_HEDGE_MIN_DELAY", 0.05)
+    llm = LLMService()
+    delays = {}
+
+    async def call_provider(provider, messages, model, temperature, max_tokens, stop=None):
+        if delays[provider] is None:
+            raise RuntimeError(f"{provider} 失败")
+        await asyncio.sleep(delays[provider])
+        return {"content": "ok", "provider": provider}
+
+    monkeypatch.setattr(llm, "_call_provider", call_provider)
+    return llm, delays
+
+
+async def _hedge(llm):
+    result = await llm._hedged_chat("openai", "anthropic", [{"role": "user", "content": "你好"}], "m", 0.7, 100)
+    return result, llm.telemetry.get_stats()["hedging"]["openai->anthropic"]
+
+
+@pytest.mark.asyncio
+async def test_slow_primary_is_counted_as_hedge(hedging_service):
+    llm, delays = hedging_service
+    delays.update(openai=0.5, anthropic=0.01)
+
+    result, stats = await _hedge(llm)
+
+    assert result["provider"] == "anthropic"
+    assert (stats["hedged"], stats["secondary_wins"], stats["failovers"]) == (1, 1, 0)
+
+
+@pytest.mark.asyncio
+async def test_early_primary_failure_is_counted_as_failover(hedging_service):
+    llm, delays = hedging_service
+    delays.update(openai=None, anthropic=0.01)
+
+    result, stats = await _hedge(llm)
+
+    assert result["provider"] == "anthropic"
+    assert (stats["hedged"], stats["secondary_wins"]) == (0, 0)
+    assert (stats["failovers"], stats["failover_successes"]) == (1, 1)
+    assert stats["hedge_rate"] == 0.0
+
+
+@pytest.mark.asyncio
+async def test_coalesced_callers_get_independent_results(monkeypatch):
+    monkeypatch.setattr(settings, "LLM_SINGLEFLIGHT_ENABLED", True)
+    llm = LLMService()
+    upstream_calls = 0
+
+    async def complete(messages, provider, model, temperature, max_tokens, stop=None):
+        nonlocal upstream_calls
+        upstream_calls += 1
+        await asyncio.sleep(0.05)
+        return {"success": True, "content": "ok", "usage": {"total_tokens": 2}}
+
+    monkeypatch.setattr(llm, "_resolve_provider", lambda provider, model: ("openai", model))
+    monkeypatch.setattr(llm, "_complete", complete)
+
+    first, second = await asyncio.gather(*[
+        llm.chat_completion([{"role": "user", "content": "你好"}]) for _ in range(2)
+    ])
+    first["usage"]["total_tokens"] = 0
+
+    assert upstream_calls == 1
+    assert second["usage"] == {"total_tokens": 2}
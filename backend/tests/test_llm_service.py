@@ -0,0 +1,152 @@
+"""
+LLM服务并发测试
+
+通过真实的 AsyncOpenAI 客户端（由 LLMService._init_clients 创建）请求本地的
+OpenAI 兼容桩服务，验证并发调用在网络层重叠执行且不阻塞事件循环。
+"""
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+import openai
+import pytest
+from aiohttp import web
+
+from app.core.config import settings
+from app.services.llm_service import LLMService
+
+LATENCY = 0.2
+
+
+class StubOpenAIServer:
+    """本地 OpenAI 兼容桩服务：固定延迟后回显最后一条消息，并记录最大并发请求数"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.requests = 0
+        self.runner = None
+        self.url = None
+
+    async def chat_completions(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        self.requests += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.in_flight -= 1
+        return web.json_response({
+            "id": f"chatcmpl-{self.requests}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload["model"],
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": payload["messages"][-1]["content"]},
+                "finish_reason": "stop"
+            }],
+            "usage": {"prompt_tokens": 1, "completion_tokens": 1, "total_tokens": 2}
+        })
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.chat_completions)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://127.0.0.1:{port}/v1"
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+
+@pytest.fixture
+def openai_settings(monkeypatch):
+    monkeypatch.setattr(settings, "DEFAULT_LLM_PROVIDER", "openai")
+    monkeypatch.setattr(settings, "OPENAI_API_KEY", "sk-test")
+    monkeypatch.setattr(settings, "ANTHROPIC_API_KEY", None)
+    monkeypatch.setattr(settings, "MINIMAX_API_KEY", None)
+    monkeypatch.setattr(settings, "LLM_HEDGING_ENABLED", False)
+    monkeypatch.setattr(settings, "LLM_MAX_RETRIES", 0)
+    # 同步客户端会阻塞事件循环，同一循环中的桩服务无法响应；短超时让回归尽快失败而不是挂起
+    monkeypatch.setattr(settings, "LLM_REQUEST_TIMEOUT", 2.0)
+    monkeypatch.setattr(settings, "LLM_CONNECT_TIMEOUT", 1.0)
+    return monkeypatch
+
+
+@asynccontextmanager
+async def stub_service(monkeypatch):
+    """启动桩服务，并创建指向它的 LLMService（客户端由 _init_clients 正常创建）"""
+    server = StubOpenAIServer(LATENCY)
+    await server.start()
+    # OpenAI SDK 在未显式传入 base_url 时读取 OPENAI_BASE_URL
+    monkeypatch.setenv("OPENAI_BASE_URL", server.url)
+    llm = LLMService()
+    try:
+        yield llm, server
+    finally:
+        await llm.openai_client.close()
+        await server.stop()
+
+
+async def _max_loop_lag(stop: asyncio.Event, interval: float = 0.01) -> float:
+    """心跳协程：记录事件循环调度延迟的最大值"""
+    lag = 0.0
+    while not stop.is_set():
+        started = time.monotonic()
+        await asyncio.sleep(interval)
+        lag = max(lag, time.monotonic() - started - interval)
+    return lag
+
+
+async def _run_concurrently(llm: LLMService, count: int):
+    stop = asyncio.Event()
+    heartbeat = asyncio.create_task(_max_loop_lag(stop))
+    started = time.monotonic()
+    try:
+        results = await asyncio.gather(*[
+            llm.chat_completion([{"role": "user", "content": f"问题{i}"}], provider="openai")
+            for i in range(count)
+        ])
+    finally:
+        elapsed = time.monotonic() - started
+        stop.set()
+        lag = await heartbeat
+    return results, elapsed, lag
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_finish_in_about_one_latency(openai_settings):
+    count = settings.LLM_ADMISSION_INITIAL_LIMIT
+
+    async with stub_service(openai_settings) as (llm, stub_server):
+        assert isinstance(llm.openai_client, openai.AsyncOpenAI)
+        results, elapsed, lag = await _run_concurrently(llm, count)
+
+    assert all(result["success"] for result in results)
+    assert [result["content"] for result in results] == [f"问题{i}" for i in range(count)]
+    assert stub_server.requests == count
+    assert stub_server.max_in_flight == count
+    # 串行执行需要 count × LATENCY；并发时只比一次延迟多出客户端与建连开销
+    assert elapsed < LATENCY * 4
+    # 阻塞式调用会让事件循环（及同一循环中的桩服务）停顿至少一次上游延迟
+    assert lag < LATENCY
+
+
+@pytest.mark.asyncio
+async def test_calls_do_not_serialize_without_admission_limit(openai_settings):
+    openai_settings.setattr(settings, "LLM_ADMISSION_ENABLED", False)
+
+    async with stub_service(openai_settings) as (llm, stub_server):
+        results, elapsed, lag = await _run_concurrently(llm, 50)
+
+    assert all(result["success"] for result in results)
+    assert stub_server.max_in_flight == 50
+    assert elapsed < LATENCY * 4
+    assert lag < LATENCY
@@ -0,0 +1,25 @@
+"""
+排序融合测试
+"""
+
+from app.services.rank_fusion import reciprocal_rank_fusion
+
+
+def test_nested_fusion_record_is_kept_under_source_contribution():
+    expansions = reciprocal_rank_fusion(
+        {"转账": [{"id": "a", "distance": 0.2}], "汇款": [{"id": "a", "distance": 0.1}]},
+        limit=5
+    )
+    fused = reciprocal_rank_fusion(
+        {"dense": expansions, "lexical": [{"id": "b", "distance": None}, {"id": "a", "distance": None}]},
+        limit=5,
+        weights={"dense": 1.0, "lexical": 0.5}
+    )
+
+    by_id = {item["id"]: item for item in fused}
+    dense = by_id["a"]["fusion"]["contributions"]["dense"]
+    assert set(dense["fusion"]["contributions"]) == {"转账", "汇款"}
+    assert by_id["a"]["fusion"]["contributions"]["lexical"]["rank"] == 2
+    assert by_id["a"]["distance"] == 0.1
+    assert "fusion" not in by_id["b"]["fusion"]["contributions"]["lexical"]
+    assert fused[0]["id"] == "a"
@@ -0,0 +1,28 @@
+"""
+语义回复缓存测试
+"""
+
+import pytest
+
+from app.services.response_cache import SemanticResponseCache
+from app.services.vector_db import vector_db_service
+
+LOAN_POLICY = {"agent_type": "loan", "max_tokens": 800, "temperature": 0.3, "stop": None}
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    monkeypatch.setattr(vector_db_service, "embedding_function", lambda input: [[1.0, 0.0] for _ in input])
+    return SemanticResponseCache()
+
+
+@pytest.mark.asyncio
+async def test_same_knowledge_is_not_shared_across_agents_or_policies(cache):
+    await cache.set("房贷利率是多少", ["doc_1", "doc_2"], {"success": True, "content": "贷款回复"}, LOAN_POLICY)
+
+    assert await cache.get("房贷利率是多少", ["doc_2", "doc_1"], {**LOAN_POLICY, "agent_type": "investment"}) is None
+    assert await cache.get("房贷利率是多少", ["doc_1", "doc_2"], {**LOAN_POLICY, "max_tokens": 200}) is None
+    assert await cache.get("房贷利率是多少", ["doc_1", "doc_2"]) is None
+
+    hit = await cache.get("房贷利率是多少？", ["doc_2", "doc_1"], dict(LOAN_POLICY))
+    assert hit == {"success": True, "content": "贷款回复"}
@@ -0,0 +1,27 @@
+"""
+检索结果缓存测试
+"""
+
+from app.services.search_cache import SearchResultCache, normalize_query
+
+
+def test_normalize_query_ignores_case_spacing_and_trailing_punctuation():
+    assert normalize_query("  How   to Transfer？ ") == normalize_query("how to transfer")
+
+
+def test_cached_results_are_isolated_from_callers():
+    cache = SearchResultCache()
+    key = cache.key("转账限额", 5)
+    results = [{"id": "a", "metadata": {"category": "转账"}, "fusion": {"contributions": {"dense": {"rank": 1}}}}]
+
+    cache.set(key, 1, results)
+    results[0]["metadata"]["category"] = "已修改"
+
+    first = cache.get(key, 1)
+    first[0]["metadata"]["category"] = "再次修改"
+    first[0]["fusion"]["contributions"].clear()
+
+    second = cache.get(key, 1)
+    assert second[0]["metadata"] == {"category": "转账"}
+    assert second[0]["fusion"]["contributions"] == {"dense": {"rank": 1}}
+    assert cache.get(key, 2) is None
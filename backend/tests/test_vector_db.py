@@ -0,0 +1,131 @@
+"""
+向量数据库线程池测试
+"""
+
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from app.core.config import settings
+from app.services.vector_db import VectorDBService
+
+BLOCKING_SECONDS = 0.1
+POOL_SIZE = 4
+
+
+class BlockingCollection:
+    """同步阻塞的模拟集合：查询与嵌入都占用调用线程，并记录最大并发数"""
+
+    backend = "fake"
+    name = "bank_knowledge"
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+
+    def _block(self):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        try:
+            time.sleep(BLOCKING_SECONDS)
+        finally:
+            with self.lock:
+                self.active -= 1
+
+    def embed(self, texts):
+        self._block()
+        return [[1.0, 0.0] for _ in texts]
+
+    def query(self, query_texts=None, n_results=10, where=None, include=None, **kwargs):
+        self._block()
+        return {
+            "ids": [[f"doc_{text}"] for text in query_texts],
+            "documents": [[f"关于{text}的说明"] for text in query_texts],
+            "metadatas": [[{"category": "测试"}] for _ in query_texts],
+            "distances": [[0.1] for _ in query_texts]
+        }
+
+
+async def _max_loop_lag(stop: asyncio.Event, interval: float = 0.01) -> float:
+    """心跳协程：记录事件循环调度延迟的最大值"""
+    lag = 0.0
+    while not stop.is_set():
+        started = time.monotonic()
+        await asyncio.sleep(interval)
+        lag = max(lag, time.monotonic() - started - interval)
+    return lag
+
+
+@pytest.mark.asyncio
+async def test_search_endpoint_runs_in_bounded_pool_without_stalling_loop(monkeypatch):
+    from app.api.v1.endpoints import agents
+
+    monkeypatch.setattr(settings, "VECTOR_DB_THREAD_POOL_SIZE", POOL_SIZE)
+    monkeypatch.setattr(settings, "RETRIEVAL_MODE", "dense")
+    service = VectorDBService()
+    collection = BlockingCollection()
+    service.collection = collection
+    service.embedding_function = collection.embed
+    monkeypatch.setattr(agents, "vector_db_service", service)
+    app = FastAPI()
+    app.include_router(agents.router, prefix="/agents")
+
+    stop = asyncio.Event()
+    heartbeat = asyncio.create_task(_max_loop_lag(stop))
+    started = time.monotonic()
+    try:
+        async with httpx.AsyncClient(app=app, base_url="http://test") as client:
+            responses = await asyncio.gather(
+                *[client.get("/agents/knowledge/search", params={"query": f"查询{i}", "limit": 1}) for i in range(12)],
+                *[service.run_blocking(service.embedding_function, [f"文本{i}"]) for i in range(4)]
+            )
+    finally:
+        elapsed = time.monotonic() - started
+        stop.set()
+        lag = await heartbeat
+        service.executor.shutdown(wait=True)
+
+    searches = responses[:12]
+    assert all(response.status_code == 200 for response in searches)
+    assert [response.json()["data"]["results"][0]["id"] for response in searches] == [f"doc_查询{i}" for i in range(12)]
+    # 线程池有界：同时执行的阻塞调用不超过池大小，16 个调用分 4 轮完成
+    assert collection.max_active == POOL_SIZE
+    assert service.get_pool_stats()["max_in_flight"] == 16
+    assert elapsed >= 16 / POOL_SIZE * BLOCKING_SECONDS * 0.9
+    # 阻塞调用期间事件循环仍能按时调度其他协程（包括处理其他请求）
+    assert lag < BLOCKING_SECONDS / 2
+
+
+def test_hybrid_cutoff_keeps_lexical_only_exact_code(monkeypatch):
+    monkeypatch.setattr(settings, "RETRIEVAL_MIN_RELATIVE_SCORE", 0.6)
+    monkeypatch.setattr(settings, "RETRIEVAL_DENSE_MAX_DISTANCE", 0.0)
+    service = VectorDBService()
+    try:
+        dense = [
+            {"id": f"d{i}", "content": f"贷款说明{i}", "metadata": {}, "distance": 0.2 + 0.02 * i}
+            for i in range(10)
+        ]
+        dense.append({"id": "far", "content": "无关内容", "metadata": {}, "distance": 0.9})
+        lexical = [
+            {"id": "d0", "content": "贷款说明0", "metadata": {}, "distance": 0.0, "bm25": 6.0},
+            {"id": "LOAN001", "content": "LOAN001 个人住房贷款", "metadata": {}, "distance": 0.5, "bm25": 5.5},
+            {"id": "weak", "content": "贷款", "metadata": {}, "distance": 0.5, "bm25": 0.5},
+        ]
+
+        ids = [item["id"] for item in service._fuse_hybrid("LOAN001 贷款", 20, dense, lexical)]
+    finally:
+        service.executor.shutdown(wait=True)
+
+    # 第一名两路都命中时，只被词法检索召回的精确代码仍应保留
+    assert ids[0] == "d0"
+    assert "LOAN001" in ids
+    assert {f"d{i}" for i in range(10)} <= set(ids)
+    # 在各自检索路中得分都远低于第一名的结果被过滤
+    assert "far" not in ids and "weak" not in ids
+    assert service.retrieval_stats["cut_by_score"] == 2
@@ -0,0 +1,180 @@
+"""
+本地向量存储测试
+"""
+
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.services.vector_store import LocalVectorStore
+
+
+@pytest.fixture
+def small_ivf(monkeypatch):
+    monkeypatch.setattr(settings, "LOCAL_VECTOR_STORE_IVF_MIN_DOCS", 200)
+    monkeypatch.setattr(settings, "LOCAL_VECTOR_STORE_IVF_NPROBE", 64)
+    monkeypatch.setattr(settings, "LOCAL_VECTOR_STORE_FLUSH_EVERY", 100000)
+
+
+def _vectors(n, dim=16, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+
+
+def _add(store, start, vectors):
+    ids = [f"doc_{start + i}" for i in range(len(vectors))]
+    store.upsert(ids, [f"内容{start + i}" for i in range(len(vectors))],
+                 [{"n": start + i} for i in range(len(vectors))], vectors.tolist())
+
+
+def test_incremental_writes_match_exact_search(tmp_path, small_ivf):
+    store = LocalVectorStore(tmp_path, "kb", None)
+    vectors = _vectors(1500)
+    for start in range(0, len(vectors), 64):
+        _add(store, start, vectors[start:start + 64])
+
+    assert store.count() == 1500
+    assert store.get_stats()["index"].startswith("ivf")
+    assert store.get_stats()["capacity"] >= 1500
+
+    # 覆盖已有文档：新向量应被检索到，且文档数不变
+    store.upsert(["doc_7"], ["新内容"], [{"n": 7}], [vectors[900].tolist()])
+    assert store.count() == 1500
+    result = store.query(query_embeddings=[vectors[900].tolist()], n_results=2)
+    assert set(result["ids"][0]) == {"doc_7", "doc_900"}
+
+    # nprobe 覆盖全部簇时，IVF结果与精确扫描一致
+    query = _vectors(1, seed=1)[0]
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    normalized[7] = normalized[900]
+    expected = {f"doc_{i}" for i in np.argsort(-(normalized @ (query / np.linalg.norm(query))))[:5]}
+    assert set(store.query(query_embeddings=[query.tolist()], n_results=5)["ids"][0]) == expected
+
+
+def test_overwrite_leaves_reader_snapshot_unchanged(tmp_path, small_ivf):
+    store = LocalVectorStore(tmp_path, "kb", None)
+    vectors = _vectors(300)
+    _add(store, 0, vectors)
+    ids, documents, metadatas, _, snapshot_vectors, _ = store.state
+    row = snapshot_vectors[7].copy()
+
+    store.upsert(["doc_7", "doc_new"], ["新内容", "新增"], [{"n": -1}, {"n": 300}], _vectors(2, seed=2).tolist())
+
+    # 读线程持有的旧快照不会看到部分更新
+    assert documents[7] == "内容7" and metadatas[7] == {"n": 7}
+    assert np.array_equal(snapshot_vectors[7], row)
+    assert len(snapshot_vectors) == 300
+    assert store.get(ids=["doc_7"])["documents"] == ["新内容"]
+    assert store.count() == 301
+
+
+def test_flush_persists_and_reloads(tmp_path, small_ivf):
+    store = LocalVectorStore(tmp_path, "kb", None)
+    _add(store, 0, _vectors(300))
+    store.delete(["doc_0", "doc_1"])
+    assert not (tmp_path / "kb" / "store.npz").exists()
+
+    store.flush()
+    reloaded = LocalVectorStore(tmp_path, "kb", None)
+    assert reloaded.count() == 298
+    assert reloaded.get(ids=["doc_0", "doc_5"])["metadatas"] == [{"n": 5}]
+    assert reloaded.get(where={"n": 299}, include=[])["ids"] == ["doc_299"]
+    assert not (tmp_path / "kb" / "store.tmp").exists()
+
+
+def test_add_rejects_existing_ids(tmp_path, small_ivf):
+    store = LocalVectorStore(tmp_path, "kb", None)
+    _add(store, 0, _vectors(3))
+    with pytest.raises(ValueError):
+        store.add(["doc_1"], ["重复"], None, _vectors(1).tolist())
+    assert store.count() == 3
+
+
+class _UnitEmbedding:
+    """把文本映射为固定单位向量的嵌入函数"""
+
+    VECTORS = {"a": [1.0, 0.0], "b": [0.6, 0.8], "c": [0.0, 1.0]}
+
+    def __call__(self, input):
+        return [self.VECTORS[text] for text in input]
+
+
+@pytest.mark.parametrize("space", [None, "l2", "cosine"])
+def test_chroma_distances_are_cosine_for_any_space(space):
+    chromadb = pytest.importorskip("chromadb")
+    from app.services.vector_store import ChromaVectorStore
+
+    client = chromadb.EphemeralClient()
+    name = f"kb_{space or 'default'}"
+    if space is not None:
+        # 模拟以旧配置创建的既有集合
+        client.create_collection(name=name, embedding_function=_UnitEmbedding(), metadata={"hnsw:space": space})
+    store = ChromaVectorStore(client, name, _UnitEmbedding())
+    store.add(["a", "b", "c"], ["a", "b", "c"])
+
+    result = store.query(query_texts=["a"], n_results=3)
+
+    assert result["ids"][0] == ["a", "b", "c"]
+    assert result["distances"][0] == pytest.approx([0.0, 0.4, 1.0], abs=1e-5)
+
+
+@pytest.fixture
+def chroma_server(tmp_path):
+    """在子进程中启动本地 Chroma 服务端，返回端口"""
+    pytest.importorskip("chromadb")
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    env = {
+        **os.environ,
+        "IS_PERSISTENT": "1",
+        "PERSIST_DIRECTORY": str(tmp_path / "chroma"),
+        "ANONYMIZED_TELEMETRY": "False"
+    }
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "chromadb.app:app", "--port", str(port), "--log-level", "warning"],
+        cwd=tmp_path, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                with socket.create_connection(("127.0.0.1", port), timeout=0.2):
+                    break
+            except OSError:
+                if process.poll() is not None or time.monotonic() > deadline:
+                    pytest.skip("本地 Chroma 服务端无法启动")
+                time.sleep(0.2)
+        yield port
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def test_chroma_http_client_creates_and_resets_collection(chroma_server):
+    import chromadb
+    from chromadb.config import Settings
+    from app.services.vector_store import ChromaVectorStore
+
+    client = chromadb.HttpClient(
+        host="127.0.0.1", port=chroma_server, settings=Settings(anonymized_telemetry=False)
+    )
+    # 全新部署：集合不存在时应直接创建（HttpClient 的 get_collection 抛出普通 Exception）
+    store = ChromaVectorStore(client, "knowledge_base", _UnitEmbedding())
+    assert store.space == "cosine"
+    store.add(["a", "b", "c"], ["a", "b", "c"])
+    assert store.query(query_texts=["a"], n_results=3)["distances"][0] == pytest.approx([0.0, 0.4, 1.0], abs=1e-5)
+
+    # 重建：删除后重新打开，得到空的余弦空间集合
+    store.reset(_UnitEmbedding())
+    assert store.count() == 0
+    assert store.space == "cosine"
+
+    # 以旧配置创建的既有集合保留原距离空间
+    client.create_collection(name="legacy_kb", embedding_function=_UnitEmbedding(), metadata={"hnsw:space": "l2"})
+    assert ChromaVectorStore(client, "legacy_kb", _UnitEmbedding()).space == "l2"
@@ -220,6 +220,6 @@ export interface LoanApplicationRequest {
 
 // WebSocket消息类型
 export interface WebSocketMessage {
-  type: 'chat_response' | 'error' | 'typing' | 'connected' | 'disconnected';
+  type: 'chat_response' | 'chat_delta' | 'chat_done' | 'error' | 'typing' | 'connected' | 'disconnected';
   data: any;
 }
\ No newline at end of file